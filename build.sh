@@ -11,4 +11,7 @@ pip install -r requirements.txt
 python manage.py collectstatic --no-input
 
 # 3. Run database migrations
-python manage.py migrate
\ No newline at end of file
+python manage.py migrate
+
+# 4. Fill in ledger postings for older transactions (a no-op once done)
+python manage.py backfill_postings
@@ -1,3 +1,24 @@
 from django.contrib import admin
+from django.utils import timezone
+from .models import OutboundEmail, OutboundAttachment
 
-# Register your models here.
+class OutboundAttachmentInline(admin.TabularInline):
+    model = OutboundAttachment
+    fields = ('filename', 'mimetype', 'builder', 'builder_args')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject',)
+    readonly_fields = ('attempts', 'last_error', 'created_by', 'created_at', 'sent_at')
+    inlines = [OutboundAttachmentInline]
+    actions = ['retry_now']
+
+    @admin.action(description="Retry selected emails now")
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='SENT').update(status='PENDING', next_attempt_at=timezone.now())
+        self.message_user(request, f"{updated} email(s) queued for retry.")
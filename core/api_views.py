@@ -0,0 +1,23 @@
+from rest_framework import viewsets
+from rest_framework.permissions import IsAuthenticated
+from django_filters.rest_framework import DjangoFilterBackend
+from .models import OutboundEmail
+from .serializers import OutboundEmailSerializer
+
+class OutboundEmailViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Delivery status of queued emails, for polling the delivery id
+    returned by the email / print actions.
+    URL: /api/v1/outbox/{id}/
+    """
+    queryset = OutboundEmail.objects.all()
+    serializer_class = OutboundEmailSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['status']
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.is_staff:
+            return self.queryset
+        return self.queryset.filter(created_by=user)
@@ -0,0 +1,31 @@
+# core/management/commands/send_outbox.py
+#
+# Delivers queued OutboundEmails (see core/outbox.py). Run it from cron, or
+# as a long-lived worker with --loop. Several workers can run at once.
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core import outbox
+
+
+class Command(BaseCommand):
+    help = "Sends due emails from the outbox, one SMTP connection per batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help="Emails per SMTP connection.")
+        parser.add_argument('--loop', action='store_true', help="Keep polling instead of exiting when the outbox is empty.")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds to wait between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = outbox.send_due(options['batch_size'])
+            if sent or failed:
+                style = self.style.WARNING if failed else self.style.SUCCESS
+                self.stdout.write(style(f"Sent {sent}, failed {failed}."))
+                continue  # There may be more due right away.
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
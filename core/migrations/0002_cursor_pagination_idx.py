@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='outboundemail',
+            index=models.Index(fields=['created_at', 'id'], name='outbox_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_cursor_pagination_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundemail',
+            name='details',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,3 +1,69 @@
+# core/models.py
+#
+# Cross-app infrastructure models.
+
 from django.db import models
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+class OutboundEmail(models.Model):
+    """
+    An email waiting in (or delivered from) the outbox.
+    Views write a row in their own transaction and return at once;
+    the send_outbox command delivers it (see core/outbox.py).
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255, blank=True)  # Blank = DEFAULT_FROM_EMAIL
+    to = models.JSONField(default=list)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    # When a PENDING email may next be tried. Also pushed forward while a
+    # worker is sending it, so a crashed worker's batch is retried later.
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    # How the email's content was produced, for whoever polls the delivery
+    # (e.g. a batch print's page count and per-sheet render timings).
+    details = models.JSONField(default=dict, blank=True)
+
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+            # The API's cursor pages: -created_at, ties broken on id.
+            models.Index(fields=['created_at', 'id'], name='outbox_created_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.subject} ({self.get_status_display()})"
+
+
+class OutboundAttachment(models.Model):
+    """
+    A file attached to an OutboundEmail. Either the bytes are stored in
+    `content`, or `builder` names a function (dotted path) that is called
+    with `builder_args` at send time to produce them, so expensive files
+    like PDFs are not built inside the HTTP request. A builder may return
+    (bytes, details) to add to the email's `details`.
+    """
+    email = models.ForeignKey(OutboundEmail, on_delete=models.CASCADE, related_name='attachments')
+    filename = models.CharField(max_length=255)
+    mimetype = models.CharField(max_length=100, default='application/octet-stream')
+    content = models.BinaryField(null=True, blank=True)
+    builder = models.CharField(max_length=255, blank=True)
+    builder_args = models.JSONField(default=list, blank=True)
 
-# Create your models here.
+    def __str__(self):
+        return self.filename
@@ -0,0 +1,152 @@
+# core/outbox.py
+#
+# Transactional email outbox.
+# queue_email() stores a message in the caller's transaction, so it is only
+# sent if the action that produced it commits. send_due() delivers queued
+# messages in batches over one SMTP connection each, with retries and
+# exponential backoff. Run it with `manage.py send_outbox`.
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import OutboundEmail, OutboundAttachment
+
+MAX_ATTEMPTS = 6
+# How long a claimed email is hidden from other workers while it is sent.
+CLAIM_LEASE = timedelta(minutes=10)
+
+
+def queue_email(subject, body, to, attachments=(), from_email='', user=None, details=None):
+    """
+    Adds an email to the outbox and returns the OutboundEmail; its pk is
+    the delivery id clients poll. `attachments` are unsaved
+    OutboundAttachment instances (with `content` or a `builder`).
+    `details` are shown to clients polling the delivery.
+    """
+    attachments = list(attachments)
+    with transaction.atomic():
+        email = OutboundEmail.objects.create(
+            subject=subject,
+            body=body,
+            to=list(to),
+            from_email=from_email,
+            created_by=user,
+            details=details or {},
+        )
+        for attachment in attachments:
+            attachment.email = email
+        OutboundAttachment.objects.bulk_create(attachments)
+    return email
+
+
+def backoff(attempts):
+    """
+    Delay before retry number `attempts`: 1, 2, 4, 8... minutes, capped at an hour.
+    """
+    return timedelta(minutes=min(2 ** (attempts - 1), 60))
+
+
+def claim_batch(limit, ids=None):
+    """
+    Claims up to `limit` due emails for this worker, only among `ids` if
+    given. Rows locked by another worker are skipped, and claimed rows get
+    a lease, so parallel workers never send the same email twice.
+    """
+    now = timezone.now()
+    due = OutboundEmail.objects.filter(status='PENDING', next_attempt_at__lte=now)
+    if ids is not None:
+        due = due.filter(pk__in=ids)
+    with transaction.atomic():
+        ids = list(
+            due.select_for_update(skip_locked=True)
+            .order_by('next_attempt_at')
+            .values_list('pk', flat=True)[:limit]
+        )
+        OutboundEmail.objects.filter(pk__in=ids).update(
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + CLAIM_LEASE,
+        )
+    return list(
+        OutboundEmail.objects.filter(pk__in=ids)
+        .order_by('next_attempt_at', 'pk').prefetch_related('attachments')
+    )
+
+
+def build_message(email, connection):
+    """
+    Turns an OutboundEmail into an EmailMessage, building any deferred
+    attachments and saving the details their builders report.
+    """
+    message = EmailMessage(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email or settings.DEFAULT_FROM_EMAIL,
+        to=email.to,
+        connection=connection,
+    )
+    for attachment in email.attachments.all():
+        if attachment.builder:
+            content = import_string(attachment.builder)(*attachment.builder_args)
+            if isinstance(content, tuple):
+                content, details = content
+                email.details = {**email.details, **details}
+                OutboundEmail.objects.filter(pk=email.pk).update(details=email.details)
+        else:
+            content = bytes(attachment.content)
+        message.attach(attachment.filename, content, attachment.mimetype)
+    return message
+
+
+def send_due(batch_size=50, ids=None):
+    """
+    Sends one batch of due emails over a single SMTP connection, only
+    among `ids` if given. Returns (sent, failed) counts for the batch.
+    """
+    emails = claim_batch(batch_size, ids)
+    if not emails:
+        return 0, 0
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        for email in emails:
+            _record_failure(email, e)
+        return 0, len(emails)
+
+    sent = failed = 0
+    try:
+        for email in emails:
+            try:
+                build_message(email, connection).send()
+            except Exception as e:
+                failed += 1
+                _record_failure(email, e)
+                # The server may have dropped us; carry on over a fresh connection.
+                connection.close()
+                try:
+                    connection.open()
+                except Exception:
+                    pass  # The next send reconnects, or fails and is recorded, by itself.
+            else:
+                sent += 1
+                OutboundEmail.objects.filter(pk=email.pk).update(
+                    status='SENT', sent_at=timezone.now(), last_error=''
+                )
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def _record_failure(email, error):
+    if email.attempts >= MAX_ATTEMPTS:
+        changes = {'status': 'FAILED'}
+    else:
+        changes = {'next_attempt_at': timezone.now() + backoff(email.attempts)}
+    OutboundEmail.objects.filter(pk=email.pk).update(last_error=f"{type(error).__name__}: {error}", **changes)
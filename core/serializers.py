@@ -0,0 +1,7 @@
+from rest_framework import serializers
+from .models import OutboundEmail
+
+class OutboundEmailSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OutboundEmail
+        fields = ['id', 'subject', 'to', 'status', 'attempts', 'next_attempt_at', 'last_error', 'details', 'created_at', 'sent_at']
@@ -1,3 +1,64 @@
+from datetime import timedelta
+from smtplib import SMTPException
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core import mail
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from . import outbox
+from .models import OutboundEmail
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('desk', password='secret', is_staff=True)
+
+    def queue(self, subject='Checkout sheet'):
+        return outbox.queue_email(subject, 'Attached.', ['crew@example.com'], user=self.user)
+
+    def test_sends_due_emails_in_one_batch(self):
+        first, second = self.queue(), self.queue()
+        later = self.queue()
+        OutboundEmail.objects.filter(pk=later.pk).update(next_attempt_at=timezone.now() + timedelta(hours=1))
+
+        self.assertEqual(outbox.send_due(), (2, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            set(OutboundEmail.objects.filter(status='SENT').values_list('pk', flat=True)), {first.pk, second.pk}
+        )
+
+    def test_claimed_emails_are_leased_from_other_workers(self):
+        email = self.queue()
+        self.assertEqual([claimed.pk for claimed in outbox.claim_batch(10)], [email.pk])
+        self.assertEqual(outbox.claim_batch(10), [])
+
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt_at, timezone.now() + outbox.CLAIM_LEASE - timedelta(minutes=1))
+
+    def test_failures_back_off_then_give_up(self):
+        email = self.queue()
+        with mock.patch('core.outbox.EmailMessage.send', side_effect=SMTPException('mailbox unavailable')):
+            for attempt in range(1, outbox.MAX_ATTEMPTS + 1):
+                before = timezone.now()
+                self.assertEqual(outbox.send_due(), (0, 1))
+                email.refresh_from_db()
+                if attempt < outbox.MAX_ATTEMPTS:
+                    self.assertEqual(email.status, 'PENDING')
+                    self.assertGreaterEqual(email.next_attempt_at, before + outbox.backoff(attempt))
+                    OutboundEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+
+        self.assertEqual((email.status, email.attempts), ('FAILED', outbox.MAX_ATTEMPTS))
+        self.assertIn('mailbox unavailable', email.last_error)
+        self.assertEqual(outbox.send_due(), (0, 0))
+
+    def test_api_filters_by_status(self):
+        sent, pending = self.queue('Sent'), self.queue('Pending')
+        OutboundEmail.objects.filter(pk=sent.pk).update(status='SENT')
+        api = APIClient()
+        api.force_authenticate(self.user)
 
-# Create your tests here.
+        response = api.get('/api/v1/outbox/', {'status': 'PENDING'})
+        self.assertEqual([email['id'] for email in response.json()['results']], [pending.pk])
@@ -4,7 +4,8 @@
 from django.contrib import admin
 from .models import (
     EquipmentCategory, EquipmentItem, 
-    EquipmentRequest, RequestedItem, CheckoutLog
+    EquipmentRequest, RequestedItem, CheckoutLog, EquipmentStock,
+    EquipmentUsageDaily, EquipmentUnit
 )
 
 # ... (EquipmentCategoryAdmin, EquipmentItemAdmin, RequestedItemInline, EquipmentRequestAdmin, RequestedItemAdmin are unchanged) ...
@@ -12,12 +13,20 @@ from .models import (
 class EquipmentCategoryAdmin(admin.ModelAdmin):
     list_display = ('name',)
     search_fields = ('name',)
+class EquipmentUnitInline(admin.TabularInline):
+    model = EquipmentUnit
+    fields = ('tag', 'serial_number', 'is_active')
+    extra = 0
 @admin.register(EquipmentItem)
 class EquipmentItemAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category', 'total_quantity', 'available_quantity', 'get_damaged_quantity')
-    list_filter = ('category',)
+    list_display = ('name', 'category', 'total_quantity', 'is_serialized', 'available_quantity', 'get_damaged_quantity')
+    list_filter = ('category', 'is_serialized')
     search_fields = ('name',)
     readonly_fields = ('available_quantity', 'get_damaged_quantity')
+    inlines = [EquipmentUnitInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_availability()
 class RequestedItemInline(admin.TabularInline):
     model = RequestedItem
     autocomplete_fields = ['item']
@@ -41,13 +50,53 @@ class RequestedItemAdmin(admin.ModelAdmin):
 class CheckoutLogAdmin(admin.ModelAdmin):
     list_display = (
         'request', 
-        'item',  # 'quantity' is removed
+        'item',
+        'quantity',
+        'unit',
         'checked_out_by', 
         'checked_out_at', 
         'checked_in_by', 
         'checked_in_at', 
-        'return_status'
+        'return_status',
+        'repaired_at'
     )
-    list_filter = ('return_status', 'checked_out_at', 'checked_in_at')
-    autocomplete_fields = ['request', 'item', 'checked_out_by', 'checked_in_by']
-    search_fields = ('item__name', 'request__project__company_name')
\ No newline at end of file
+    list_filter = ('return_status', 'checked_out_at', 'checked_in_at', 'repaired_at')
+    autocomplete_fields = ['request', 'item', 'unit', 'checked_out_by', 'checked_in_by', 'repaired_by']
+    search_fields = ('item__name', 'unit__tag', 'request__project__company_name')
+
+@admin.register(EquipmentUnit)
+class EquipmentUnitAdmin(admin.ModelAdmin):
+    list_display = ('tag', 'item', 'serial_number', 'is_active', 'created_at')
+    list_filter = ('is_active', 'item__category')
+    autocomplete_fields = ['item']
+    search_fields = ('tag', 'serial_number', 'item__name')
+
+@admin.register(EquipmentStock)
+class EquipmentStockAdmin(admin.ModelAdmin):
+    """
+    Read-only view of the stock counters.
+    Use `manage.py reconcile_stock` to rebuild them from the logs.
+    """
+    list_display = ('item', 'available', 'reserved', 'out', 'damaged', 'updated_at')
+    search_fields = ('item__name',)
+    readonly_fields = ('item', 'reserved', 'out', 'damaged', 'available', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(EquipmentUsageDaily)
+class EquipmentUsageDailyAdmin(admin.ModelAdmin):
+    """
+    Read-only view of the daily usage rollups.
+    Use `manage.py rollup_utilization` to fill them.
+    """
+    list_display = ('day', 'item', 'units_out', 'checkouts', 'units_returned', 'units_damaged')
+    list_filter = ('item__category',)
+    date_hierarchy = 'day'
+    search_fields = ('item__name',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -1,47 +1,234 @@
+import time
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from django_filters.rest_framework import DjangoFilterBackend
 from django.db import transaction
+from django.db.models import Prefetch, F
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.shortcuts import get_object_or_404, render
 from django.http import HttpResponse
 from django.conf import settings
-from django.template.loader import render_to_string
-from django.core.mail import EmailMessage
-from weasyprint import HTML
 
-from .models import EquipmentItem, EquipmentRequest, RequestedItem, CheckoutLog
-from .serializers import EquipmentItemSerializer, EquipmentRequestSerializer, CheckoutLogSerializer
+from .models import EquipmentItem, EquipmentRequest, RequestedItem, CheckoutLog, RequestStatusCount, EquipmentUnit
+from . import workflow, utilization, scanning, live
+from .filters import CatalogSearchFilter
+from .pdf import render_checkout_sheet, queued_checkout_sheet, queue_batch_print
+from core.outbox import queue_email
+from .serializers import EquipmentItemSerializer, EquipmentRequestSerializer, CheckoutLogSerializer, EquipmentUnitSerializer
+from projects.models import Project
 
 class EquipmentItemViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = EquipmentItem.objects.all()
+    queryset = EquipmentItem.objects.select_related('category').order_by('name')
     serializer_class = EquipmentItemSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, CatalogSearchFilter]
     filterset_fields = ['category']
-    search_fields = ['name']
+
+    def get_queryset(self):
+        """
+        Availability is what is free of every reservation and checkout, or,
+        with ?project=<id>, what is free within that project's dates.
+        """
+        project_id = self.request.query_params.get('project')
+        if not project_id:
+            return super().get_queryset().with_availability()
+        project = Project.objects.filter(pk=project_id).first() if project_id.isdigit() else None
+        if project is None:
+            raise ValidationError({'project': 'Project not found'})
+        return super().get_queryset().with_availability(project.date_from, project.date_to)
+
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        """
+        How many of each item are free between two dates, in one query.
+        URL: /api/v1/equipment/items/availability/?from=2025-01-10&to=2025-01-12
+        Optional: &item=<id> for a single item, &category=<id>.
+        """
+        try:
+            start = parse_date(request.query_params.get('from', ''))
+            end = parse_date(request.query_params.get('to', ''))
+        except ValueError:
+            start = end = None
+        if not start or not end:
+            return Response({'error': "'from' and 'to' must be dates (YYYY-MM-DD)."}, status=status.HTTP_400_BAD_REQUEST)
+        if start > end:
+            return Response({'error': "'from' must not be after 'to'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            item_id = int(request.query_params.get('item') or 0)
+            category_id = int(request.query_params.get('category') or 0)
+        except ValueError:
+            return Response({'error': "'item' and 'category' must be ids."}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = EquipmentItem.objects.with_window_availability(start, end)
+        if item_id:
+            queryset = queryset.filter(pk=item_id)
+        if category_id:
+            queryset = queryset.filter(category_id=category_id)
+
+        items = queryset.order_by('category__name', 'name').values(
+            'id', 'name', 'category', 'total_quantity',
+            committed_quantity=F('window_committed'),
+            available_quantity=F('window_available'),
+        )
+        return Response({'from': start, 'to': end, 'items': list(items)})
+
+    @action(detail=False, methods=['get'], url_path='availability-snapshot')
+    def availability_snapshot(self, request):
+        """
+        Every item's available quantity, with a strong ETag: on the shelf
+        right now, or within a project's dates with ?project=<id>.
+        Send it back in If-None-Match to get a 304 while nothing has changed.
+        URL: /api/v1/equipment/items/availability-snapshot/
+        """
+        return live.snapshot_response(request)
+
+    @action(detail=False, methods=['get'])
+    def utilization(self, request):
+        """
+        Per-item usage between two dates, read from the daily rollups
+        (see the rollup_utilization command).
+        URL: /api/v1/equipment/items/utilization/?from=2025-01-01&to=2025-03-31
+        Optional: &item=<id> for a single item, &category=<id>.
+        """
+        try:
+            start = parse_date(request.query_params.get('from', ''))
+            end = parse_date(request.query_params.get('to', ''))
+        except ValueError:
+            start = end = None
+        if not start or not end:
+            return Response({'error': "'from' and 'to' must be dates (YYYY-MM-DD)."}, status=status.HTTP_400_BAD_REQUEST)
+        if start > end:
+            return Response({'error': "'from' must not be after 'to'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            item_id = int(request.query_params.get('item') or 0)
+            category_id = int(request.query_params.get('category') or 0)
+        except ValueError:
+            return Response({'error': "'item' and 'category' must be ids."}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = EquipmentItem.objects.with_utilization(start, end)
+        if item_id:
+            queryset = queryset.filter(pk=item_id)
+        if category_id:
+            queryset = queryset.filter(category_id=category_id)
+
+        days = (end - start).days + 1
+        items = []
+        for item in queryset.order_by('category__name', 'name').values(
+            'id', 'name', 'category', 'total_quantity',
+            'unit_days', 'checkouts', 'units_returned', 'units_damaged',
+        ):
+            capacity = item['total_quantity'] * days
+            item['utilization'] = round(item['unit_days'] / capacity, 4) if capacity else None
+            item['checkouts_per_month'] = round(item['checkouts'] * 30 / days, 2)
+            item['damage_rate'] = (
+                round(item['units_damaged'] / item['units_returned'], 4) if item['units_returned'] else None
+            )
+            items.append(item)
+        return Response({
+            'from': start,
+            'to': end,
+            'rolled_up_through': utilization.rolled_up_through(),
+            'items': items,
+        })
+
+class EquipmentUnitViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Tagged units, looked up by tag: /api/v1/equipment/units/{tag}/
+    answers "who has this?" with the unit's open checkout, if any.
+    """
+    queryset = EquipmentUnit.objects.select_related('item').prefetch_related(
+        Prefetch(
+            'logs',
+            queryset=CheckoutLog.objects.filter(checked_in_at__isnull=True).select_related('request__project', 'checked_out_by'),
+            to_attr='open_logs'
+        )
+    ).order_by('tag')
+    serializer_class = EquipmentUnitSerializer
+    permission_classes = [IsAdminUser]
+    lookup_field = 'tag'
+    lookup_value_regex = '[^/]+'
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['item', 'is_active']
 
 class RepairLogViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = CheckoutLog.objects.filter(return_status__in=['DAMAGED', 'LOST'])
+    queryset = CheckoutLog.objects.needs_repair().order_by('checked_in_at')
     serializer_class = CheckoutLogSerializer
     permission_classes = [IsAdminUser]
 
     @action(detail=True, methods=['post'])
     def repair(self, request, pk=None):
+        """
+        Body (optional): {"quantity": 2}. Defaults to every unit on the log.
+        """
         log = self.get_object()
-        log.delete() 
+        try:
+            quantity = request.data.get('quantity')
+            workflow.repair(log, int(quantity) if quantity is not None else None, user=request.user)
+        except (TypeError, ValueError):
+            return Response({'error': "'quantity' must be a number."}, status=400)
+        except workflow.WorkflowError as e:
+            return Response({'error': str(e)}, status=400)
         return Response({'status': 'Item repaired'})
 
+def _parse_checkin_entries(entries):
+    """
+    Splits the check-in payload into the `logs` and `items` mappings
+    workflow.checkin() takes. Raises ValueError on a malformed entry.
+    """
+    logs, items = {}, {}
+    for entry in entries:
+        if 'log_id' in entry:
+            target = logs.setdefault(int(entry['log_id']), {})
+        elif 'item_id' in entry:
+            target = items.setdefault(int(entry['item_id']), {})
+        else:
+            raise ValueError("each entry needs a 'log_id' or an 'item_id'")
+
+        if 'status' in entry:
+            quantity = entry.get('quantity')
+            counts = {entry['status']: None if quantity is None else int(quantity)}
+        else:
+            counts = {
+                status_name: int(entry[status_name])
+                for status_name in workflow.RETURN_STATUSES if status_name in entry
+            }
+        for status_name, quantity in counts.items():
+            if status_name not in target:
+                target[status_name] = quantity
+            elif quantity is None or target[status_name] is None:
+                raise ValueError(f"'{status_name}' without a quantity can't be combined with another '{status_name}' entry")
+            else:
+                target[status_name] += quantity
+    return logs, items
+
 class EquipmentRequestViewSet(viewsets.ModelViewSet):
     queryset = EquipmentRequest.objects.all().order_by('-created_at')
     serializer_class = EquipmentRequestSerializer
     permission_classes = [IsAuthenticated]
+    # Actions that never serialize the request, so skip the nested prefetches.
+    transition_actions = {'approve', 'reject', 'checkout', 'checkin', 'scan', 'email_pdf', 'hpeprint', 'batch_print'}
 
     def get_queryset(self):
         user = self.request.user
+        queryset = EquipmentRequest.objects.order_by('-created_at')
+        if self.action not in self.transition_actions:
+            # The nested item serializers read availability, so load it for
+            # every item in one query instead of per line / per log.
+            items_with_stock = EquipmentItem.objects.with_availability().select_related('category')
+            queryset = queryset.prefetch_related(
+                Prefetch('items__item', queryset=items_with_stock),
+                Prefetch('logs__item', queryset=items_with_stock),
+            )
         if user.is_staff:
-            return EquipmentRequest.objects.all().order_by('-created_at')
-        return EquipmentRequest.objects.filter(requested_by=user).order_by('-created_at')
+            return queryset
+        return queryset.filter(requested_by=user)
 
     def create(self, request, *args, **kwargs):
         project_id = request.data.get('project_id')
@@ -50,44 +237,73 @@ class EquipmentRequestViewSet(viewsets.ModelViewSet):
         if not items_data:
             return Response({'error': 'No items provided'}, status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            lines = [
+                (int(item_data['item_id']), int(item_data.get('quantity', 1)))
+                for item_data in items_data
+            ]
+        except (KeyError, TypeError, ValueError):
+            return Response({'error': 'Each item needs an item_id and a whole-number quantity.'}, status=status.HTTP_400_BAD_REQUEST)
+        if any(qty < 1 for _, qty in lines):
+            return Response({'error': 'Quantities must be at least 1.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        project = None
+        if project_id:
+            project = Project.objects.filter(pk=project_id).first()
+            if project is None:
+                return Response({'error': 'Project not found'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # One query validates every line (an item listed twice is checked
+        # against its combined quantity), then one INSERT writes them all.
+        try:
+            quantities = workflow.check_stock(project, lines)
+        except workflow.InsufficientStock as e:
+            return Response(
+                {'error': str(e), 'errors': {str(k): v for k, v in e.errors.items()}},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         with transaction.atomic():
             req_obj = EquipmentRequest.objects.create(
-                project_id=project_id,
+                project=project,
                 requested_by=request.user,
                 status='PENDING'
             )
-            
-            for item_data in items_data:
-                item_id = item_data.get('item_id')
-                qty = int(item_data.get('quantity', 1))
-                equipment = get_object_or_404(EquipmentItem, pk=item_id)
-                
-                if qty > equipment.available_quantity:
-                    transaction.set_rollback(True)
-                    return Response(
-                        {'error': f'Not enough stock for {equipment.name}. Available: {equipment.available_quantity}'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                
-                RequestedItem.objects.create(request=req_obj, item=equipment, quantity=qty)
+            period = req_obj.get_period()
+            RequestedItem.objects.bulk_create([
+                RequestedItem(request=req_obj, item_id=item_id, quantity=qty, period=period)
+                for item_id, qty in quantities.items()
+            ])
 
+        req_obj = self.get_queryset().get(pk=req_obj.pk)
         return Response(self.get_serializer(req_obj).data, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
     def approve(self, request, pk=None):
         req = self.get_object()
-        for item in req.items.all():
-            if item.quantity > item.item.available_quantity:
-                return Response({'error': f'Not enough stock for {item.item.name}'}, status=400)
-        req.status = 'APPROVED'
-        req.save()
+        try:
+            workflow.approve(req)
+        except workflow.WorkflowError as e:
+            return Response({'error': str(e)}, status=400)
         return Response({'status': 'Approved'})
 
+    @action(detail=False, methods=['post'], url_path='approve-pending', permission_classes=[IsAdminUser])
+    def approve_pending(self, request):
+        """
+        Approves every pending request that fits the stock, earliest project
+        first, in one transaction. Returns which were approved and, for the
+        rest, why not.
+        URL: /api/v1/equipment/requests/approve-pending/
+        """
+        return Response(workflow.approve_pending())
+
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
     def reject(self, request, pk=None):
         req = self.get_object()
-        req.status = 'REJECTED'
-        req.save()
+        try:
+            workflow.reject(req, admin_notes=request.data.get('admin_notes'))
+        except workflow.WorkflowError as e:
+            return Response({'error': str(e)}, status=400)
         return Response({'status': 'Rejected'})
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
@@ -96,37 +312,85 @@ class EquipmentRequestViewSet(viewsets.ModelViewSet):
         if req.status != 'APPROVED':
             return Response({'error': 'Request must be approved first'}, status=400)
         
-        logs = []
-        for item in req.items.all():
-            for _ in range(item.quantity):
-                logs.append(CheckoutLog(
-                    request=req, item=item.item, 
-                    checked_out_by=request.user, 
-                    checked_out_at=timezone.now()
-                ))
-        CheckoutLog.objects.bulk_create(logs)
-        req.status = 'CHECKED_OUT'
-        req.save()
+        try:
+            workflow.checkout(req, request.user)
+        except workflow.WorkflowError as e:
+            return Response({'error': str(e)}, status=400)
         return Response({'status': 'Checked Out'})
 
     @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
     def checkin(self, request, pk=None):
+        """
+        Checks in any mix of lines and items in one call:
+        {"items": [
+            {"log_id": 41, "status": "GOOD", "quantity": 8},
+            {"item_id": 12, "GOOD": 8, "DAMAGED": 1},
+            {"item_id": 15, "status": "GOOD"}
+        ]}
+        An entry names either a checkout line (log_id) or an item (item_id),
+        and gives either one "status" with a "quantity" or a count per
+        condition. A missing quantity means every unit still out on that
+        line / item.
+        """
         req = self.get_object()
-        items_data = request.data.get('items', []) 
-        
-        for item_data in items_data:
-            log = get_object_or_404(CheckoutLog, pk=item_data['log_id'])
-            log.return_status = item_data['status']
-            log.checked_in_by = request.user
-            log.checked_in_at = timezone.now()
-            log.save()
-            
-        if not req.logs.filter(checked_in_at__isnull=True).exists():
-            req.status = 'RETURNED'
-        else:
-            req.status = 'PARTIAL_RETURN'
-        req.save()
-        return Response({'status': 'Checked In'})
+        try:
+            logs, items = _parse_checkin_entries(request.data.get('items', []))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            return Response({'error': f"Invalid check-in entry: {e}"}, status=400)
+
+        try:
+            checked_in = workflow.checkin(req, request.user, logs=logs, items=items)
+        except workflow.WorkflowError as e:
+            return Response({'error': str(e)}, status=400)
+        return Response({'status': 'Checked In', 'checked_in': checked_in})
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
+    def scan(self, request, pk=None):
+        """
+        Applies a stream of asset-tag scans from the desk:
+        {"mode": "out", "scans": ["CAM-0012", "CAM-0013"]}
+        {"mode": "in", "scans": ["CAM-0012", {"tag": "CAM-0013", "status": "DAMAGED"}]}
+        Check-in scans default to GOOD. Every scan gets a result; bad
+        scans are reported and skipped.
+        """
+        req = self.get_object()
+        mode = request.data.get('mode')
+        scans = request.data.get('scans')
+        if mode not in ('out', 'in') or not isinstance(scans, list):
+            return Response({'error': "Send a 'mode' of 'out' or 'in' and a list of 'scans'."}, status=400)
+        try:
+            scans = [
+                (scan, 'GOOD') if isinstance(scan, str) else (scan['tag'], scan.get('status', 'GOOD'))
+                for scan in scans
+            ]
+        except (KeyError, TypeError, AttributeError):
+            return Response({'error': "Each scan is a tag or {\"tag\": ..., \"status\": ...}."}, status=400)
+        scans = [(str(tag).strip(), return_status) for tag, return_status in scans]
+
+        try:
+            if mode == 'out':
+                results = scanning.scan_out(req, request.user, [tag for tag, _ in scans])
+            else:
+                results = scanning.scan_in(req, request.user, scans)
+        except workflow.WorkflowError as e:
+            return Response({'error': str(e)}, status=400)
+        req.refresh_from_db(fields=['status'])
+        applied = sum(result['ok'] for result in results)
+        return Response({
+            'status': req.get_status_display(),
+            'applied': applied,
+            'failed': len(results) - applied,
+            'results': results,
+        })
+
+    @action(detail=False, methods=['get'], url_path='status-counts', permission_classes=[IsAdminUser])
+    def status_counts(self, request):
+        """
+        How many requests are in each status, for the queue's badges.
+        Read from the status counters, never by counting requests.
+        URL: /api/v1/equipment/requests/status-counts/
+        """
+        return Response(RequestStatusCount.current())
 
     # --- NEW ACTIONS FOR PDF / PRINT / EMAIL ---
 
@@ -138,8 +402,7 @@ class EquipmentRequestViewSet(viewsets.ModelViewSet):
         """
         req = self.get_object()
         try:
-            html_string = render_to_string('equipment/checkout_sheet.html', {'request': req})
-            pdf_file = HTML(string=html_string).write_pdf()
+            pdf_file = render_checkout_sheet(req)
             response = HttpResponse(pdf_file, content_type='application/pdf')
             response['Content-Disposition'] = f'attachment; filename="checkout_request_{req.pk}.pdf"'
             return response
@@ -163,25 +426,18 @@ class EquipmentRequestViewSet(viewsets.ModelViewSet):
         """
         req = self.get_object()
         user_email = request.data.get('user_email')
-        
-        try:
-            html_string = render_to_string('equipment/checkout_sheet.html', {'request': req})
-            pdf_file = HTML(string=html_string).write_pdf()
-            
-            email = EmailMessage(
-                subject=f"Checkout Sheet #{req.pk}",
-                body="Attached is the checkout sheet.",
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                to=['73f38dyq@hpeprint.com']
-            )
-            if user_email:
-                email.to.append(user_email)
-                
-            email.attach(f'checkout_{req.pk}.pdf', pdf_file, 'application/pdf')
-            email.send()
-            return Response({'status': 'Email sent'})
-        except Exception as e:
-            return Response({'error': str(e)}, status=500)
+
+        to = ['73f38dyq@hpeprint.com']
+        if user_email:
+            to.append(user_email)
+        delivery = queue_email(
+            subject=f"Checkout Sheet #{req.pk}",
+            body="Attached is the checkout sheet.",
+            to=to,
+            attachments=[queued_checkout_sheet(req, f'checkout_{req.pk}.pdf')],
+            user=request.user,
+        )
+        return Response({'status': 'Email queued', 'delivery_id': delivery.pk}, status=status.HTTP_202_ACCEPTED)
 
     @action(detail=True, methods=['post'], url_path='hpeprint', permission_classes=[IsAdminUser])
     def hpeprint(self, request, pk=None):
@@ -190,18 +446,37 @@ class EquipmentRequestViewSet(viewsets.ModelViewSet):
         URL: /api/v1/equipment/requests/{pk}/hpeprint/
         """
         req = self.get_object()
+        delivery = queue_email(
+            subject=f"PRINT: Request #{req.pk}",
+            body="Auto-print request.",
+            to=['73f38dyq@hpeprint.com'],
+            attachments=[queued_checkout_sheet(req, f'checkout_{req.pk}.pdf')],
+            user=request.user,
+        )
+        return Response({'status': 'Queued for printer', 'delivery_id': delivery.pk}, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['post'], url_path='batch-print', permission_classes=[IsAdminUser])
+    def batch_print(self, request):
+        """
+        Merge many checkout sheets into one PDF and send it to the printer.
+        Body: {"request_ids": [12, 13, ...]}
+        Large batches are rendered in parallel when the email is sent:
+        'pages' is then null and 'sheets' empty; poll the delivery id, whose
+        'details' carry the pages and per-sheet timings once it is sent.
+        URL: /api/v1/equipment/requests/batch-print/
+        """
+        request_ids = request.data.get('request_ids')
+        if not isinstance(request_ids, list):
+            return Response({'error': "'request_ids' must be a list of request ids."}, status=status.HTTP_400_BAD_REQUEST)
+        started = time.perf_counter()
         try:
-            html_string = render_to_string('equipment/checkout_sheet.html', {'request': req})
-            pdf_file = HTML(string=html_string).write_pdf()
-            
-            email = EmailMessage(
-                subject=f"PRINT: Request #{req.pk}",
-                body="Auto-print request.",
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                to=['73f38dyq@hpeprint.com']
-            )
-            email.attach(f'checkout_{req.pk}.pdf', pdf_file, 'application/pdf')
-            email.send()
-            return Response({'status': 'Sent to printer'})
-        except Exception as e:
-            return Response({'error': str(e)}, status=500)
\ No newline at end of file
+            delivery, pages, timings = queue_batch_print(request_ids, user=request.user)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'status': 'Queued for printer',
+            'delivery_id': delivery.pk,
+            'pages': pages,
+            'total_ms': round((time.perf_counter() - started) * 1000, 1),
+            'sheets': timings,
+        }, status=status.HTTP_202_ACCEPTED)
\ No newline at end of file
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class EquipmentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'equipment'
+
+    def ready(self):
+        import equipment.signals  # Keeps the stock and status counters in sync
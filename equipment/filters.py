@@ -0,0 +1,15 @@
+# equipment/filters.py
+
+from rest_framework import filters
+
+
+class CatalogSearchFilter(filters.SearchFilter):
+    """
+    `?search=` for equipment items, backed by EquipmentItemQuerySet.search():
+    fuzzy, relevance-ranked, and annotated with a `similarity` score.
+    """
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip():
+            return queryset
+        return queryset.search(query)
@@ -2,8 +2,9 @@
 # (Edit this file)
 
 from django import forms
-from django.forms import inlineformset_factory, modelformset_factory
+from django.forms import inlineformset_factory, modelformset_factory, BaseInlineFormSet
 from .models import EquipmentRequest, RequestedItem, EquipmentItem, CheckoutLog
+from . import workflow
 from projects.models import Project
 from django.contrib.auth.models import User
 
@@ -31,24 +32,46 @@ class BaseRequestItemForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['item'].queryset = EquipmentItem.objects.filter(total_quantity__gt=0)
-    
-    def clean_quantity(self):
-        quantity = self.cleaned_data.get('quantity')
-        item = self.cleaned_data.get('item')
-        original_quantity = self.instance.quantity if self.instance.pk else 0
-        
-        if quantity and item:
-            available_now = item.available_quantity + original_quantity
-            if quantity > available_now:
-                raise forms.ValidationError(
-                    f"Not enough stock. Only {available_now} available, but {quantity} requested."
+
+class BaseRequestItemFormSet(BaseInlineFormSet):
+    """
+    Checks the stock for all rows together, in one query, against the
+    dates of `project` (pass it in once the project has been chosen).
+    """
+    def __init__(self, *args, project=None, **kwargs):
+        self.project = project
+        super().__init__(*args, **kwargs)
+
+    def clean(self):
+        # Stock comes first: validate_unique() (in super().clean()) would
+        # otherwise reject rows that repeat an item as duplicates before
+        # their combined quantity was ever checked.
+        forms_by_item = {}
+        for form in self.forms:
+            if form.errors or not form.cleaned_data or self._should_delete_form(form):
+                continue
+            item = form.cleaned_data.get('item')
+            quantity = form.cleaned_data.get('quantity')
+            if item and quantity:
+                forms_by_item.setdefault(item.pk, []).append((form, quantity))
+
+        if forms_by_item:
+            try:
+                workflow.check_stock(
+                    self.project,
+                    [(item_id, quantity) for item_id, rows in forms_by_item.items() for _, quantity in rows]
                 )
-        return quantity
+            except workflow.InsufficientStock as e:
+                for item_id, message in e.errors.items():
+                    for form, _ in forms_by_item[item_id]:
+                        form.add_error('quantity', message)
+        super().clean()
 
 RequestItemFormSet = inlineformset_factory(
     EquipmentRequest,
     RequestedItem,
     form=BaseRequestItemForm,
+    formset=BaseRequestItemFormSet,
     extra=1,
     can_delete=True,
     can_delete_extra=True,
@@ -61,20 +84,45 @@ RequestItemFormSet = inlineformset_factory(
 
 class CheckInLogForm(forms.ModelForm):
     """
-    A form for a single CheckoutLog item, allowing an Admin
-    to set the return_status.
+    A form for a single open CheckoutLog line, allowing an Admin
+    to enter how many of its units came back in each condition.
+    Units that are left at 0 stay checked out.
     """
-    # We make the status required for check-in
-    return_status = forms.ChoiceField(
-        choices=CheckoutLog.RETURN_STATUS_CHOICES,
-        widget=forms.Select(attrs={'class': 'form-select form-select-sm'})
-    )
-    
+    good = forms.IntegerField(min_value=0, initial=0, widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm'}))
+    damaged = forms.IntegerField(min_value=0, initial=0, widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm'}))
+    lost = forms.IntegerField(min_value=0, initial=0, widget=forms.NumberInput(attrs={'class': 'form-control form-control-sm'}))
+
     class Meta:
         model = CheckoutLog
-        fields = ['return_status']
+        fields = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The usual case is that everything comes back in good condition.
+        self.fields['good'].initial = self.instance.quantity
+        for name in ('good', 'damaged', 'lost'):
+            self.fields[name].widget.attrs['max'] = self.instance.quantity
+
+    def clean(self):
+        cleaned_data = super().clean()
+        total = sum(cleaned_data.get(name) or 0 for name in ('good', 'damaged', 'lost'))
+        if total > self.instance.quantity:
+            raise forms.ValidationError(
+                f"Only {self.instance.quantity} of this item are out, but {total} were entered."
+            )
+        return cleaned_data
 
-# This formset will manage all the CheckoutLog items for a request
+    def get_returns(self):
+        """
+        The counts in the shape workflow.checkin() expects.
+        """
+        return {
+            'GOOD': self.cleaned_data['good'],
+            'DAMAGED': self.cleaned_data['damaged'],
+            'LOST': self.cleaned_data['lost'],
+        }
+
+# This formset will manage all the open CheckoutLog lines for a request
 BaseCheckInFormSet = modelformset_factory(
     CheckoutLog,
     form=CheckInLogForm,
@@ -90,4 +138,29 @@ class EmailCheckoutSheetForm(forms.Form):
         widget=forms.Select(attrs={'class': 'form-select'}),
         label="Select User to Email",
         help_text="Select a staff member to send the checkout sheet to."
-    )
\ No newline at end of file
+    )
+
+class ScanForm(forms.Form):
+    """
+    The desk's scan box: a barcode scanner types one tag per line.
+    """
+    MODE_CHOICES = [
+        ('out', 'Check out'),
+        ('in', 'Check in'),
+    ]
+    mode = forms.ChoiceField(choices=MODE_CHOICES, widget=forms.RadioSelect, initial='out')
+    return_status = forms.ChoiceField(
+        choices=CheckoutLog.RETURN_STATUS_CHOICES,
+        initial='GOOD',
+        widget=forms.Select(attrs={'class': 'form-select'}),
+        label="Condition (check-in)"
+    )
+    tags = forms.CharField(
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 8, 'autofocus': True}),
+        label="Scanned tags",
+        help_text="One tag per line."
+    )
+
+    def get_tags(self):
+        return [line.strip() for line in self.cleaned_data['tags'].splitlines() if line.strip()]
+
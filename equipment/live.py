@@ -0,0 +1,186 @@
+# equipment/live.py
+#
+# Live availability for the request form. The form loads a snapshot
+# (every item's available quantity within the chosen project's dates,
+# plus the id of the latest StockChange) and then follows a
+# server-sent-events stream of the StockChanges after that id. Changes
+# carry the units on the shelf; with a project chosen, the form reloads
+# its window's snapshot when they arrive instead.
+#
+# The stream polls StockChange every POLL_SECONDS and sends each change as
+# soon as it sees it. Under WSGI (gunicorn) it is a plain generator that
+# sleeps between polls; under the ASGI app (fikirierp/asgi.py) it is an
+# async generator, so an open stream costs no worker thread while it
+# waits. Each response ends after a while and the browser reconnects
+# with Last-Event-ID.
+#
+# The snapshot is served with a strong ETag, so a client that already has
+# the current one gets a 304 without touching the catalog. Cached copies
+# are keyed by a version read from the StockChange table (see
+# snapshot_version()), so every worker stops serving a copy as soon as
+# a stock change commits, whichever process made it.
+
+import asyncio
+import hashlib
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from projects.models import Project
+
+from .models import EquipmentItem, EquipmentStock, StockChange
+
+POLL_SECONDS = 2
+HEARTBEAT_SECONDS = 15
+STREAM_SECONDS = 60
+# A sync worker is held for the whole response, so hand it back sooner.
+WSGI_STREAM_SECONDS = 20
+RETRY_MS = 2000
+# Ids are handed out before commit, so a change can become visible after
+# a higher id already has. Every poll looks this many ids back for late
+# ones; events carry absolute values, so seeing one again is harmless.
+LATE_COMMIT_WINDOW = 200
+_DONE = object()
+
+# Cache key prefix and lifetime for the serialized snapshot. Entries are
+# never invalidated, only superseded by a newer version.
+SNAPSHOT_CACHE_KEY = 'equipment:availability-snapshot'
+SNAPSHOT_CACHE_TIMEOUT = 60
+
+
+def latest_change_id():
+    return StockChange.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def availability_snapshot(project=None):
+    """
+    {'event_id': ..., 'items': {item_id: available}} for every item that
+    has stock: the units on the shelf, or, for a project, the units free
+    within its dates. Read the event id first, so no change made while the
+    map is read can be missed by a stream that starts from it.
+    """
+    event_id = latest_change_id()
+    if project is None:
+        items = EquipmentStock.objects.filter(item__total_quantity__gt=0).values_list('item_id', 'available')
+    else:
+        items = EquipmentItem.objects.filter(total_quantity__gt=0).with_window_availability(
+            project.date_from, project.date_to
+        ).values_list('pk', 'window_available')
+    return {'event_id': event_id, 'items': dict(items)}
+
+
+def snapshot_version():
+    """
+    Changes whenever a StockChange commits: the latest change id, plus how
+    many changes sit within LATE_COMMIT_WINDOW of it, so a change that
+    commits late, below the latest id, moves it too. Two index-only reads.
+    """
+    latest = latest_change_id()
+    recent = StockChange.objects.filter(id__gt=latest - LATE_COMMIT_WINDOW).count()
+    return f'{latest}.{recent}'
+
+
+def cached_snapshot(project=None):
+    """
+    (etag, json_bytes) of availability_snapshot(), from the cache when possible.
+    The ETag is a hash of the body, so equal ETags mean identical bytes.
+    The version is read before the snapshot, so a cached body is never
+    older than the version it is filed under. A project's window also
+    depends on its dates and on today (gear still out past its dates).
+    """
+    key = f'{SNAPSHOT_CACHE_KEY}:{snapshot_version()}'
+    if project is not None:
+        key += f':{project.pk}:{project.date_from}:{project.date_to}:{timezone.localdate()}'
+    entry = cache.get(key)
+    if entry is None:
+        body = json.dumps(availability_snapshot(project)).encode()
+        entry = (f'"{hashlib.sha1(body).hexdigest()}"', body)
+        cache.set(key, entry, SNAPSHOT_CACHE_TIMEOUT)
+    return entry
+
+
+def snapshot_response(request):
+    """
+    The snapshot as a JSON response, or a 304 when the request's
+    If-None-Match already names it. ?project=<id> gives the availability
+    within that project's dates.
+    """
+    project = None
+    if request.GET.get('project'):
+        try:
+            project = Project.objects.get(pk=int(request.GET['project']))
+        except (ValueError, Project.DoesNotExist):
+            return HttpResponseBadRequest("Unknown project.")
+    etag, body = cached_snapshot(project)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    # Clients may keep it, but must revalidate before each use.
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _event(change):
+    data = json.dumps({'item': change.item_id, 'available': change.available})
+    return f"id: {change.pk}\nevent: stock\ndata: {data}\n\n"
+
+
+def _poll_messages(last_id, seconds):
+    """
+    The stream itself, shared by both servers: yields SSE messages for the
+    StockChanges after `last_id`, and None each time it is due to wait
+    POLL_SECONDS, until `seconds` have passed.
+    """
+    yield f"retry: {RETRY_MS}\n\n"
+    started = last_beat = time.monotonic()
+    cursor = last_id
+    sent = set()
+    while time.monotonic() - started < seconds:
+        low = max(last_id, cursor - LATE_COMMIT_WINDOW)
+        changes = list(StockChange.objects.filter(id__gt=low).exclude(id__in=sent).order_by('id'))
+        for change in changes:
+            yield _event(change)
+            sent.add(change.pk)
+            cursor = max(cursor, change.pk)
+        sent = {pk for pk in sent if pk > cursor - LATE_COMMIT_WINDOW}
+
+        if changes:
+            last_beat = time.monotonic()
+        elif time.monotonic() - last_beat >= HEARTBEAT_SECONDS:
+            yield ": keep-alive\n\n"
+            last_beat = time.monotonic()
+        yield None
+
+
+def stock_events_sync(last_id):
+    """
+    The stream for a WSGI worker, which it holds while it waits, so each
+    response ends after WSGI_STREAM_SECONDS.
+    """
+    for message in _poll_messages(last_id, WSGI_STREAM_SECONDS):
+        if message is None:
+            time.sleep(POLL_SECONDS)
+        else:
+            yield message
+
+
+async def stock_events(last_id):
+    """
+    The stream under ASGI: the queries run in the sync thread, and the
+    waits cost nothing, so each response runs for STREAM_SECONDS.
+    """
+    messages = _poll_messages(last_id, STREAM_SECONDS)
+    step = sync_to_async(next)
+    while True:
+        message = await step(messages, _DONE)
+        if message is _DONE:
+            return
+        if message is None:
+            await asyncio.sleep(POLL_SECONDS)
+        else:
+            yield message
@@ -0,0 +1,66 @@
+# equipment/management/commands/bench_checkout_pdf.py
+#
+# Times checkout-sheet rendering the old way (a fresh WeasyPrint render with
+# the inline stylesheet every time) against the warm per-worker renderer in
+# equipment/pdf.py. The PDF cache is bypassed, so every run really renders.
+
+import statistics
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from equipment.models import EquipmentRequest
+from equipment.pdf import CheckoutSheetRenderer, render_checkout_sheet_html
+
+
+class Command(BaseCommand):
+    help = "Benchmarks cold vs. warm checkout-sheet PDF rendering (no cache)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--request', type=int, help="EquipmentRequest id to render (default: the latest).")
+        parser.add_argument('--runs', type=int, default=10, help="Renders per mode.")
+
+    def handle(self, *args, **options):
+        req = EquipmentRequest.objects.filter(pk=options['request']).first() if options['request'] \
+            else EquipmentRequest.objects.order_by('-created_at').first()
+        if req is None:
+            raise CommandError("No equipment request to render.")
+        runs = options['runs']
+
+        if 'weasyprint' not in sys.modules:
+            started = time.perf_counter()
+            import weasyprint  # noqa: F401
+            self.stdout.write(f"import weasyprint: {(time.perf_counter() - started) * 1000:8.1f} ms (once per worker)")
+        from weasyprint import HTML
+
+        inline_html = render_checkout_sheet_html(req)
+        pdf_html = render_checkout_sheet_html(req, pdf=True)
+
+        cold = self._time(runs, lambda: HTML(string=inline_html).write_pdf())
+
+        started = time.perf_counter()
+        renderer = CheckoutSheetRenderer()
+        setup = (time.perf_counter() - started) * 1000
+        warm = self._time(runs, lambda: renderer.write_pdf(pdf_html))
+
+        self.stdout.write(f"Request #{req.pk}, {runs} render(s) per mode")
+        self.stdout.write(f"warm renderer setup: {setup:8.1f} ms (once per worker thread)")
+        self._report('cold', cold)
+        self._report('warm', warm)
+        self.stdout.write(self.style.SUCCESS(
+            f"warm is {statistics.median(cold) / statistics.median(warm):.2f}x faster (median)"
+        ))
+
+    def _time(self, runs, render):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            render()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def _report(self, label, timings):
+        self.stdout.write(
+            f"{label}: median {statistics.median(timings):8.1f} ms, "
+            f"min {min(timings):8.1f} ms, max {max(timings):8.1f} ms"
+        )
@@ -0,0 +1,77 @@
+# equipment/management/commands/detect_overdue.py
+#
+# Finds equipment still out after its project's date_to and queues one
+# digest email per requester listing everything they have overdue. Run it
+# daily from cron. The scan reads only open logs (checkoutlog_open_idx),
+# so it doesn't grow with the checkout history. The digests go through
+# the outbox and are then sent together over one SMTP connection.
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+from core import outbox
+from equipment.models import CheckoutLog
+
+
+class Command(BaseCommand):
+    help = "Emails each requester a digest of their equipment that is still out after the project ended."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="List the overdue gear without emailing anyone.")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        logs = (
+            CheckoutLog.objects.overdue(today)
+            .select_related('item', 'unit', 'request__project', 'request__requested_by')
+            .order_by('request__requested_by_id', 'request__project__date_to', 'request_id', 'item__name')
+        )
+
+        # requester -> [{'request', 'days_overdue', 'lines'}], in date_to order.
+        digests = {}
+        # Requests whose requester's account was deleted; nobody to email.
+        orphaned = {}
+        for log in logs:
+            req = log.request
+            if req.requested_by is None:
+                orphaned.setdefault(req.pk, req)
+                continue
+            entries = digests.setdefault(req.requested_by, [])
+            if not entries or entries[-1]['request'].pk != req.pk:
+                entries.append({'request': req, 'days_overdue': (today - req.project.date_to).days, 'lines': []})
+            entries[-1]['lines'].append(log)
+
+        for req in orphaned.values():
+            self.stdout.write(self.style.WARNING(
+                f"#{req.pk} ({req.project.company_name}): overdue but has no requester; not emailed"
+            ))
+
+        if not digests:
+            if not orphaned:
+                self.stdout.write(self.style.SUCCESS("No overdue equipment."))
+            return
+
+        queued = []
+        with transaction.atomic():
+            for user, entries in digests.items():
+                summary = ', '.join(f"#{entry['request'].pk}" for entry in entries)
+                if options['dry_run'] or not user.email:
+                    style = self.style.NOTICE if options['dry_run'] else self.style.WARNING
+                    reason = "" if options['dry_run'] else " (no email address)"
+                    self.stdout.write(style(f"{user.username}: overdue on {summary}{reason}"))
+                    continue
+                email = outbox.queue_email(
+                    subject=f"FikiriERP: Overdue equipment ({len(entries)} request{'s' if len(entries) != 1 else ''})",
+                    body=render_to_string('equipment/email/overdue_digest.txt', {'user': user, 'requests': entries}),
+                    to=[user.email],
+                )
+                queued.append(email.pk)
+
+        if queued:
+            # Only these digests; older mail is left to send_outbox.
+            sent, failed = outbox.send_due(batch_size=len(queued), ids=queued)
+            self.stdout.write(self.style.SUCCESS(
+                f"Queued {len(queued)} overdue digest(s); sent {sent}, failed {failed} "
+                "(failures are retried by send_outbox)."
+            ))
@@ -0,0 +1,29 @@
+# equipment/management/commands/prune_stock_changes.py
+#
+# StockChange rows only matter to live availability streams that are
+# catching up (see equipment/live.py), so old ones can go. Run it daily
+# from cron; the latest change is always kept so event ids keep counting
+# up from it.
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from equipment import live
+from equipment.models import StockChange
+
+
+class Command(BaseCommand):
+    help = "Deletes StockChange rows older than --days days."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=1, help="Keep this many days of changes (default 1).")
+
+    def handle(self, *args, **options):
+        if options['days'] < 1:
+            raise CommandError("--days must be at least 1.")
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted, _ = StockChange.objects.filter(
+            created_at__lt=cutoff, id__lt=live.latest_change_id()
+        ).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} stock change(s) older than {cutoff:%Y-%m-%d %H:%M}."))
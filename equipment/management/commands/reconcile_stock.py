@@ -0,0 +1,73 @@
+# equipment/management/commands/reconcile_stock.py
+#
+# Rebuilds the EquipmentStock counters from the request and checkout logs
+# and reports every item whose counters had drifted.
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from equipment.models import EquipmentItem, EquipmentStock
+from equipment.workflow import record_stock_changes
+
+COUNTERS = ('reserved', 'out', 'damaged', 'available')
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the per-item stock counters from the logs and reports any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only report drift, don't rewrite the counters.",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        with transaction.atomic():
+            # Lock the counters so no transition slips in between
+            # reading the logs and writing the rebuilt numbers.
+            current = {
+                stock.item_id: stock
+                for stock in EquipmentStock.objects.select_for_update()
+            }
+            items = EquipmentItem.objects.with_logged_stock().order_by('pk')
+
+            to_create, to_update, drifted = [], [], 0
+            for item in items:
+                expected = {
+                    'reserved': item.logged_reserved,
+                    'out': item.logged_out,
+                    'damaged': item.logged_damaged,
+                }
+                expected['available'] = item.total_quantity - expected['out'] - expected['damaged']
+
+                stock = current.get(item.pk)
+                if stock is None:
+                    drifted += 1
+                    self.stdout.write(self.style.WARNING(f"{item.name} (#{item.pk}): no counter row"))
+                    to_create.append(EquipmentStock(item=item, **expected))
+                    continue
+
+                diffs = [
+                    f"{name} {getattr(stock, name)} -> {value}"
+                    for name, value in expected.items() if getattr(stock, name) != value
+                ]
+                if diffs:
+                    drifted += 1
+                    self.stdout.write(self.style.WARNING(f"{item.name} (#{item.pk}): {', '.join(diffs)}"))
+                    for name, value in expected.items():
+                        setattr(stock, name, value)
+                    to_update.append(stock)
+
+            if not dry_run:
+                EquipmentStock.objects.bulk_create(to_create, batch_size=500)
+                EquipmentStock.objects.bulk_update(to_update, COUNTERS, batch_size=500)
+                record_stock_changes([stock.item_id for stock in to_create + to_update])
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("All stock counters match the logs."))
+        elif dry_run:
+            self.stdout.write(self.style.WARNING(f"{drifted} item(s) have drifted (dry run, nothing changed)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt counters for {drifted} drifted item(s)."))
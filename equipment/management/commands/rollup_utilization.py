@@ -0,0 +1,40 @@
+# equipment/management/commands/rollup_utilization.py
+#
+# Fills the daily usage rollups (see equipment/utilization.py) for every
+# finished day that hasn't been rolled up yet. Run it nightly from cron;
+# a run with nothing to do costs two small queries.
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from equipment import utilization
+
+
+class Command(BaseCommand):
+    help = "Rolls up per-item daily equipment usage for the days not rolled up yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help="Rebuild from this day (YYYY-MM-DD) instead, e.g. after correcting old logs.",
+        )
+
+    def handle(self, *args, **options):
+        if options['since']:
+            start = parse_date(options['since'])
+            if start is None:
+                raise CommandError("--since must be a date (YYYY-MM-DD).")
+            end = timezone.localdate() - timedelta(days=1)
+            if start > end:
+                raise CommandError("--since must be before today.")
+        else:
+            pending = utilization.pending_days()
+            if pending is None:
+                self.stdout.write(self.style.SUCCESS("Utilization rollups are up to date."))
+                return
+            start, end = pending
+
+        written = utilization.rollup(start, end)
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {start} to {end}: {written} item-day row(s)."))
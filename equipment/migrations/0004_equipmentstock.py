@@ -0,0 +1,67 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def build_stock_counters(apps, schema_editor):
+    """
+    Seeds one EquipmentStock row per existing item from the request and checkout logs.
+    """
+    EquipmentItem = apps.get_model('equipment', 'EquipmentItem')
+    EquipmentStock = apps.get_model('equipment', 'EquipmentStock')
+    RequestedItem = apps.get_model('equipment', 'RequestedItem')
+    CheckoutLog = apps.get_model('equipment', 'CheckoutLog')
+
+    reserved = dict(
+        RequestedItem.objects.filter(request__status='APPROVED')
+        .values('item').annotate(total=Sum('quantity')).values_list('item', 'total')
+    )
+    out = dict(
+        CheckoutLog.objects.filter(
+            request__status__in=['CHECKED_OUT', 'PARTIAL_RETURN'],
+            checked_in_at__isnull=True
+        ).values('item').annotate(total=Count('pk')).values_list('item', 'total')
+    )
+    damaged = dict(
+        CheckoutLog.objects.filter(return_status__in=['DAMAGED', 'LOST'])
+        .values('item').annotate(total=Count('pk')).values_list('item', 'total')
+    )
+
+    counters = []
+    for item_id, total_quantity in EquipmentItem.objects.values_list('pk', 'total_quantity'):
+        row = EquipmentStock(
+            item_id=item_id,
+            reserved=reserved.get(item_id, 0),
+            out=out.get(item_id, 0),
+            damaged=damaged.get(item_id, 0),
+        )
+        row.available = total_quantity - row.reserved - row.out - row.damaged
+        counters.append(row)
+    EquipmentStock.objects.bulk_create(counters, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0003_remove_checkoutlog_quantity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EquipmentStock',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock', serialize=False, to='equipment.equipmentitem')),
+                ('reserved', models.IntegerField(default=0)),
+                ('out', models.IntegerField(default=0)),
+                ('damaged', models.IntegerField(default=0)),
+                ('available', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Equipment stock',
+            },
+        ),
+        migrations.RunPython(build_stock_counters, migrations.RunPython.noop),
+    ]
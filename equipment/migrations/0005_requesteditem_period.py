@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:36
+
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0004_equipmentstock'),
+        ('projects', '0004_project_description_service_department_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requesteditem',
+            name='period',
+            field=django.contrib.postgres.fields.ranges.DateRangeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunSQL(
+            # Backfill every existing line with its project's date window.
+            """
+            UPDATE equipment_requesteditem AS ri
+            SET period = daterange(p.date_from, p.date_to, '[]')
+            FROM equipment_equipmentrequest AS r
+            JOIN projects_project AS p ON p.id = r.project_id
+            WHERE ri.request_id = r.id;
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='requesteditem',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['period'], name='requesteditem_period_gist'),
+        ),
+    ]
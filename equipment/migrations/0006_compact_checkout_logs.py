@@ -0,0 +1,93 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:44
+
+from datetime import timedelta
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+# Rows that can describe the same hand-out and the same return.
+SAME_EVENT = ('request_id', 'item_id', 'checked_out_by_id', 'checked_in_by_id', 'return_status')
+# The old code wrote one row per unit, each stamped with its own now(), so
+# the rows of one checkout (or check-in) are microseconds apart, not equal.
+SAME_EVENT_WINDOW = timedelta(seconds=1)
+
+
+def _starts_new_event(first, row):
+    if any(first[field] != row[field] for field in SAME_EVENT):
+        return True
+    if (first['checked_in_at'] is None) != (row['checked_in_at'] is None):
+        return True
+    if abs(row['checked_out_at'] - first['checked_out_at']) > SAME_EVENT_WINDOW:
+        return True
+    return first['checked_in_at'] is not None and abs(row['checked_in_at'] - first['checked_in_at']) > SAME_EVENT_WINDOW
+
+
+def merge_unit_rows(apps, schema_editor):
+    """
+    Collapses the one-row-per-unit logs written so far into one row per
+    item and event, with the unit count in `quantity`. Rows belong to one
+    event when they share request, item, people, return status and
+    open/closed state, and were stamped within SAME_EVENT_WINDOW of the
+    event's first row. The merged row keeps the earliest checkout time and
+    the latest check-in time.
+    """
+    CheckoutLog = apps.get_model('equipment', 'CheckoutLog')
+    rows = CheckoutLog.objects.order_by(
+        *SAME_EVENT, F('checked_in_at').asc(nulls_first=True), 'checked_out_at', 'pk'
+    ).values('pk', 'quantity', 'checked_out_at', 'checked_in_at', *SAME_EVENT)
+
+    merged, duplicates = [], []
+    event = None
+    for row in rows.iterator():
+        if event is None or _starts_new_event(event['first'], row):
+            event = {'first': row, 'keep': row['pk'], 'units': 0, 'rows': 0,
+                     'checked_out_at': row['checked_out_at'], 'checked_in_at': row['checked_in_at']}
+            merged.append(event)
+        else:
+            duplicates.append(row['pk'])
+            event['checked_out_at'] = min(event['checked_out_at'], row['checked_out_at'])
+            if row['checked_in_at'] is not None:
+                event['checked_in_at'] = max(event['checked_in_at'], row['checked_in_at'])
+        event['units'] += row['quantity']
+        event['rows'] += 1
+
+    CheckoutLog.objects.bulk_update(
+        [
+            CheckoutLog(
+                pk=event['keep'], quantity=event['units'],
+                checked_out_at=event['checked_out_at'], checked_in_at=event['checked_in_at'],
+            )
+            for event in merged if event['rows'] > 1
+        ],
+        ['quantity', 'checked_out_at', 'checked_in_at'],
+        batch_size=500,
+    )
+    for start in range(0, len(duplicates), 1000):
+        CheckoutLog.objects.filter(pk__in=duplicates[start:start + 1000]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0005_requesteditem_period'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkoutlog',
+            name='quantity',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='equipmentitem',
+            name='is_serialized',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='checkoutlog',
+            name='checked_out_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(merge_unit_rows, migrations.RunPython.noop),
+    ]
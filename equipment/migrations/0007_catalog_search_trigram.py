@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:56
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0006_compact_checkout_logs'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='equipmentcategory',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='equip_category_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='equipmentitem',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='equip_item_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0007_catalog_search_trigram'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkoutlog',
+            name='repaired_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='checkoutlog',
+            name='repaired_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='repaired_logs', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='checkoutlog',
+            index=models.Index(condition=models.Q(('repaired_at__isnull', True), ('return_status__in', ['DAMAGED', 'LOST'])), fields=['item', 'checked_in_at'], name='checkoutlog_needs_repair_idx'),
+        ),
+    ]
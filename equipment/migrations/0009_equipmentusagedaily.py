@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 03:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0008_checkoutlog_repaired'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EquipmentUsageDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units_out', models.PositiveIntegerField(default=0)),
+                ('checkouts', models.PositiveIntegerField(default=0)),
+                ('units_checked_out', models.PositiveIntegerField(default=0)),
+                ('units_returned', models.PositiveIntegerField(default=0)),
+                ('units_damaged', models.PositiveIntegerField(default=0)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage', to='equipment.equipmentitem')),
+            ],
+            options={
+                'verbose_name_plural': 'Equipment usage (daily)',
+                'ordering': ['day', 'item'],
+                'indexes': [models.Index(fields=['day'], name='equip_usage_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('item', 'day'), name='equip_usage_item_day_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_requests(apps, schema_editor):
+    """
+    Seeds the counters from the requests that already exist.
+    """
+    EquipmentRequest = apps.get_model('equipment', 'EquipmentRequest')
+    RequestStatusCount = apps.get_model('equipment', 'RequestStatusCount')
+
+    counts = dict(
+        EquipmentRequest.objects.order_by().values_list('status').annotate(n=Count('pk'))
+    )
+    RequestStatusCount.objects.bulk_create([
+        RequestStatusCount(status=status, count=counts.get(status, 0))
+        for status, _ in EquipmentRequest._meta.get_field('status').choices
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0009_equipmentusagedaily'),
+        ('projects', '0004_project_description_service_department_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestStatusCount',
+            fields=[
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('APPROVED', 'Approved'), ('REJECTED', 'Rejected'), ('CHECKED_OUT', 'Checked Out'), ('PARTIAL_RETURN', 'Partially Returned'), ('RETURNED', 'Returned')], max_length=20, primary_key=True, serialize=False)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='equipmentrequest',
+            index=models.Index(fields=['status', '-created_at'], name='equip_request_status_idx'),
+        ),
+        migrations.RunPython(count_requests, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0010_requeststatuscount'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EquipmentUnit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=100, unique=True)),
+                ('serial_number', models.CharField(blank=True, max_length=100)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='units', to='equipment.equipmentitem')),
+            ],
+            options={
+                'ordering': ['item', 'tag'],
+            },
+        ),
+        migrations.AddField(
+            model_name='checkoutlog',
+            name='unit',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='logs', to='equipment.equipmentunit'),
+        ),
+        migrations.AddConstraint(
+            model_name='checkoutlog',
+            constraint=models.UniqueConstraint(condition=models.Q(('checked_in_at__isnull', True)), fields=('unit',), name='checkoutlog_one_open_per_unit'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0011_equipmentunit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('available', models.IntegerField()),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='equipment.equipmentitem')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
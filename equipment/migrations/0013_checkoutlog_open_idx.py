@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0012_stockchange'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='checkoutlog',
+            index=models.Index(condition=models.Q(('checked_in_at__isnull', True)), fields=['request'], name='checkoutlog_open_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0013_checkoutlog_open_idx'),
+        ('projects', '0005_cursor_pagination_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='equipmentrequest',
+            index=models.Index(fields=['created_at', 'id'], name='equip_request_created_id_idx'),
+        ),
+    ]
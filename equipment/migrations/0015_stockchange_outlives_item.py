@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0014_cursor_pagination_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockchange',
+            name='item',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='equipment.equipmentitem'),
+        ),
+    ]
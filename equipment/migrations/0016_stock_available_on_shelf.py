@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:10
+
+from django.db import migrations
+from django.db.models import F
+
+
+def count_shelf_stock(apps, schema_editor):
+    """
+    `available` used to have the approved reservations taken off; it now
+    counts the units on the shelf, reservations included.
+    """
+    EquipmentStock = apps.get_model('equipment', 'EquipmentStock')
+    EquipmentStock.objects.update(available=F('available') + F('reserved'))
+
+
+def take_off_reservations(apps, schema_editor):
+    EquipmentStock = apps.get_model('equipment', 'EquipmentStock')
+    EquipmentStock.objects.update(available=F('available') - F('reserved'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0015_stockchange_outlives_item'),
+    ]
+
+    operations = [
+        migrations.RunPython(count_shelf_stock, take_off_reservations),
+    ]
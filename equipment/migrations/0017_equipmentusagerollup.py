@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:32
+
+from django.db import migrations, models
+from django.db.models import Max, Min, Count
+
+
+def record_existing_rollups(apps, schema_editor):
+    """
+    Rollups written before passes were recorded reach as far as their last day.
+    """
+    EquipmentUsageDaily = apps.get_model('equipment', 'EquipmentUsageDaily')
+    EquipmentUsageRollup = apps.get_model('equipment', 'EquipmentUsageRollup')
+    existing = EquipmentUsageDaily.objects.aggregate(start=Min('day'), end=Max('day'), rows=Count('pk'))
+    if existing['end'] is not None:
+        EquipmentUsageRollup.objects.create(**existing)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0016_stock_available_on_shelf'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EquipmentUsageRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateField()),
+                ('end', models.DateField(db_index=True)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-end'],
+            },
+        ),
+        migrations.RunPython(record_existing_rollups, migrations.RunPython.noop),
+    ]
@@ -2,7 +2,13 @@
 # (This is the complete, up-to-date file)
 
 from django.db import models
-from django.db.models import Sum, Q
+from django.db.models import Sum, Q, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.db.backends.postgresql.psycopg_any import DateRange
+from django.contrib.postgres.fields import DateRangeField
+from django.contrib.postgres.indexes import GistIndex, GinIndex
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.utils import timezone
 from projects.models import Project
 from django.contrib.auth.models import User
 
@@ -15,10 +21,177 @@ class EquipmentCategory(models.Model):
     class Meta:
         ordering = ['name']
         verbose_name_plural = "Equipment categories"
+        indexes = [
+            # Serves fuzzy catalog search (see EquipmentItemQuerySet.search).
+            GinIndex(fields=['name'], name='equip_category_name_trgm', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return self.name
 
+def _coalesced(queryset):
+    """
+    Wraps a single-column, per-item aggregate queryset as a scalar subquery
+    that falls back to 0 when the item has no matching rows.
+    """
+    return Coalesce(Subquery(queryset), 0, output_field=models.IntegerField())
+
+class EquipmentItemQuerySet(models.QuerySet):
+    def search(self, query):
+        """
+        Items whose name or category name matches `query`, best match first,
+        annotated with a `similarity` score between 0 and 1.
+
+        This is a pg_trgm word-similarity match served by the trigram GIN
+        indexes on both names, so it tolerates typos and partial model names
+        ("sony a7s3" finds "Sony A7S III").
+        """
+        query = query.strip()
+        matching_categories = EquipmentCategory.objects.filter(name__trigram_word_similar=query)
+        return self.filter(
+            Q(name__trigram_word_similar=query) | Q(category__in=matching_categories)
+        ).annotate(
+            # Greatest() skips the NULL score of items without a category.
+            similarity=Greatest(
+                TrigramWordSimilarity(query, 'name'),
+                TrigramWordSimilarity(query, 'category__name'),
+            )
+        ).order_by('-similarity', 'name')
+
+    def with_availability(self, start=None, end=None):
+        """
+        Annotates every item with `committed_quantity` and `damaged_quantity`,
+        so a whole page of items costs one query and no log scans.
+
+        Without dates, `committed_quantity` is the units reserved on
+        APPROVED requests plus the units checked out right now, read from
+        the EquipmentStock counters, so total - committed - damaged is what
+        can still be promised (the same number get_committed_quantity()
+        always gave). With `start` and `end` it is the units spoken for
+        within that window (see with_window_availability()).
+        """
+        damaged = Coalesce(F('stock__damaged'), 0, output_field=models.IntegerField())
+        if start is not None and end is not None:
+            return self.with_window_availability(start, end).annotate(
+                committed_quantity=F('window_committed'),
+                damaged_quantity=damaged,
+            )
+        return self.annotate(
+            committed_quantity=(
+                Coalesce(F('stock__reserved'), 0, output_field=models.IntegerField())
+                + Coalesce(F('stock__out'), 0, output_field=models.IntegerField())
+            ),
+            damaged_quantity=damaged,
+        )
+
+    def with_window_availability(self, start, end):
+        """
+        Annotates every item with `window_committed` and `window_available`:
+        how many units are spoken for, and how many are free, at some point
+        between `start` and `end` (inclusive dates).
+
+        - APPROVED lines count if their project's period overlaps the window
+          (served by the GiST index on RequestedItem.period).
+        - Units that are physically out count from checkout until they come
+          back: over their project's period, and over today if they are
+          still out after it.
+        - Damaged/lost units are out of every window.
+        Overlapping reservations are summed, so the result is conservative:
+        it never reports more free units than there really are.
+        """
+        window = DateRange(start, end, '[]')
+
+        reserved = RequestedItem.objects.filter(
+            item=OuterRef('pk'),
+            request__status='APPROVED'
+        ).filter(
+            # Lines without a project period reserve for every window.
+            Q(period__overlap=window) | Q(period__isnull=True)
+        ).order_by().values('item').annotate(total=Sum('quantity')).values('total')
+
+        # Gear that is out occupies [min(date_from, today), max(date_to, today)].
+        today = timezone.localdate()
+        occupies_window = Q()
+        if today > end:
+            occupies_window &= Q(request__project__date_from__lte=end)
+        if today < start:
+            occupies_window &= Q(request__project__date_to__gte=start)
+        out = CheckoutLog.objects.filter(
+            item=OuterRef('pk'),
+            request__status__in=['CHECKED_OUT', 'PARTIAL_RETURN'],
+            checked_in_at__isnull=True
+        )
+        if occupies_window:
+            # An empty Q() means the window contains today: every unit counts.
+            out = out.filter(occupies_window | Q(request__project__isnull=True))
+        out = out.order_by().values('item').annotate(total=Sum('quantity')).values('total')
+
+        return self.annotate(
+            window_committed=_coalesced(reserved) + _coalesced(out),
+            window_available=(
+                F('total_quantity')
+                - Coalesce(F('stock__damaged'), 0, output_field=models.IntegerField())
+                - F('window_committed')
+            ),
+        )
+
+    def with_utilization(self, start, end):
+        """
+        Annotates every item with its usage between `start` and `end`
+        (inclusive dates), summed from the EquipmentUsageDaily rollups:
+        `unit_days`, `checkouts`, `units_returned` and `units_damaged`.
+        Days after the last rollup count as unused.
+
+        Each total is a correlated subquery over the item's rows in the
+        range, served by the (item, day) unique index, so only the rows in
+        the range are read.
+        """
+        usage = EquipmentUsageDaily.objects.filter(
+            item=OuterRef('pk'), day__range=(start, end)
+        ).order_by().values('item')
+        return self.annotate(**{
+            name: _coalesced(usage.annotate(total=Sum(field)).values('total'))
+            for name, field in [
+                ('unit_days', 'units_out'),
+                ('checkouts', 'checkouts'),
+                ('units_returned', 'units_returned'),
+                ('units_damaged', 'units_damaged'),
+            ]
+        })
+
+    def with_logged_stock(self):
+        """
+        Annotates every item with `logged_reserved`, `logged_out` and
+        `logged_damaged` computed from RequestedItem and CheckoutLog.
+        This is the source of truth the EquipmentStock counters are rebuilt
+        from (see the reconcile_stock command); it scans the logs, so normal
+        reads should use with_availability() instead.
+        """
+        # Items on APPROVED requests: reserved but not yet physically out.
+        # PENDING requests do NOT reserve stock.
+        approved = RequestedItem.objects.filter(
+            item=OuterRef('pk'),
+            request__status='APPROVED'
+        ).order_by().values('item').annotate(total=Sum('quantity')).values('total')
+
+        # Items physically out of the building that have NOT been checked in.
+        checked_out = CheckoutLog.objects.filter(
+            item=OuterRef('pk'),
+            request__status__in=['CHECKED_OUT', 'PARTIAL_RETURN'],
+            checked_in_at__isnull=True
+        ).order_by().values('item').annotate(total=Sum('quantity')).values('total')
+
+        # Items returned DAMAGED or LOST are out of circulation until repaired.
+        damaged = CheckoutLog.objects.needs_repair().filter(
+            item=OuterRef('pk')
+        ).order_by().values('item').annotate(total=Sum('quantity')).values('total')
+
+        return self.annotate(
+            logged_reserved=_coalesced(approved),
+            logged_out=_coalesced(checked_out),
+            logged_damaged=_coalesced(damaged),
+        )
+
 class EquipmentItem(models.Model):
     """
     The master list of a specific piece of equipment.
@@ -31,57 +204,127 @@ class EquipmentItem(models.Model):
         related_name='items'
     )
     total_quantity = models.PositiveIntegerField(default=1)
+    # Serialized gear (cameras, lenses) is checked out and in one unit per log
+    # row; bulk gear (cables, batteries) gets one row per item with a quantity.
+    is_serialized = models.BooleanField(default=False)
+
+    objects = EquipmentItemQuerySet.as_manager()
     
     class Meta:
         ordering = ['category', 'name']
+        indexes = [
+            # Serves fuzzy catalog search (see EquipmentItemQuerySet.search).
+            GinIndex(fields=['name'], name='equip_item_name_trgm', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return f"{self.name} (Total: {self.total_quantity})"
+
+    def _load_availability(self):
+        """
+        Fallback for instances that were not loaded through with_availability().
+        Fetches both numbers in a single query and keeps them on the instance.
+        """
+        row = EquipmentItem.objects.with_availability().values(
+            'committed_quantity', 'damaged_quantity'
+        ).get(pk=self.pk)
+        self.committed_quantity = row['committed_quantity']
+        self.damaged_quantity = row['damaged_quantity']
     
     def get_committed_quantity(self):
         """
-        Calculates the total quantity of this item that is currently
-        committed (i.e., NOT available).
-        This includes items on APPROVED, CHECKED_OUT, or PARTIAL_RETURN requests.
-        PENDING requests do NOT reserve stock.
+        The quantity of this item that is NOT available: reserved on
+        APPROVED requests or checked out on CHECKED_OUT / PARTIAL_RETURN
+        ones. Items loaded through with_availability(start, end) count
+        only what is spoken for within those dates.
         """
-        
-        # 1. Count items on APPROVED requests (from RequestedItem)
-        # These are items that are reserved but not yet physically checked out.
-        approved_sum = RequestedItem.objects.filter(
-            item=self,
-            request__status='APPROVED'  # <-- PENDING is correctly removed
-        ).aggregate(total=Sum('quantity'))['total'] or 0
-        
-        # 2. Count items that are CHECKED_OUT or PARTIALLY_RETURNED (from CheckoutLog)
-        # These are items physically out of the building.
-        # We only count logs that have NOT been checked in.
-        checked_out_sum = CheckoutLog.objects.filter(
-            item=self,
-            request__status__in=['CHECKED_OUT', 'PARTIAL_RETURN'],
-            checked_in_at__isnull=True # Not yet returned
-        ).count() # .count() because each log is 1 item
-        
-        return approved_sum + checked_out_sum
+        if not hasattr(self, 'committed_quantity'):
+            self._load_availability()
+        return self.committed_quantity
     
     def get_damaged_quantity(self):
         """
-        Calculates total quantity of this item marked as DAMAGED or LOST.
+        The total quantity of this item marked as DAMAGED or LOST.
         These items are considered "out of circulation".
         """
-        damaged_sum = CheckoutLog.objects.filter(
-            item=self,
-            return_status__in=['DAMAGED', 'LOST']
-        ).count() # .count() because each log is 1 item
-        return damaged_sum
+        if not hasattr(self, 'damaged_quantity'):
+            self._load_availability()
+        return self.damaged_quantity
         
     @property
     def available_quantity(self):
         """
-        The actual available quantity: Total - Committed - Damaged.
+        The available quantity: Total - Committed - Damaged. Free of every
+        reservation, or free within the dates the item was loaded for.
         """
         return self.total_quantity - self.get_committed_quantity() - self.get_damaged_quantity()
 
+class EquipmentUnit(models.Model):
+    """
+    One physical unit of an EquipmentItem, identified by the serial /
+    barcode / QR tag stuck on it, so the desk can check gear in and out
+    by scanning.
+    """
+    item = models.ForeignKey(EquipmentItem, on_delete=models.CASCADE, related_name='units')
+    tag = models.CharField(max_length=100, unique=True)  # What the scanner reads
+    serial_number = models.CharField(max_length=100, blank=True)
+    is_active = models.BooleanField(default=True)  # Off for retired / written-off units
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['item', 'tag']
+
+    def __str__(self):
+        return f"{self.item.name} [{self.tag}]"
+
+class EquipmentStock(models.Model):
+    """
+    Running stock counters for one EquipmentItem, updated in the same
+    transaction as every approve / reject / checkout / check-in / repair.
+    available = total_quantity - out - damaged: the units on the shelf.
+    Reservations are tied to dates, so they are checked against the
+    project's window (see with_window_availability()), never against
+    `available`; `reserved` only keeps the total on APPROVED requests.
+    """
+    item = models.OneToOneField(
+        EquipmentItem,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stock'
+    )
+    reserved = models.IntegerField(default=0)  # On APPROVED requests
+    out = models.IntegerField(default=0)       # Checked out, not yet returned
+    damaged = models.IntegerField(default=0)   # Returned DAMAGED or LOST
+    available = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Equipment stock"
+
+    def __str__(self):
+        return f"{self.item.name}: {self.available} available"
+
+class StockChange(models.Model):
+    """
+    Append-only feed of stock changes: one row per item whose counters
+    moved, holding its new `available`. Its id is the event id of the
+    live availability stream (see equipment/live.py).
+    """
+    id = models.BigAutoField(primary_key=True)
+    # No constraint: the last change of a deleted item has to stay in the
+    # feed, so streams that are catching up still hear about it.
+    item = models.ForeignKey(
+        EquipmentItem, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+'
+    )
+    available = models.IntegerField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.pk} {self.item_id}: {self.available} available"
+
 class EquipmentRequest(models.Model):
     """
     The "header" for a request, linking a project and user.
@@ -109,11 +352,49 @@ class EquipmentRequest(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # The request queue: one status tab, newest first.
+            models.Index(fields=['status', '-created_at'], name='equip_request_status_idx'),
+            # The API's cursor pages: -created_at, ties broken on id.
+            models.Index(fields=['created_at', 'id'], name='equip_request_created_id_idx'),
+        ]
 
     def __str__(self):
         project_name = self.project.company_name if self.project else "No Project"
         return f"Request for {project_name} by {self.requested_by.username}"
 
+    def get_period(self):
+        """
+        The date window the equipment is needed for: the project's
+        date_from..date_to (inclusive), or None if there is no project.
+        """
+        if self.project is None:
+            return None
+        return DateRange(self.project.date_from, self.project.date_to, '[]')
+
+class RequestStatusCount(models.Model):
+    """
+    How many EquipmentRequests are in each status, kept in step by the
+    signals in equipment/signals.py, so the request queue's badges never
+    count the requests table.
+    """
+    status = models.CharField(max_length=20, choices=EquipmentRequest.STATUS_CHOICES, primary_key=True)
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.get_status_display()}: {self.count}"
+
+    @classmethod
+    def current(cls):
+        """
+        {status: count} for every status. Read straight from the table (a
+        handful of rows), so every worker sees a transition as soon as it
+        commits.
+        """
+        counts = {status: 0 for status, _ in EquipmentRequest.STATUS_CHOICES}
+        counts.update(cls.objects.values_list('status', 'count'))
+        return counts
+
 class RequestedItem(models.Model):
     """
     A specific "line item" on an EquipmentRequest.
@@ -130,17 +411,50 @@ class RequestedItem(models.Model):
         related_name='requests'
     )
     quantity = models.PositiveIntegerField(default=1)
+    # Copied from the request's project so availability can be checked with
+    # one indexed range-overlap query. Kept in sync by equipment/signals.py.
+    period = DateRangeField(null=True, blank=True, editable=False)
     
     class Meta:
         # A user can't add the same item twice to the same request
         unique_together = ('request', 'item')
+        indexes = [
+            GistIndex(fields=['period'], name='requesteditem_period_gist'),
+        ]
     
     def __str__(self):
         return f"{self.quantity} of {self.item.name}"
 
+    def save(self, *args, **kwargs):
+        self.period = self.request.get_period()
+        super().save(*args, **kwargs)
+
+# DAMAGED / LOST units that haven't been repaired (or found) yet: the
+# repair queue. Also the condition of the partial index that serves it.
+NEEDS_REPAIR = Q(return_status__in=['DAMAGED', 'LOST'], repaired_at__isnull=True)
+
+class CheckoutLogQuerySet(models.QuerySet):
+    def needs_repair(self):
+        return self.filter(NEEDS_REPAIR)
+
+    def overdue(self, today=None):
+        """
+        Open logs whose project ended before `today` (default: the local date).
+        """
+        today = today or timezone.localdate()
+        return self.filter(checked_in_at__isnull=True, request__project__date_to__lt=today)
+
 class CheckoutLog(models.Model):
     """
-    The master log. Each entry represents ONE single item.
+    The master log. Each entry represents `quantity` units of one item
+    handed out on a request (always 1 for serialized items).
+    While checked_in_at is empty the units are still out. Checking in only
+    some of them, or with mixed conditions, splits the row: the units that
+    came back move to new, closed rows with their return_status.
+    Units scanned at the desk get a row of their own, linked to their
+    EquipmentUnit.
+    DAMAGED / LOST rows stay in the repair queue until repaired_at is set;
+    repairing only some of the units splits the row the same way.
     """
     RETURN_STATUS_CHOICES = [
         ('GOOD', 'Good'),
@@ -150,17 +464,85 @@ class CheckoutLog(models.Model):
 
     request = models.ForeignKey(EquipmentRequest, on_delete=models.CASCADE, related_name='logs')
     item = models.ForeignKey(EquipmentItem, on_delete=models.PROTECT) # Don't delete item if it's in a log
+    quantity = models.PositiveIntegerField(default=1)
+    # The tagged unit handed out, when it was scanned (quantity is then 1).
+    unit = models.ForeignKey(EquipmentUnit, on_delete=models.PROTECT, null=True, blank=True, related_name='logs')
     
     checked_out_by = models.ForeignKey(User, related_name='checked_out_by', on_delete=models.SET_NULL, null=True)
-    checked_out_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: rows split off at check-in keep the original time.
+    checked_out_at = models.DateTimeField(default=timezone.now)
     
     checked_in_by = models.ForeignKey(User, related_name='checked_in_by', on_delete=models.SET_NULL, null=True, blank=True)
     checked_in_at = models.DateTimeField(null=True, blank=True)
     
     return_status = models.CharField(max_length=10, choices=RETURN_STATUS_CHOICES, null=True, blank=True)
+
+    repaired_by = models.ForeignKey(User, related_name='repaired_logs', on_delete=models.SET_NULL, null=True, blank=True)
+    repaired_at = models.DateTimeField(null=True, blank=True)
+
+    objects = CheckoutLogQuerySet.as_manager()
     
     class Meta:
         ordering = ['-checked_out_at']
+        indexes = [
+            # Only the open repair queue, so it stays small however long the log gets.
+            models.Index(fields=['item', 'checked_in_at'], name='checkoutlog_needs_repair_idx', condition=NEEDS_REPAIR),
+            # Only the gear that is still out, for the overdue scan.
+            models.Index(fields=['request'], name='checkoutlog_open_idx', condition=Q(checked_in_at__isnull=True)),
+        ]
+        constraints = [
+            # A unit can only be out once at a time. Also the index behind
+            # "who has this tag?" lookups.
+            models.UniqueConstraint(
+                fields=['unit'], condition=Q(checked_in_at__isnull=True), name='checkoutlog_one_open_per_unit'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} of {self.item.name} for request {self.request.id}"
+
+class EquipmentUsageDaily(models.Model):
+    """
+    One item's usage on one (local) day, rolled up from CheckoutLog by the
+    rollup_utilization command so reports never scan the logs.
+    Days without any activity for an item have no row.
+    """
+    item = models.ForeignKey(EquipmentItem, on_delete=models.CASCADE, related_name='usage')
+    day = models.DateField()
+
+    units_out = models.PositiveIntegerField(default=0)         # Units out at any time that day (unit-days)
+    checkouts = models.PositiveIntegerField(default=0)         # Times the item went out on a request
+    units_checked_out = models.PositiveIntegerField(default=0)
+    units_returned = models.PositiveIntegerField(default=0)
+    units_damaged = models.PositiveIntegerField(default=0)     # Returned DAMAGED or LOST
+
+    class Meta:
+        ordering = ['day', 'item']
+        verbose_name_plural = "Equipment usage (daily)"
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'day'], name='equip_usage_item_day_uniq'),
+        ]
+        indexes = [
+            # Date-range reports across all items.
+            models.Index(fields=['day'], name='equip_usage_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.item.name} on {self.day}: {self.units_out} out"
+
+class EquipmentUsageRollup(models.Model):
+    """
+    One rollup pass over `start`..`end` (inclusive), written in the same
+    transaction as its EquipmentUsageDaily rows. The latest `end` is how
+    far the rollups reach, including days that had no activity at all.
+    """
+    start = models.DateField()
+    end = models.DateField(db_index=True)
+    rows = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-end']
 
     def __str__(self):
-        return f"1 of {self.item.name} for request {self.request.id}"
\ No newline at end of file
+        return f"{self.start} to {self.end}: {self.rows} row(s)"
@@ -0,0 +1,293 @@
+# equipment/pdf.py
+#
+# Renders checkout sheets to PDF for every download / email / print path.
+# Rendered files are cached under a hash of everything the sheet shows,
+# so handing out an unchanged sheet again costs no WeasyPrint render.
+# WeasyPrint itself is imported on first render, so workers that never
+# print don't pay for loading it.
+# render_checkout_sheets() merges many sheets into one PDF for batch
+# printing. Small batches render in the request; larger ones are rendered
+# by the outbox worker when the print email is sent, in parallel in a
+# process pool.
+
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import get_template, render_to_string
+
+from core.models import OutboundAttachment
+from core.outbox import queue_email
+from .models import EquipmentRequest
+
+CHECKOUT_SHEET_TEMPLATE = 'equipment/checkout_sheet.html'
+CHECKOUT_SHEET_STYLESHEET = 'equipment/checkout_sheet.css'
+# Most sheets one batch print may merge.
+BATCH_PRINT_LIMIT = 100
+# A batch with more sheets to render than this is rendered when its email
+# is sent (see core/outbox.py), not inside the HTTP request.
+INLINE_RENDER_LIMIT = 10
+# Processes the outbox worker renders a large batch with.
+BATCH_RENDER_WORKERS = os.cpu_count() or 1
+
+_local = threading.local()
+
+
+def _template_source(name):
+    return get_template(name).template.source
+
+
+class CheckoutSheetRenderer:
+    """
+    Keeps the parts of a WeasyPrint render that don't depend on the sheet:
+    the stylesheet, parsed once into a CSS object, and one FontConfiguration.
+    Building these is a large share of a cold render, so each worker thread
+    keeps one renderer for its lifetime (see get_renderer()).
+    Pass `stylesheet_source` where the template loaders aren't available.
+    """
+    def __init__(self, stylesheet_source=None):
+        from weasyprint import CSS
+        from weasyprint.text.fonts import FontConfiguration
+
+        if stylesheet_source is None:
+            stylesheet_source = _template_source(CHECKOUT_SHEET_STYLESHEET)
+        self.font_config = FontConfiguration()
+        self.stylesheet = CSS(string=stylesheet_source, font_config=self.font_config)
+
+    def write_pdf(self, html_string):
+        from weasyprint import HTML
+
+        return HTML(string=html_string).write_pdf(
+            stylesheets=[self.stylesheet],
+            font_config=self.font_config
+        )
+
+
+def get_renderer():
+    """
+    The current thread's CheckoutSheetRenderer, built on first use.
+    """
+    renderer = getattr(_local, 'renderer', None)
+    if renderer is None:
+        renderer = _local.renderer = CheckoutSheetRenderer()
+    return renderer
+
+
+def render_checkout_sheet_html(req, pdf=False):
+    """
+    The sheet's HTML. With pdf=True the stylesheet is left out, because
+    the renderer applies its precompiled copy.
+    """
+    return render_to_string(CHECKOUT_SHEET_TEMPLATE, {'request': req, 'pdf': pdf})
+
+
+def checkout_sheet_key(req):
+    """
+    A content hash of the checkout sheet: the request's status and header
+    fields, its lines, its checkout logs and the template and stylesheet.
+    Anything that changes the printed sheet changes the key.
+    """
+    header = EquipmentRequest.objects.filter(pk=req.pk).values_list(
+        'status', 'created_at', 'project__company_name', 'requested_by__username'
+    ).first()
+    lines = req.items.order_by('pk').values_list(
+        'item_id', 'item__name', 'item__category__name', 'quantity'
+    )
+    logs = req.logs.order_by('pk').values_list(
+        'pk', 'item_id', 'quantity', 'checked_out_by__username', 'checked_out_at',
+        'checked_in_at', 'return_status'
+    )
+    content = json.dumps(
+        [
+            req.pk, header, list(lines), list(logs),
+            _template_source(CHECKOUT_SHEET_TEMPLATE),
+            _template_source(CHECKOUT_SHEET_STYLESHEET),
+        ],
+        default=str
+    )
+    return 'checkout-sheet:' + hashlib.sha256(content.encode()).hexdigest()
+
+
+def render_checkout_sheet(req):
+    """
+    Returns the checkout sheet for `req` as PDF bytes, from the
+    'checkout_sheets' cache when the sheet hasn't changed since it was
+    last rendered.
+    """
+    cache = caches['checkout_sheets']
+    key = checkout_sheet_key(req)
+    pdf_file = cache.get(key)
+    if pdf_file is None:
+        pdf_file = get_renderer().write_pdf(render_checkout_sheet_html(req, pdf=True))
+        cache.set(key, pdf_file)
+    return pdf_file
+
+
+def checkout_sheet_attachment(request_id):
+    """
+    Outbox attachment builder (see core/outbox.py): the current checkout
+    sheet of request #`request_id`, built when the email is sent.
+    """
+    return render_checkout_sheet(EquipmentRequest.objects.get(pk=request_id))
+
+
+def queued_checkout_sheet(req, filename=None):
+    """
+    An unsaved OutboundAttachment that renders the sheet at send time.
+    """
+    return OutboundAttachment(
+        filename=filename or f'checkout_request_{req.pk}.pdf',
+        mimetype='application/pdf',
+        builder='equipment.pdf.checkout_sheet_attachment',
+        builder_args=[req.pk],
+    )
+
+
+# --- Batch printing ---
+
+def cached_checkout_sheets(requests):
+    """
+    ({request_id: cache key}, {cache key: pdf_bytes}) for the sheets of
+    `requests` that are already in the 'checkout_sheets' cache.
+    """
+    keys = {req.pk: checkout_sheet_key(req) for req in requests}
+    return keys, caches['checkout_sheets'].get_many(list(keys.values()))
+
+
+# Set in each pool worker by _init_pool_worker().
+_pool_renderer = None
+
+
+def _init_pool_worker(stylesheet_source):
+    global _pool_renderer
+    _pool_renderer = CheckoutSheetRenderer(stylesheet_source)
+
+
+def _timed_render(renderer, html_string):
+    started = time.perf_counter()
+    pdf_file = renderer.write_pdf(html_string)
+    return pdf_file, (time.perf_counter() - started) * 1000
+
+
+def _render_in_pool_worker(html_string):
+    return _timed_render(_pool_renderer, html_string)
+
+
+def render_checkout_sheets(requests, cached=None, workers=1):
+    """
+    Renders the checkout sheets of `requests` and merges them, in order,
+    into one PDF with a bookmark per request.
+
+    Sheets already in the 'checkout_sheets' cache are reused (pass
+    `cached`, from cached_checkout_sheets(), if it was already looked up).
+    The rest have their HTML built here (it needs the database) and are
+    turned into PDFs with this thread's warm renderer, or, with
+    `workers` > 1, in parallel by a pool of that many forked processes,
+    each holding one renderer. The pool processes only run WeasyPrint and
+    never touch the database. Rendered sheets are cached as usual.
+
+    Returns (pdf_bytes, page_count, timings), where timings has one
+    {'request', 'ms', 'cached'} dict per sheet.
+    """
+    from pypdf import PdfWriter
+
+    keys, pdf_files = cached or cached_checkout_sheets(requests)
+    timings = {req.pk: {'request': req.pk, 'ms': 0.0, 'cached': True} for req in requests}
+
+    pending = [req for req in requests if keys[req.pk] not in pdf_files]
+    html_strings = [render_checkout_sheet_html(req, pdf=True) for req in pending]
+    if workers > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(pending)),
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_pool_worker,
+            initargs=(_template_source(CHECKOUT_SHEET_STYLESHEET),),
+        ) as pool:
+            rendered = list(pool.map(_render_in_pool_worker, html_strings))
+    else:
+        rendered = [_timed_render(get_renderer(), html_string) for html_string in html_strings]
+    for req, (pdf_file, ms) in zip(pending, rendered):
+        pdf_files[keys[req.pk]] = pdf_file
+        timings[req.pk].update(ms=round(ms, 1), cached=False)
+    if pending:
+        caches['checkout_sheets'].set_many({keys[req.pk]: pdf_files[keys[req.pk]] for req in pending})
+
+    writer = PdfWriter()
+    for req in requests:
+        writer.append(io.BytesIO(pdf_files[keys[req.pk]]), outline_item=f"Request #{req.pk}")
+    merged = io.BytesIO()
+    writer.write(merged)
+    return merged.getvalue(), len(writer.pages), [timings[req.pk] for req in requests]
+
+
+def batch_print_details(pages, timings, started):
+    """
+    What a batch print reports on its delivery (OutboundEmail.details).
+    """
+    return {'pages': pages, 'total_ms': round((time.perf_counter() - started) * 1000, 1), 'sheets': timings}
+
+
+def checkout_sheets_attachment(request_ids):
+    """
+    Outbox attachment builder: the merged checkout sheets of `request_ids`,
+    in order, rendered in a pool of BATCH_RENDER_WORKERS processes when the
+    email is sent. Also returns the batch's details for the delivery.
+    """
+    started = time.perf_counter()
+    found = EquipmentRequest.objects.in_bulk(request_ids)
+    pdf_file, pages, timings = render_checkout_sheets(
+        [found[pk] for pk in request_ids if pk in found], workers=BATCH_RENDER_WORKERS
+    )
+    return pdf_file, batch_print_details(pages, timings, started)
+
+
+def queue_batch_print(request_ids, user=None):
+    """
+    Merges the checkout sheets of `request_ids` (in the given order) into
+    one PDF and queues it for settings.PRINTER_EMAIL as a single email.
+    Raises ValueError for an empty or oversized list or unknown ids.
+    Returns (delivery, page_count, timings); see render_checkout_sheets().
+    When more than INLINE_RENDER_LIMIT sheets need rendering, the PDF is
+    built by the outbox worker instead, and page_count is None and
+    timings empty; the delivery's `details` get them once it is sent.
+    """
+    started = time.perf_counter()
+    try:
+        request_ids = list(dict.fromkeys(int(pk) for pk in request_ids))
+    except (TypeError, ValueError):
+        raise ValueError("Request ids must be whole numbers.")
+    if not request_ids:
+        raise ValueError("Select at least one request to print.")
+    if len(request_ids) > BATCH_PRINT_LIMIT:
+        raise ValueError(f"Can print at most {BATCH_PRINT_LIMIT} checkout sheets at once.")
+    found = EquipmentRequest.objects.in_bulk(request_ids)
+    missing = [pk for pk in request_ids if pk not in found]
+    if missing:
+        raise ValueError(f"Unknown request(s): {', '.join(map(str, missing))}.")
+
+    requests = [found[pk] for pk in request_ids]
+    cached = cached_checkout_sheets(requests)
+    attachment = OutboundAttachment(filename='checkout_sheets_batch.pdf', mimetype='application/pdf')
+    if len(requests) - len(cached[1]) > INLINE_RENDER_LIMIT:
+        attachment.builder = 'equipment.pdf.checkout_sheets_attachment'
+        attachment.builder_args = [request_ids]
+        pages, timings, details = None, [], {}
+    else:
+        attachment.content, pages, timings = render_checkout_sheets(requests, cached)
+        details = batch_print_details(pages, timings, started)
+    delivery = queue_email(
+        subject=f"PRINT: {len(request_ids)} Equipment Checkout Sheets",
+        body='',
+        to=[settings.PRINTER_EMAIL],
+        attachments=[attachment],
+        user=user,
+        details=details,
+    )
+    return delivery, pages, timings
@@ -0,0 +1,167 @@
+# equipment/scanning.py
+#
+# The scan-to-checkout desk flow. A list of scanned asset tags is applied
+# to a request SCAN_BATCH_SIZE scans at a time, each batch in its own
+# transaction with one lookup for all of its tags. A bad scan (an unknown
+# tag, a unit that is out elsewhere) is reported and skipped instead of
+# failing its batch.
+# Stock moves through workflow.checkout() / workflow.checkin() as usual.
+
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+
+from . import workflow
+from .models import CheckoutLog, EquipmentUnit
+
+SCAN_BATCH_SIZE = 100
+# Times a scan-out batch is re-run after losing a race for a unit.
+SCAN_OUT_ATTEMPTS = 3
+
+
+def _batches(scans):
+    for start in range(0, len(scans), SCAN_BATCH_SIZE):
+        yield scans[start:start + SCAN_BATCH_SIZE]
+
+
+def _failed(tag, error):
+    return {'tag': tag, 'ok': False, 'error': error}
+
+
+def scan_out(req, user, tags):
+    """
+    Hands out the units behind `tags` on `req`. Each unit takes the place
+    of one untagged unit of its item that is out on the request (split
+    off its row if the row holds several). An APPROVED request is checked
+    out first. Returns one {'tag', 'ok', 'item' / 'error'} per scan.
+    """
+    if req.status == 'APPROVED':
+        workflow.checkout(req, user)
+    results = []
+    for batch in _batches(tags):
+        try:
+            results += _scan_out_batch(req, batch)
+        except workflow.WorkflowError as e:
+            results += [_failed(tag, str(e)) for tag in batch]
+    return results
+
+
+def _scan_out_batch(req, tags):
+    """
+    The same unit scanned out at another desk can commit between this
+    batch's check and its write. The one-open-log-per-unit constraint then
+    rejects the batch, and it is re-run: the check now sees the unit out
+    and reports it like any other unit that is already out.
+    """
+    for _ in range(SCAN_OUT_ATTEMPTS):
+        try:
+            return _apply_scan_out_batch(req, tags)
+        except IntegrityError:
+            continue
+    raise workflow.WorkflowError("These units were being scanned at another desk at the same time. Scan them again.")
+
+
+def _apply_scan_out_batch(req, tags):
+    with transaction.atomic():
+        req = workflow.lock_request(req, ['CHECKED_OUT', 'PARTIAL_RETURN'])
+        units = EquipmentUnit.objects.select_related('item').in_bulk(tags, field_name='tag')
+        out_on = dict(
+            CheckoutLog.objects.filter(unit__in=units.values(), checked_in_at__isnull=True)
+            .values_list('unit_id', 'request_id')
+        )
+        # Untagged units still out on this request, oldest rows first.
+        untagged = defaultdict(list)
+        for log in CheckoutLog.objects.select_for_update().filter(
+            request=req,
+            item__in={unit.item_id for unit in units.values()},
+            unit__isnull=True,
+            checked_in_at__isnull=True,
+        ).order_by('checked_out_at', 'pk'):
+            untagged[log.item_id].append(log)
+
+        results, to_update, to_create = [], {}, []
+        for tag in tags:
+            unit = units.get(tag)
+            if unit is None:
+                results.append(_failed(tag, "Unknown tag."))
+                continue
+            if not unit.is_active:
+                results.append(_failed(tag, f"{unit} is retired."))
+                continue
+            if unit.pk in out_on:
+                results.append(_failed(tag, f"{unit} is already out on request #{out_on[unit.pk]}."))
+                continue
+            if not untagged[unit.item_id]:
+                results.append(_failed(tag, f"No more {unit.item.name} to hand out on this request."))
+                continue
+
+            log = untagged[unit.item_id][0]
+            if log.quantity == 1:
+                log.unit = unit
+                untagged[unit.item_id].pop(0)
+            else:
+                log.quantity -= 1
+                to_create.append(
+                    CheckoutLog(
+                        request=req,
+                        item_id=log.item_id,
+                        quantity=1,
+                        unit=unit,
+                        checked_out_by_id=log.checked_out_by_id,
+                        checked_out_at=log.checked_out_at
+                    )
+                )
+            to_update[log.pk] = log
+            out_on[unit.pk] = req.pk
+            results.append({'tag': tag, 'ok': True, 'item': unit.item.name})
+
+        CheckoutLog.objects.bulk_update(to_update.values(), ['unit', 'quantity'])
+        CheckoutLog.objects.bulk_create(to_create)
+    return results
+
+
+def scan_in(req, user, scans):
+    """
+    Checks in the units behind `scans`, a list of (tag, return_status)
+    pairs, on `req`. Returns one {'tag', 'ok', 'item' / 'error'} per scan.
+    """
+    results = []
+    for batch in _batches(scans):
+        try:
+            results += _scan_in_batch(req, user, batch)
+        except workflow.WorkflowError as e:
+            results += [_failed(tag, str(e)) for tag, _ in batch]
+    return results
+
+
+def _scan_in_batch(req, user, scans):
+    with transaction.atomic():
+        # One probe per tag: the unique tag index, then the open-unit index.
+        open_logs = {
+            tag: (log_id, request_id, item_name)
+            for tag, log_id, request_id, item_name in CheckoutLog.objects.filter(
+                unit__tag__in=[tag for tag, _ in scans], checked_in_at__isnull=True
+            ).values_list('unit__tag', 'pk', 'request_id', 'item__name')
+        }
+
+        results, returns = [], {}
+        for tag, return_status in scans:
+            if return_status not in workflow.RETURN_STATUSES:
+                results.append(_failed(tag, f"Invalid return condition: {return_status}."))
+                continue
+            if tag not in open_logs:
+                results.append(_failed(tag, "This tag is not checked out."))
+                continue
+            log_id, request_id, item_name = open_logs[tag]
+            if request_id != req.pk:
+                results.append(_failed(tag, f"This unit is out on request #{request_id}."))
+                continue
+            if log_id in returns:
+                results.append(_failed(tag, "Scanned twice."))
+                continue
+            returns[log_id] = {return_status: 1}
+            results.append({'tag': tag, 'ok': True, 'item': item_name})
+
+        if returns:
+            workflow.checkin(req, user, logs=returns)
+    return results
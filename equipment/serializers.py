@@ -2,7 +2,7 @@
 # (Complete, Updated File)
 
 from rest_framework import serializers
-from .models import EquipmentItem, EquipmentCategory, EquipmentRequest, RequestedItem, CheckoutLog
+from .models import EquipmentItem, EquipmentCategory, EquipmentRequest, RequestedItem, CheckoutLog, EquipmentUnit
 from users.serializers import UserSerializer
 from projects.serializers import ProjectSerializer
 from projects.models import Project
@@ -38,10 +38,12 @@ class EquipmentItemSerializer(serializers.ModelSerializer):
     available_quantity = serializers.IntegerField(read_only=True)
     damaged_quantity = serializers.IntegerField(source='get_damaged_quantity', read_only=True)
     committed_quantity = serializers.IntegerField(source='get_committed_quantity', read_only=True)
+    # Only present on ?search= results (see EquipmentItemQuerySet.search).
+    similarity = serializers.FloatField(read_only=True)
 
     class Meta:
         model = EquipmentItem
-        fields = ['id', 'name', 'category', 'total_quantity', 'available_quantity', 'damaged_quantity', 'committed_quantity']
+        fields = ['id', 'name', 'category', 'total_quantity', 'is_serialized', 'available_quantity', 'damaged_quantity', 'committed_quantity', 'similarity']
 
     def to_representation(self, instance):
         response = super().to_representation(instance)
@@ -60,21 +62,37 @@ class RequestedItemSerializer(serializers.ModelSerializer):
         response['item'] = EquipmentItemSerializer(instance.item).data
         return response
 
+class EquipmentUnitSerializer(serializers.ModelSerializer):
+    item_name = serializers.CharField(source='item.name', read_only=True)
+    custody = serializers.SerializerMethodField()
+
+    class Meta:
+        model = EquipmentUnit
+        fields = ['id', 'tag', 'serial_number', 'item', 'item_name', 'is_active', 'custody']
+
+    def get_custody(self, obj):
+        """
+        Where the unit is right now: its open checkout, or None if it's in.
+        """
+        log = next(iter(obj.open_logs), None)
+        if log is None:
+            return None
+        return {
+            'log_id': log.pk,
+            'request': log.request_id,
+            'project': log.request.project.company_name if log.request.project else None,
+            'checked_out_by': SimpleUserSerializer(log.checked_out_by).data if log.checked_out_by else None,
+            'checked_out_at': log.checked_out_at,
+        }
+
 class CheckoutLogSerializer(serializers.ModelSerializer):
     item = serializers.PrimaryKeyRelatedField(queryset=EquipmentItem.objects.all())
     checked_out_by = serializers.PrimaryKeyRelatedField(read_only=True)
-    
-    # FIX 2: Manually add 'quantity' back to the API response (always 1)
-    # This prevents frontend crashes if it tries to read log.quantity
-    quantity = serializers.SerializerMethodField()
 
     class Meta:
         model = CheckoutLog
         fields = '__all__'
 
-    def get_quantity(self, obj):
-        return 1
-
     def to_representation(self, instance):
         response = super().to_representation(instance)
         response['item'] = EquipmentItemSerializer(instance.item).data
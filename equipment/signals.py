@@ -0,0 +1,89 @@
+# equipment/signals.py
+#
+# Keeps the EquipmentStock counters in step with EquipmentItem itself,
+# the RequestedItem periods in step with their project's dates, and the
+# RequestStatusCount counters in step with every request's status.
+
+from django.db.models import F
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from django.db.backends.postgresql.psycopg_any import DateRange
+from projects.models import Project
+from .models import EquipmentItem, EquipmentStock, EquipmentRequest, RequestedItem, RequestStatusCount, StockChange
+from .workflow import record_stock_changes
+
+@receiver(post_save, sender=EquipmentItem)
+def sync_stock_counters(sender, instance, created, **kwargs):
+    """
+    Create the counter row for a new item, or re-derive `available`
+    when an admin changes the item's total_quantity.
+    """
+    if created:
+        EquipmentStock.objects.create(item=instance, available=instance.total_quantity)
+    else:
+        EquipmentStock.objects.filter(item=instance).update(
+            available=instance.total_quantity - F('out') - F('damaged')
+        )
+    record_stock_changes([instance.pk])
+
+@receiver(post_delete, sender=EquipmentItem)
+def drop_deleted_item_availability(sender, instance, **kwargs):
+    """
+    Streams and snapshots drop a deleted item when its last change says
+    nothing is left; StockChange rows outlive their item for this.
+    """
+    StockChange.objects.create(item_id=instance.pk, available=0)
+
+@receiver(post_save, sender=Project)
+def sync_requested_item_periods(sender, instance, created, **kwargs):
+    """
+    Move every line of the project's equipment requests to the new dates.
+    Gear that is reserved or out moves between windows with them, so those
+    items go on the StockChange feed.
+    """
+    if created:
+        return
+    period = DateRange(instance.date_from, instance.date_to, '[]')
+    moved = RequestedItem.objects.filter(request__project=instance).exclude(period=period)
+    item_ids = set(
+        moved.filter(request__status__in=['APPROVED', 'CHECKED_OUT', 'PARTIAL_RETURN'])
+        .values_list('item_id', flat=True)
+    )
+    moved.update(period=period)
+    record_stock_changes(item_ids)
+
+def _count_statuses(deltas):
+    """
+    Applies {status: +n/-n} to the RequestStatusCount rows, in a fixed
+    order so concurrent transitions can't deadlock on them. A missing row
+    is created first; get_or_create() copes with a parallel transition
+    creating it at the same time.
+    """
+    for status, delta in sorted(deltas.items()):
+        if delta and not RequestStatusCount.objects.filter(status=status).update(count=F('count') + delta):
+            RequestStatusCount.objects.get_or_create(status=status)
+            RequestStatusCount.objects.filter(status=status).update(count=F('count') + delta)
+
+@receiver(post_init, sender=EquipmentRequest)
+def remember_status(sender, instance, **kwargs):
+    """
+    Note the status a request was loaded with, to spot transitions on save.
+    """
+    instance._saved_status = instance.__dict__.get('status') if instance.pk else None
+
+@receiver(post_save, sender=EquipmentRequest)
+def count_status_change(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        deltas = {instance.status: 1}
+    else:
+        old = instance._saved_status
+        if old is None or old == instance.status or (update_fields is not None and 'status' not in update_fields):
+            return
+        deltas = {old: -1, instance.status: 1}
+    instance._saved_status = instance.status
+    _count_statuses(deltas)
+
+@receiver(post_delete, sender=EquipmentRequest)
+def count_deleted_request(sender, instance, **kwargs):
+    if instance._saved_status is not None:
+        _count_statuses({instance._saved_status: -1})
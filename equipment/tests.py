@@ -1,3 +1,769 @@
-from django.test import TestCase
+import io
+import random
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from pypdf import PdfReader, PdfWriter
+from rest_framework.test import APIClient
+from core import outbox
+from core.models import OutboundEmail
+from projects.models import Project
+from .models import (
+    EquipmentCategory, EquipmentItem, EquipmentStock, EquipmentRequest, EquipmentUnit, RequestedItem, CheckoutLog, StockChange,
+    RequestStatusCount,
+)
+from .forms import RequestItemFormSet
+from . import live, pdf, scanning, utilization, workflow
+
+
+def make_project(starts_in, days=3):
+    """
+    A project running `days` days, starting `starts_in` days from today.
+    """
+    date_from = timezone.localdate() + timedelta(days=starts_in)
+    return Project.objects.create(
+        company_name=f"Shoot in {starts_in} days",
+        date_from=date_from,
+        date_to=date_from + timedelta(days=days - 1),
+        location="Nairobi",
+        contact_person="Producer",
+        charges=1000,
+    )
+
+
+def make_request(project, user, *lines):
+    """
+    A PENDING request for `project` with (item, quantity) lines.
+    """
+    req = EquipmentRequest.objects.create(project=project, requested_by=user)
+    RequestedItem.objects.bulk_create([
+        RequestedItem(request=req, item=item, quantity=quantity, period=req.get_period())
+        for item, quantity in lines
+    ])
+    return req
+
+
+def stock(item):
+    return EquipmentStock.objects.values('reserved', 'out', 'damaged', 'available').get(item=item)
+
+
+class AvailabilitySnapshotTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('desk', password='secret', is_staff=True)
+        self.client.force_login(self.user)
+        self.item = EquipmentItem.objects.create(name='Camera', total_quantity=5)
+
+    def get_snapshot(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(reverse('availability-snapshot'), **headers)
+
+    def test_revalidates_with_304_until_stock_changes(self):
+        response = self.get_snapshot()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['items'], {str(self.item.pk): 5})
+        self.assertEqual(self.get_snapshot(response['ETag']).status_code, 304)
+
+    def test_change_made_by_another_worker_moves_the_etag(self):
+        etag = self.get_snapshot()['ETag']
+        # Nothing in this process hears about the change; only the table moves.
+        EquipmentStock.objects.filter(item=self.item).update(available=3)
+        StockChange.objects.create(item=self.item, available=3)
+
+        response = self.get_snapshot(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['items'], {str(self.item.pk): 3})
+
+    def test_change_committed_below_the_latest_id_moves_the_etag(self):
+        first = StockChange.objects.create(item=self.item, available=5)
+        late_id = first.pk + 1
+        StockChange.objects.create(id=late_id + 1, item=self.item, available=5)
+        etag = self.get_snapshot()['ETag']
+
+        EquipmentStock.objects.filter(item=self.item).update(available=2)
+        StockChange.objects.create(id=late_id, item=self.item, available=2)
+        response = self.get_snapshot(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['items'], {str(self.item.pk): 2})
+
+    def test_deleted_item_leaves_a_last_change(self):
+        etag = self.get_snapshot()['ETag']
+        item_id = self.item.pk
+        self.item.delete()
+
+        change = StockChange.objects.order_by('-id').first()
+        self.assertEqual((change.item_id, change.available), (item_id, 0))
+        response = self.get_snapshot(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['items'], {})
+
+
+@mock.patch.multiple(live, POLL_SECONDS=0.05, WSGI_STREAM_SECONDS=1)
+class AvailabilityStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('desk', password='secret', is_staff=True)
+        self.client.force_login(self.user)
+        self.item = EquipmentItem.objects.create(name='Camera', total_quantity=5)
+
+    def test_changes_arrive_while_the_stream_is_open(self):
+        since = live.latest_change_id()
+        response = self.client.get(reverse('availability-stream'), {'since': since})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        messages = iter(response.streaming_content)
+        self.assertEqual(next(messages), f"retry: {live.RETRY_MS}\n\n".encode())
+
+        started = time.monotonic()
+        EquipmentStock.objects.filter(item=self.item).update(available=4)
+        change = StockChange.objects.create(item=self.item, available=4)
+        message = next(messages).decode()
+        # Sent by the next poll, long before the response ends.
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertIn(f"id: {change.pk}\nevent: stock\n", message)
+        self.assertIn(f'"item": {self.item.pk}, "available": 4', message)
+        self.assertEqual(list(messages), [])
+
+    def test_replays_changes_after_last_event_id(self):
+        first = StockChange.objects.create(item=self.item, available=4)
+        second = StockChange.objects.create(item=self.item, available=3)
+        response = self.client.get(reverse('availability-stream'), HTTP_LAST_EVENT_ID=str(first.pk))
+        messages = iter(response.streaming_content)
+        next(messages)
+        self.assertIn(f"id: {second.pk}\n", next(messages).decode())
+        self.assertEqual(list(messages), [])
+
+
+class CatalogSearchTests(TestCase):
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest("needs the pg_trgm extension")
+
+    def test_pages_through_tied_scores_once(self):
+        user = User.objects.create_user('desk', password='secret', is_staff=True)
+        lenses = EquipmentCategory.objects.create(name='Lenses')
+        # Matched through the category only, so all five share one score.
+        for name in ['Prime 50', 'Prime 85', 'Zoom 24-70', 'Zoom 70-200', 'Macro 100']:
+            EquipmentItem.objects.create(name=name, category=lenses, total_quantity=1)
+        api = APIClient()
+        api.force_authenticate(user)
+
+        names, url = [], '/api/v1/equipment/items/?search=lenses&page_size=2'
+        for _ in range(5):
+            body = api.get(url).json()
+            names += [item['name'] for item in body['results']]
+            url = body['next']
+            if not url:
+                break
+        self.assertEqual(names, ['Macro 100', 'Prime 50', 'Prime 85', 'Zoom 24-70', 'Zoom 70-200'])
+
+
+class WindowAvailabilityTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('desk', password='secret', is_staff=True)
+        self.item = EquipmentItem.objects.create(name='Light', total_quantity=5)
+        self.this_week = make_project(starts_in=2)
+        self.next_month = make_project(starts_in=30)
+        self.overlapping = make_project(starts_in=3)
+
+    def test_non_overlapping_windows_each_get_the_full_stock(self):
+        workflow.approve(make_request(self.this_week, self.user, (self.item, 5)))
+        workflow.approve(make_request(self.next_month, self.user, (self.item, 5)))
+
+        with self.assertRaises(workflow.InsufficientStock):
+            workflow.approve(make_request(self.overlapping, self.user, (self.item, 1)))
+        # Reserving never takes units off the shelf.
+        self.assertEqual(stock(self.item), {'reserved': 10, 'out': 0, 'damaged': 0, 'available': 5})
+
+    def test_checkout_and_checkin_move_units_off_and_onto_the_shelf(self):
+        req = workflow.approve(make_request(self.this_week, self.user, (self.item, 5)))
+        workflow.checkout(req, self.user)
+        self.assertEqual(stock(self.item), {'reserved': 0, 'out': 5, 'damaged': 0, 'available': 0})
+
+        workflow.checkin(req, self.user, items={self.item.pk: {'DAMAGED': 1, 'GOOD': None}})
+        self.assertEqual(stock(self.item), {'reserved': 0, 'out': 0, 'damaged': 1, 'available': 4})
+
+    def test_window_numbers_for_the_list_api_and_snapshot(self):
+        workflow.approve(make_request(self.next_month, self.user, (self.item, 4)))
+        self.client.force_login(self.user)
+
+        any_dates = self.client.get(reverse('equipment-list'))
+        self.assertEqual(any_dates.context['items'][0].available_quantity, 1)
+        in_window = self.client.get(reverse('equipment-list'), {'project': self.next_month.pk})
+        self.assertEqual(in_window.context['items'][0].available_quantity, 1)
+
+        snapshot = self.client.get(reverse('availability-snapshot'), {'project': self.next_month.pk})
+        self.assertEqual(snapshot.json()['items'], {str(self.item.pk): 1})
+        snapshot = self.client.get(reverse('availability-snapshot'), {'project': self.this_week.pk})
+        self.assertEqual(snapshot.json()['items'], {str(self.item.pk): 5})
+
+        api = APIClient()
+        api.force_authenticate(self.user)
+        response = api.get('/api/v1/equipment/items/', {'project': self.next_month.pk})
+        self.assertEqual(response.json()['results'][0]['available_quantity'], 1)
+
+    def test_without_dates_reservations_and_checkouts_are_both_committed(self):
+        workflow.approve(make_request(self.next_month, self.user, (self.item, 2)))
+        workflow.checkout(workflow.approve(make_request(self.this_week, self.user, (self.item, 1))), self.user)
+
+        item = EquipmentItem.objects.with_availability().get()
+        self.assertEqual((item.get_committed_quantity(), item.available_quantity), (3, 2))
+        # Loaded without with_availability(), the fallback agrees.
+        self.assertEqual(EquipmentItem.objects.get().available_quantity, 2)
+
+        api = APIClient()
+        api.force_authenticate(self.user)
+        listed = api.get('/api/v1/equipment/items/').json()['results'][0]
+        self.assertEqual((listed['committed_quantity'], listed['available_quantity']), (3, 2))
+        self.client.force_login(User.objects.create_superuser('admin', password='secret'))
+        admin = self.client.get(reverse('admin:equipment_equipmentitem_changelist'))
+        self.assertContains(admin, '<td class="field-available_quantity">2</td>', html=True)
+
+    def test_moving_a_project_reports_its_reserved_items(self):
+        workflow.approve(make_request(self.next_month, self.user, (self.item, 4)))
+        latest = StockChange.objects.order_by('-id').first().pk
+
+        self.next_month.date_from = self.this_week.date_from
+        self.next_month.save()
+        self.assertTrue(StockChange.objects.filter(id__gt=latest, item=self.item).exists())
+        with self.assertRaises(workflow.InsufficientStock):
+            workflow.approve(make_request(self.this_week, self.user, (self.item, 2)))
+
+    def test_availability_api_rejects_bad_ids(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        window = {'from': self.this_week.date_from, 'to': self.this_week.date_to}
+        response = api.get('/api/v1/equipment/items/availability/', {**window, 'item': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        response = api.get('/api/v1/equipment/items/availability/', {**window, 'category': '1x'})
+        self.assertEqual(response.status_code, 400)
+        response = api.get('/api/v1/equipment/items/availability/', {**window, 'item': self.item.pk})
+        self.assertEqual(response.json()['items'][0]['available_quantity'], 5)
+
+
+class RequestItemFormSetTests(TestCase):
+    def setUp(self):
+        self.project = make_project(starts_in=2)
+        self.lens = EquipmentItem.objects.create(name='Lens', total_quantity=5)
+        self.tripod = EquipmentItem.objects.create(name='Tripod', total_quantity=3)
+        self.light = EquipmentItem.objects.create(name='Light', total_quantity=10)
+
+    def formset(self, *lines):
+        data = {
+            'items-TOTAL_FORMS': len(lines), 'items-INITIAL_FORMS': 0,
+            'items-MIN_NUM_FORMS': 0, 'items-MAX_NUM_FORMS': 1000,
+        }
+        for n, (item, quantity) in enumerate(lines):
+            data[f'items-{n}-item'] = item.pk
+            data[f'items-{n}-quantity'] = quantity
+        return RequestItemFormSet(data, prefix='items', project=self.project)
+
+    def test_duplicated_item_is_checked_against_its_combined_quantity(self):
+        formset = self.formset((self.lens, 3), (self.tripod, 2), (self.lens, 3), (self.light, 4))
+        # Two per row (the item choice, and the model's check that it
+        # exists), then a single stock query for every row together.
+        with self.assertNumQueries(2 * 4 + 1):
+            self.assertFalse(formset.is_valid())
+
+        message = "Not enough stock for Lens. Only 5 available, but 6 requested."
+        self.assertEqual(
+            [form.errors.get('quantity') for form in formset.forms],
+            [[message], None, [message], None],
+        )
+
+    def test_rows_that_fit_are_valid(self):
+        formset = self.formset((self.lens, 5), (self.tripod, 3), (self.light, 10))
+        with self.assertNumQueries(2 * 3 + 1):
+            self.assertTrue(formset.is_valid())
+
+    def test_project_dates_are_used(self):
+        workflow.approve(make_request(self.project, User.objects.create_user('gaffer'), (self.tripod, 2)))
+        formset = self.formset((self.tripod, 2))
+        self.assertFalse(formset.is_valid())
+        self.assertEqual(
+            formset.forms[0].errors['quantity'],
+            ["Not enough stock for Tripod. Only 1 available, but 2 requested."],
+        )
+
+
+class CheckInTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('desk', password='secret', is_staff=True)
+        self.cable = EquipmentItem.objects.create(name='Cable', total_quantity=10)
+        self.camera = EquipmentItem.objects.create(name='Camera', total_quantity=2, is_serialized=True)
+        self.req = workflow.approve(make_request(make_project(starts_in=0), self.user, (self.cable, 6), (self.camera, 2)))
+        workflow.checkout(self.req, self.user)
+        self.cable_log = self.req.logs.get(item=self.cable)
+
+    def test_checkout_writes_one_line_per_bulk_item_and_per_serialized_unit(self):
+        self.assertEqual(
+            sorted(self.req.logs.values_list('item__name', 'quantity')),
+            [('Cable', 6), ('Camera', 1), ('Camera', 1)],
+        )
+
+    def test_partial_return_splits_the_line_by_condition(self):
+        units = workflow.checkin(self.req, self.user, logs={self.cable_log.pk: {'GOOD': 3, 'DAMAGED': 1}})
+        self.assertEqual(units, 4)
+
+        self.cable_log.refresh_from_db()
+        self.assertEqual((self.cable_log.quantity, self.cable_log.checked_in_at), (2, None))
+        closed = self.req.logs.filter(item=self.cable, checked_in_at__isnull=False)
+        self.assertEqual(sorted(closed.values_list('return_status', 'quantity')), [('DAMAGED', 1), ('GOOD', 3)])
+        self.assertEqual(stock(self.cable), {'reserved': 0, 'out': 2, 'damaged': 1, 'available': 7})
+        self.req.refresh_from_db()
+        self.assertEqual(self.req.status, 'PARTIAL_RETURN')
+
+    def test_damaged_and_lost_units_wait_for_repair(self):
+        workflow.checkin(self.req, self.user, items={
+            self.cable.pk: {'LOST': 1, 'GOOD': None},
+            self.camera.pk: {'DAMAGED': 1, 'GOOD': None},
+        })
+        self.req.refresh_from_db()
+        self.assertEqual(self.req.status, 'RETURNED')
+        self.assertEqual(
+            sorted(CheckoutLog.objects.needs_repair().values_list('item__name', 'return_status', 'quantity')),
+            [('Cable', 'LOST', 1), ('Camera', 'DAMAGED', 1)],
+        )
+
+        lost = CheckoutLog.objects.needs_repair().get(item=self.cable)
+        workflow.repair(lost, user=self.user)
+        self.assertFalse(CheckoutLog.objects.needs_repair().filter(item=self.cable).exists())
+        self.assertEqual(stock(self.cable), {'reserved': 0, 'out': 0, 'damaged': 0, 'available': 10})
+
+    def test_rejects_more_units_than_are_out(self):
+        with self.assertRaises(workflow.WorkflowError):
+            workflow.checkin(self.req, self.user, logs={self.cable_log.pk: {'GOOD': 5, 'DAMAGED': 2}})
+        with self.assertRaises(workflow.WorkflowError):
+            workflow.checkin(self.req, self.user, items={self.cable.pk: {'GOOD': 7}})
+        self.assertEqual(stock(self.cable), {'reserved': 0, 'out': 6, 'damaged': 0, 'available': 4})
+
+
+class OverdueDigestTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('gaffer', email='gaffer@example.com', password='secret')
+        self.item = EquipmentItem.objects.create(name='Light stand', total_quantity=5)
+        ended = make_project(starts_in=-7)
+        for requested_by in [self.user, None]:
+            req = make_request(ended, requested_by, (self.item, 1))
+            CheckoutLog.objects.create(
+                request=req, item=self.item, quantity=1, checked_out_by=self.user,
+                checked_out_at=timezone.now() - timedelta(days=7),
+            )
+        self.orphan = req
+
+    def test_requests_without_a_requester_are_reported_not_emailed(self):
+        out = io.StringIO()
+        call_command('detect_overdue', stdout=out)
+
+        self.assertIn(f"#{self.orphan.pk} (Shoot in -7 days): overdue but has no requester", out.getvalue())
+        self.assertEqual([message.to for message in mail.outbox], [['gaffer@example.com']])
+
+    def test_sends_only_the_digests_it_queued(self):
+        older = outbox.queue_email("Invoice", "Attached.", ['client@example.com'])
+        call_command('detect_overdue', stdout=io.StringIO())
+
+        self.assertEqual([message.to for message in mail.outbox], [['gaffer@example.com']])
+        older.refresh_from_db()
+        self.assertEqual((older.status, older.attempts), ('PENDING', 0))
+        self.assertEqual(OutboundEmail.objects.filter(status='SENT').count(), 1)
+
+
+class UtilizationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('desk', password='secret', is_staff=True)
+        self.item = EquipmentItem.objects.create(name='Drone', total_quantity=2)
+        self.today = timezone.localdate()
+        req = make_request(make_project(starts_in=-10), self.user, (self.item, 2))
+        # Two units out from ten days ago until seven days ago; one came back damaged.
+        out_at = timezone.now() - timedelta(days=10)
+        back_at = timezone.now() - timedelta(days=7)
+        for status in ['GOOD', 'DAMAGED']:
+            CheckoutLog.objects.create(
+                request=req, item=self.item, quantity=1, checked_out_by=self.user, checked_out_at=out_at,
+                checked_in_by=self.user, checked_in_at=back_at, return_status=status,
+            )
+
+    def test_quiet_days_after_the_last_activity_are_not_rolled_up_again(self):
+        start, end = utilization.pending_days()
+        self.assertEqual(end, self.today - timedelta(days=1))
+        utilization.rollup(start, end)
+
+        self.assertEqual(utilization.rolled_up_through(), end)
+        self.assertIsNone(utilization.pending_days())
+
+    def test_utilization_api_reads_the_rollups(self):
+        utilization.rollup(*utilization.pending_days())
+        api = APIClient()
+        api.force_authenticate(self.user)
+        window = {'from': self.today - timedelta(days=10), 'to': self.today - timedelta(days=1)}
+
+        item = api.get('/api/v1/equipment/items/utilization/', {**window, 'item': self.item.pk}).json()['items'][0]
+        self.assertEqual((item['unit_days'], item['checkouts'], item['units_returned'], item['units_damaged']), (8, 1, 2, 1))
+        self.assertEqual(item['utilization'], 0.4)
+        self.assertEqual(item['damage_rate'], 0.5)
+
+        response = api.get('/api/v1/equipment/items/utilization/', {**window, 'item': 'drone'})
+        self.assertEqual(response.status_code, 400)
+
+
+class RequestStatusCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('desk', password='secret', is_staff=True)
+        self.item = EquipmentItem.objects.create(name='Tripod', total_quantity=4)
+        self.project = make_project(starts_in=1)
+
+    def test_counts_follow_every_transition(self):
+        first = make_request(self.project, self.user, (self.item, 1))
+        second = make_request(self.project, self.user, (self.item, 1))
+        workflow.approve(first)
+        workflow.reject(second)
+        workflow.checkout(first, self.user)
+
+        counts = RequestStatusCount.current()
+        self.assertEqual(
+            (counts['PENDING'], counts['APPROVED'], counts['REJECTED'], counts['CHECKED_OUT']), (0, 0, 1, 1)
+        )
+        self.assertEqual(counts, {
+            status: EquipmentRequest.objects.filter(status=status).count()
+            for status, _ in EquipmentRequest.STATUS_CHOICES
+        })
+
+    def test_missing_row_is_recreated(self):
+        RequestStatusCount.objects.filter(status='APPROVED').delete()
+        workflow.approve(make_request(self.project, self.user, (self.item, 1)))
+        self.assertEqual(RequestStatusCount.objects.get(status='APPROVED').count, 1)
+
+    def test_api_sees_a_transition_at_once(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        req = make_request(self.project, self.user, (self.item, 1))
+        self.assertEqual(api.get('/api/v1/equipment/requests/status-counts/').json()['PENDING'], 1)
+        workflow.approve(req)
+        counts = api.get('/api/v1/equipment/requests/status-counts/').json()
+        self.assertEqual((counts['PENDING'], counts['APPROVED']), (0, 1))
+
+
+class BlankPageRenderer:
+    """
+    Stands in for WeasyPrint: every sheet is one blank page.
+    """
+    def __init__(self, stylesheet_source=None):
+        pass
+
+    def write_pdf(self, html_string):
+        writer = PdfWriter()
+        writer.add_blank_page(width=595, height=842)
+        out = io.BytesIO()
+        writer.write(out)
+        return out.getvalue()
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'checkout_sheets': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sheets'},
+})
+class BatchPrintTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('desk', password='secret', is_staff=True)
+        item = EquipmentItem.objects.create(name='Cable', total_quantity=100)
+        project = make_project(starts_in=0)
+        self.requests = [make_request(project, self.user, (item, 1)) for _ in range(pdf.INLINE_RENDER_LIMIT + 1)]
+
+    def test_small_batch_is_rendered_in_the_request(self):
+        ids = [req.pk for req in self.requests[:3]]
+        with mock.patch('equipment.pdf.get_renderer', return_value=BlankPageRenderer()):
+            delivery, pages, timings = pdf.queue_batch_print(ids, user=self.user)
+
+        self.assertEqual(pages, 3)
+        self.assertEqual([t['request'] for t in timings], ids)
+        attachment = delivery.attachments.get()
+        self.assertEqual((attachment.builder, bool(attachment.content)), ('', True))
+        self.assertEqual(delivery.details['sheets'], timings)
+
+    def test_large_batch_is_rendered_in_a_process_pool_when_the_email_is_sent(self):
+        ids = [req.pk for req in self.requests]
+        with mock.patch('equipment.pdf.get_renderer', side_effect=AssertionError("rendered in the request")):
+            delivery, pages, timings = pdf.queue_batch_print(ids, user=self.user)
+        self.assertEqual((pages, timings), (None, []))
+        attachment = delivery.attachments.get()
+        self.assertEqual((attachment.builder, attachment.builder_args), ('equipment.pdf.checkout_sheets_attachment', [ids]))
+
+        with mock.patch('equipment.pdf.CheckoutSheetRenderer', BlankPageRenderer), \
+                mock.patch('equipment.pdf.BATCH_RENDER_WORKERS', 4), \
+                mock.patch('equipment.pdf.ProcessPoolExecutor', wraps=pdf.ProcessPoolExecutor) as pool:
+            self.assertEqual(outbox.send_due(), (1, 0))
+        self.assertEqual(pool.call_args.kwargs['max_workers'], 4)
+        merged = mail.outbox[0].attachments[0][1]
+        self.assertEqual(len(PdfReader(io.BytesIO(merged)).pages), len(ids))
+
+        api = APIClient()
+        api.force_authenticate(self.user)
+        details = api.get(f'/api/v1/outbox/{delivery.pk}/').json()['details']
+        self.assertEqual(details['pages'], len(ids))
+        self.assertEqual([(t['request'], t['cached']) for t in details['sheets']], [(pk, False) for pk in ids])
+        self.assertTrue(all(t['ms'] >= 0 for t in details['sheets']))
+
+
+class ApprovePendingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('desk', password='secret', is_staff=True)
+        self.item = EquipmentItem.objects.create(name='Monitor', total_quantity=5)
+
+    def test_earliest_project_is_served_first_whoever_asked_first(self):
+        later = make_request(make_project(starts_in=4), self.user, (self.item, 4))
+        earlier = make_request(make_project(starts_in=2, days=5), self.user, (self.item, 3))
+
+        report = workflow.approve_pending()
+
+        self.assertEqual(report['approved'], [earlier.pk])
+        self.assertEqual(report['unfilled'], [{
+            'request': later.pk,
+            'errors': {self.item.pk: "Not enough stock for Monitor. Only 2 available, but 4 requested."},
+        }])
+        self.assertEqual(
+            dict(EquipmentRequest.objects.values_list('pk', 'status')),
+            {earlier.pk: 'APPROVED', later.pk: 'PENDING'},
+        )
+        self.assertEqual(stock(self.item), {'reserved': 3, 'out': 0, 'damaged': 0, 'available': 5})
+
+    def test_windows_that_do_not_overlap_share_the_units(self):
+        first = make_request(make_project(starts_in=2), self.user, (self.item, 5))
+        second = make_request(make_project(starts_in=10), self.user, (self.item, 5))
+        workflow.approve(make_request(make_project(starts_in=20), self.user, (self.item, 2)))
+        third = make_request(make_project(starts_in=21), self.user, (self.item, 4))
+
+        report = workflow.approve_pending()
+
+        self.assertEqual(report['approved'], [first.pk, second.pk])
+        self.assertEqual([entry['request'] for entry in report['unfilled']], [third.pk])
+        self.assertEqual(stock(self.item)['reserved'], 12)
+
+    def test_api_reports_the_batch(self):
+        req = make_request(make_project(starts_in=2), self.user, (self.item, 6))
+        api = APIClient()
+        api.force_authenticate(self.user)
+
+        response = api.post('/api/v1/equipment/requests/approve-pending/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'approved': [], 'unfilled': [{
+            'request': req.pk,
+            'errors': {str(self.item.pk): "Not enough stock for Monitor. Only 5 available, but 6 requested."},
+        }]})
+
+
+class ConcurrentApprovalTests(TransactionTestCase):
+    """
+    Approves requests from several threads at once, each on its own
+    database connection: overlapping requests must never over-allocate an
+    item, and requests for different items must not wait for each other.
+    """
+    THREADS = 8
+
+    def setUp(self):
+        self.user = User.objects.create_user('desk', password='secret', is_staff=True)
+        self.items = [EquipmentItem.objects.create(name=f'Battery {i}', total_quantity=3) for i in range(4)]
+        # Two projects that share days, so every request competes with every other.
+        self.projects = [make_project(starts_in=1), make_project(starts_in=2)]
+        rng = random.Random(5)
+        self.requests = [
+            make_request(
+                rng.choice(self.projects), self.user,
+                *[(item, rng.randint(1, 2)) for item in rng.sample(self.items, rng.randint(1, 2))]
+            )
+            for _ in range(40)
+        ]
+
+    def approve_all(self, requests, threads=THREADS):
+        """
+        Approves `requests` from `threads` threads. Returns the outcome of
+        each approval (True if approved) and the wall time in seconds.
+        """
+        queue = list(requests)
+        lock = threading.Lock()
+        start = threading.Barrier(threads + 1)
+        results, errors = [], []
+
+        def worker():
+            connection.ensure_connection()
+            start.wait()
+            try:
+                while True:
+                    with lock:
+                        if not queue:
+                            return
+                        req = queue.pop()
+                    try:
+                        workflow.approve(req)
+                        results.append(True)
+                    except workflow.InsufficientStock:
+                        results.append(False)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        start.wait()
+        started = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        self.assertEqual(errors, [])
+        return results, elapsed
+
+    def test_no_item_is_over_allocated(self):
+        results, _ = self.approve_all(self.requests)
+        self.assertEqual(len(results), len(self.requests))
+        self.assertIn(True, results)
+        self.assertIn(False, results)
+
+        for item in self.items:
+            approved = RequestedItem.objects.filter(
+                item=item, request__status='APPROVED'
+            ).aggregate(total=Sum('quantity'))['total'] or 0
+            self.assertLessEqual(approved, item.total_quantity)
+            self.assertEqual(stock(item), {'reserved': approved, 'out': 0, 'damaged': 0, 'available': 3})
+
+    def test_approvals_of_different_items_run_in_parallel(self):
+        def disjoint_requests(label):
+            return [
+                make_request(
+                    self.projects[0], self.user,
+                    (EquipmentItem.objects.create(name=f'{label} {i}', total_quantity=1), 1),
+                )
+                for i in range(self.THREADS)
+            ]
+        serial_requests, parallel_requests = disjoint_requests('Tripod'), disjoint_requests('Slider')
+
+        check_stock = workflow.check_stock
+
+        def slow_check_stock(*args):
+            # Holds the item locks for a while, as a busy database would;
+            # pg_sleep waits outside the GIL, so threads can overlap.
+            check_stock(*args)
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_sleep(0.2)')
+
+        with mock.patch('equipment.workflow.check_stock', slow_check_stock):
+            serial_results, serial = self.approve_all(serial_requests, threads=1)
+            parallel_results, parallel = self.approve_all(parallel_requests)
+
+        self.assertEqual(serial_results + parallel_results, [True] * 2 * self.THREADS)
+        # Locks are taken per item, so the approvals overlap. A lock shared
+        # by all of them would make the threaded run as long as the serial one.
+        self.assertLess(parallel, serial / 2)
+
+
+class ScanOutRaceTests(TransactionTestCase):
+    """
+    Two desks scan the same unit out on different requests at once.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('desk', password='secret', is_staff=True)
+        camera = EquipmentItem.objects.create(name='Camera', total_quantity=2, is_serialized=True)
+        EquipmentUnit.objects.create(item=camera, tag='CAM-1')
+        EquipmentUnit.objects.create(item=camera, tag='CAM-2')
+        project = make_project(starts_in=0)
+        self.mine = workflow.approve(make_request(project, self.user, (camera, 1)))
+        self.theirs = workflow.approve(make_request(project, self.user, (camera, 1)))
+        for req in (self.mine, self.theirs):
+            workflow.checkout(req, self.user)
+            req.refresh_from_db()
+
+    def test_losing_scan_reports_the_unit_as_already_out(self):
+        bulk_update = CheckoutLog.objects.bulk_update
+        theirs = []
+
+        def other_desk():
+            theirs.extend(scanning.scan_out(self.theirs, self.user, ['CAM-1']))
+            connection.close()
+
+        def other_desk_scans_first(*args, **kwargs):
+            # The other desk commits CAM-1 after this batch checked it.
+            if threading.current_thread() is threading.main_thread() and not theirs:
+                thread = threading.Thread(target=other_desk)
+                thread.start()
+                thread.join()
+            return bulk_update(*args, **kwargs)
+
+        with mock.patch.object(CheckoutLog.objects, 'bulk_update', side_effect=other_desk_scans_first):
+            results = scanning.scan_out(self.mine, self.user, ['CAM-1'])
+
+        self.assertTrue(theirs[0]['ok'])
+        self.assertEqual(results, [{
+            'tag': 'CAM-1', 'ok': False,
+            'error': f"Camera [CAM-1] is already out on request #{self.theirs.pk}.",
+        }])
+        self.assertEqual(scanning.scan_out(self.mine, self.user, ['CAM-2'])[0]['ok'], True)
+
+
+class CompactCheckoutLogsMigrationTests(TransactionTestCase):
+    """
+    0006 merges the one-row-per-unit logs of the old checkout/check-in code.
+    """
+    migrate_from = [('equipment', '0005_requesteditem_period')]
+    migrate_to = [('equipment', '0006_compact_checkout_logs')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        self.apps = executor.loader.project_state(self.migrate_from).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_merges_rows_stamped_per_unit(self):
+        CheckoutLog = self.apps.get_model('equipment', 'CheckoutLog')
+        EquipmentItem = self.apps.get_model('equipment', 'EquipmentItem')
+        EquipmentRequest = self.apps.get_model('equipment', 'EquipmentRequest')
+        user = self.apps.get_model('auth', 'User').objects.create(username='desk')
+        cable = EquipmentItem.objects.create(name='Cable', total_quantity=10)
+        req = EquipmentRequest.objects.create(requested_by=user, status='PARTIAL_RETURN')
+
+        # As the old code wrote them: one row per unit, each with its own
+        # now(). Four came back together (three good, one damaged), two later
+        # in the day, and one is still out.
+        out_at = timezone.now() - timedelta(days=2)
+        back_at = out_at + timedelta(days=1)
+        later = back_at + timedelta(hours=5)
+        returns = [(back_at, 'GOOD')] * 3 + [(back_at, 'DAMAGED'), (later, 'GOOD'), (later, 'GOOD'), (None, None)]
+        for unit, (checked_in_at, return_status) in enumerate(returns):
+            log = CheckoutLog.objects.create(request=req, item=cable, checked_out_by=user)
+            CheckoutLog.objects.filter(pk=log.pk).update(
+                checked_out_at=out_at + timedelta(microseconds=40 * unit),
+                checked_in_by=user if checked_in_at else None,
+                checked_in_at=checked_in_at and checked_in_at + timedelta(microseconds=70 * unit),
+                return_status=return_status,
+            )
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+        CheckoutLog = executor.loader.project_state(self.migrate_to).apps.get_model('equipment', 'CheckoutLog')
+
+        rows = sorted(
+            (log.return_status or '', log.quantity, log.checked_in_at and log.checked_in_at.date())
+            for log in CheckoutLog.objects.all()
+        )
+        self.assertEqual(rows, [
+            ('', 1, None),
+            ('DAMAGED', 1, back_at.date()),
+            ('GOOD', 2, later.date()),
+            ('GOOD', 3, back_at.date()),
+        ])
+        merged = CheckoutLog.objects.get(return_status='GOOD', quantity=3)
+        self.assertEqual(merged.checked_out_at, out_at)
+        self.assertEqual(merged.checked_in_at, back_at + timedelta(microseconds=140))
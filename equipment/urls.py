@@ -7,6 +7,7 @@ from .views import (
     RequestListView,
     RequestDetailView,
     ApproveRequestView,
+    ApprovePendingView,
     RejectRequestView,
     CheckoutView,
     CheckInView,
@@ -16,7 +17,11 @@ from .views import (
     DownloadCheckoutSheetView, # <-- ADD
     EmailCheckoutSheetView,    # <-- ADD
     PrintCheckoutSheetView,    # <-- ADD
-    PrintToHpeprintView        # <-- ADD
+    PrintToHpeprintView,       # <-- ADD
+    BatchPrintView,
+    ScanView,
+    AvailabilitySnapshotView,
+    availability_stream,
 )
 
 urlpatterns = [
@@ -26,14 +31,19 @@ urlpatterns = [
 
     # User-facing
     path('request/', EquipmentRequestCreateView.as_view(), name='equipment-request'),
+    path('availability/', AvailabilitySnapshotView.as_view(), name='availability-snapshot'),
+    path('availability/stream/', availability_stream, name='availability-stream'),
     
     # Admin-facing
     path('requests/', RequestListView.as_view(), name='request-list'),
     path('requests/<int:pk>/', RequestDetailView.as_view(), name='request-detail'),
+    path('requests/approve-pending/', ApprovePendingView.as_view(), name='request-approve-pending'),
     path('requests/<int:pk>/approve/', ApproveRequestView.as_view(), name='request-approve'),
     path('requests/<int:pk>/reject/', RejectRequestView.as_view(), name='request-reject'),
     path('requests/<int:pk>/checkout/', CheckoutView.as_view(), name='request-checkout'),
     path('requests/<int:pk>/checkin/', CheckInView.as_view(), name='request-checkin'),
+    path('requests/<int:pk>/scan/', ScanView.as_view(), name='request-scan'),
+    path('requests/batch-print/', BatchPrintView.as_view(), name='request-batch-print'),
     
     # --- ADD THESE NEW URLS ---
     path('requests/<int:pk>/pdf/', DownloadCheckoutSheetView.as_view(), name='request-pdf'),
@@ -0,0 +1,114 @@
+# equipment/utilization.py
+#
+# Daily usage rollups (EquipmentUsageDaily) built from CheckoutLog.
+# rollup() turns a range of finished days into one row per item and day;
+# the rollup_utilization command runs it for the days not rolled up yet,
+# and the utilization API reads only the rollups.
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import CheckoutLog, EquipmentUsageDaily, EquipmentUsageRollup
+
+# Days rolled up per pass, to bound how many logs are held in memory.
+CHUNK_DAYS = 31
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _local_day(value):
+    return timezone.localdate(value) if value else None
+
+
+def rolled_up_through():
+    """
+    The last day the rollups cover, or None before the first run.
+    Read from the passes themselves, so quiet days at the end count too.
+    """
+    return EquipmentUsageRollup.objects.aggregate(last=Max('end'))['last']
+
+
+def first_activity_day():
+    """
+    The local day of the earliest checkout, or None if nothing was ever checked out.
+    """
+    first = CheckoutLog.objects.order_by('checked_out_at').values_list('checked_out_at', flat=True).first()
+    return _local_day(first)
+
+
+def pending_days():
+    """
+    (start, end) of the finished days that haven't been rolled up yet,
+    or None when the rollups are current. Today is never included,
+    because its numbers aren't final.
+    """
+    last = rolled_up_through()
+    start = last + timedelta(days=1) if last else first_activity_day()
+    end = timezone.localdate() - timedelta(days=1)
+    if start is None or start > end:
+        return None
+    return start, end
+
+
+def rollup(start, end):
+    """
+    (Re)builds the rollups for every day from `start` to `end` inclusive,
+    CHUNK_DAYS at a time, each chunk in its own transaction.
+    Returns the number of rows written.
+    """
+    written = 0
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(days=CHUNK_DAYS - 1), end)
+        written += _rollup_chunk(chunk_start, chunk_end)
+        chunk_start = chunk_end + timedelta(days=1)
+    return written
+
+
+def _rollup_chunk(start, end):
+    # Every log that was out at some point between start and end.
+    logs = CheckoutLog.objects.filter(
+        checked_out_at__lt=_day_start(end + timedelta(days=1)),
+    ).filter(
+        Q(checked_in_at__isnull=True) | Q(checked_in_at__gte=_day_start(start))
+    ).values_list(
+        'item_id', 'request_id', 'quantity', 'checked_out_at', 'checked_in_at', 'return_status'
+    )
+
+    totals = defaultdict(lambda: defaultdict(int))
+    checkouts = defaultdict(set)
+    for item_id, request_id, quantity, out_at, in_at, return_status in logs.iterator():
+        out_day, in_day = _local_day(out_at), _local_day(in_at)
+
+        # The units count as out on every day from checkout to check-in.
+        day = max(out_day, start)
+        last = min(in_day or end, end)
+        while day <= last:
+            totals[item_id, day]['units_out'] += quantity
+            day += timedelta(days=1)
+
+        if start <= out_day <= end:
+            totals[item_id, out_day]['units_checked_out'] += quantity
+            # Rows split off at check-in share their checkout time, so one
+            # checkout is one (request, checked_out_at) pair.
+            checkouts[item_id, out_day].add((request_id, out_at))
+        if in_day and start <= in_day <= end:
+            totals[item_id, in_day]['units_returned'] += quantity
+            if return_status in ('DAMAGED', 'LOST'):
+                totals[item_id, in_day]['units_damaged'] += quantity
+
+    rows = [
+        EquipmentUsageDaily(item_id=item_id, day=day, checkouts=len(checkouts[item_id, day]), **counts)
+        for (item_id, day), counts in totals.items()
+    ]
+    with transaction.atomic():
+        EquipmentUsageDaily.objects.filter(day__range=(start, end)).delete()
+        EquipmentUsageDaily.objects.bulk_create(rows, batch_size=1000)
+        EquipmentUsageRollup.objects.create(start=start, end=end, rows=len(rows))
+    return len(rows)
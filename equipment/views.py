@@ -10,17 +10,23 @@ from django.db import transaction
 from django.http import JsonResponse, HttpResponseRedirect, Http404
 from django.shortcuts import redirect, get_object_or_404
 from django.utils import timezone
-from .models import EquipmentRequest, RequestedItem, EquipmentItem, CheckoutLog
+from django.db.models import Sum
+from .models import EquipmentRequest, RequestedItem, EquipmentItem, CheckoutLog, RequestStatusCount
+from . import workflow, scanning, live
+from .pdf import render_checkout_sheet, queued_checkout_sheet, queue_batch_print
+from core.outbox import queue_email
+from projects.models import Project
 from .forms import (
     EquipmentRequestForm, RequestItemFormSet, 
-    BaseCheckInFormSet, EmailCheckoutSheetForm
+    BaseCheckInFormSet, EmailCheckoutSheetForm, ScanForm
 )
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
 from django.template.loader import render_to_string
-from django.core.mail import EmailMessage
-from weasyprint import HTML, CSS
 from django.conf import settings
 import os
+import time
 
 
 class StaffRequiredMixin(UserPassesTestMixin):
@@ -30,7 +36,8 @@ class StaffRequiredMixin(UserPassesTestMixin):
 class EquipmentListView(LoginRequiredMixin, ListView):
     """
     Main dashboard for the equipment module.
-    Shows a complete list of all inventory items.
+    Shows a complete list of all inventory items, with what is free of
+    every reservation, or free within a project's dates with ?project=<id>.
     """
     model = EquipmentItem
     template_name = 'equipment/equipment_list.html'
@@ -38,13 +45,28 @@ class EquipmentListView(LoginRequiredMixin, ListView):
     paginate_by = 20
 
     def get_queryset(self):
-        # Allow searching by name
-        queryset = super().get_queryset().order_by('category', 'name')
-        search = self.request.GET.get('search')
+        self.project = None
+        project_id = self.request.GET.get('project')
+        if project_id and project_id.isdigit():
+            self.project = Project.objects.filter(pk=project_id).first()
+        if self.project:
+            queryset = super().get_queryset().with_availability(self.project.date_from, self.project.date_to)
+        else:
+            queryset = super().get_queryset().with_availability()
+        queryset = queryset.select_related('category').order_by('category', 'name')
+        # Fuzzy search by item or category name, best match first
+        search = self.request.GET.get('search', '').strip()
         if search:
-            queryset = queryset.filter(name__icontains=search)
+            queryset = queryset.search(search)
         return queryset
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['project'] = self.project
+        # The projects equipment can be requested for (see EquipmentRequestForm)
+        context['projects'] = Project.objects.filter(status__in=['STARTED', 'IN_PROGRESS'])
+        return context
+
 # --- THIS VIEW IS MODIFIED ---
 class EquipmentRequestCreateView(LoginRequiredMixin, CreateView):
     model = EquipmentRequest
@@ -70,11 +92,8 @@ class EquipmentRequestCreateView(LoginRequiredMixin, CreateView):
         else:
             context['item_formset'] = RequestItemFormSet(prefix='items')
         
-        equipment_data = {
-            item.pk: item.available_quantity 
-            for item in EquipmentItem.objects.filter(total_quantity__gt=0)
-        }
-        context['equipment_data_json'] = JsonResponse(equipment_data).content.decode('utf-8')
+        # Availability is loaded by the page itself (see AvailabilitySnapshotView)
+        # and kept current by the live stream.
         return context
 
     def form_valid(self, form):
@@ -82,8 +101,11 @@ class EquipmentRequestCreateView(LoginRequiredMixin, CreateView):
         This method is called when the main form (EquipmentRequestForm) is valid.
         We now validate the formset *before* saving anything.
         """
-        context = self.get_context_data()
-        item_formset = context['item_formset']
+        # The formset checks all lines against the stock for the chosen
+        # project's dates, so it is built here rather than in get_context_data.
+        item_formset = RequestItemFormSet(
+            self.request.POST, prefix='items', project=form.cleaned_data['project']
+        )
         
         if item_formset.is_valid():
             # Formset is also valid, proceed to save everything
@@ -92,7 +114,11 @@ class EquipmentRequestCreateView(LoginRequiredMixin, CreateView):
                 self.object = form.save() 
                 
                 item_formset.instance = self.object
-                item_formset.save()
+                lines = item_formset.save(commit=False)
+                period = self.object.get_period()
+                for line in lines:
+                    line.period = period
+                RequestedItem.objects.bulk_create(lines)
             
             messages.success(self.request, "Your equipment request has been submitted successfully.")
             # We must return a redirect here
@@ -120,6 +146,42 @@ class EquipmentRequestCreateView(LoginRequiredMixin, CreateView):
         return self.render_to_response(self.get_context_data(form=form))
 
 
+class AvailabilitySnapshotView(LoginRequiredMixin, View):
+    """
+    Every item's available quantity (within ?project=<id>'s dates, if
+    given), plus the event id to start the live stream from. Served with
+    an ETag; see live.snapshot_response().
+    """
+    def get(self, request, *args, **kwargs):
+        return live.snapshot_response(request)
+
+
+async def availability_stream(request):
+    """
+    Server-sent events with each item's new available quantity whenever it
+    changes, starting after Last-Event-ID (or ?since=).
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=403)
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.GET.get('since') or 0)
+    except ValueError:
+        last_id = 0
+    if not last_id:
+        last_id = await sync_to_async(live.latest_change_id)()
+    # A WSGI server can only stream a plain iterator; it would read an
+    # async one to the end before sending anything.
+    if isinstance(request, ASGIRequest):
+        events = live.stock_events(last_id)
+    else:
+        events = live.stock_events_sync(last_id)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let a proxy hold events back
+    return response
+
+
 # --- ALL OTHER VIEWS ARE UNCHANGED ---
 
 class RequestListView(LoginRequiredMixin, StaffRequiredMixin, ListView):
@@ -136,6 +198,21 @@ class RequestListView(LoginRequiredMixin, StaffRequiredMixin, ListView):
             queryset = queryset.filter(status=status)
         return queryset
 
+    def get_paginator(self, queryset, *args, **kwargs):
+        # Take the page count from the status counters instead of a COUNT(*).
+        paginator = super().get_paginator(queryset, *args, **kwargs)
+        counters = RequestStatusCount.objects.all()
+        status = self.request.GET.get('status')
+        if status:
+            counters = counters.filter(status=status)
+        paginator.count = counters.aggregate(total=Sum('count'))['total'] or 0
+        return paginator
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['status_counts'] = RequestStatusCount.current()
+        return context
+
 class RequestDetailView(LoginRequiredMixin, StaffRequiredMixin, DetailView):
     # ... (no changes) ...
     model = EquipmentRequest
@@ -152,27 +229,43 @@ class ApproveRequestView(LoginRequiredMixin, StaffRequiredMixin, View):
     def post(self, request, *args, **kwargs):
         req = get_object_or_404(EquipmentRequest, pk=self.kwargs.get('pk'))
         if req.status == 'PENDING':
-            for item in req.items.all():
-                if item.quantity > item.item.available_quantity:
-                    messages.error(request, f"Cannot approve: Not enough stock for {item.item.name}. Only {item.item.available_quantity} available.")
-                    return redirect('request-detail', pk=req.pk)
-            req.status = 'APPROVED'
-            req.save()
-            messages.success(request, "Request has been approved.")
+            try:
+                workflow.approve(req)
+                messages.success(request, "Request has been approved.")
+            except workflow.InsufficientStock as e:
+                messages.error(request, f"Cannot approve: {e}")
+            except workflow.WorkflowError as e:
+                messages.warning(request, str(e))
         else:
             messages.warning(request, "This request is not in a 'Pending' state.")
         return redirect('request-detail', pk=req.pk)
 
+class ApprovePendingView(LoginRequiredMixin, StaffRequiredMixin, View):
+    """
+    Approves every pending request that the stock allows, earliest
+    project first (see workflow.approve_pending), and lists the rest.
+    """
+    def post(self, request, *args, **kwargs):
+        report = workflow.approve_pending()
+        if report['approved']:
+            messages.success(request, f"Approved {len(report['approved'])} request(s).")
+        for unfilled in report['unfilled']:
+            messages.warning(
+                request,
+                f"Request #{unfilled['request']} left pending: {' '.join(unfilled['errors'].values())}"
+            )
+        if not report['approved'] and not report['unfilled']:
+            messages.info(request, "There are no pending requests.")
+        return redirect(f"{reverse('request-list')}?status=PENDING")
+
 class RejectRequestView(LoginRequiredMixin, StaffRequiredMixin, View):
     # ... (no changes) ...
     def post(self, request, *args, **kwargs):
         req = get_object_or_404(EquipmentRequest, pk=self.kwargs.get('pk'))
-        if req.status == 'PENDING' or req.status == 'APPROVED':
-            req.status = 'REJECTED'
-            req.admin_notes = request.POST.get('admin_notes', 'No reason provided.')
-            req.save()
+        try:
+            workflow.reject(req, admin_notes=request.POST.get('admin_notes', 'No reason provided.'))
             messages.success(request, "Request has been rejected.")
-        else:
+        except workflow.WorkflowError:
             messages.warning(request, "This request cannot be rejected.")
         return redirect('request-detail', pk=req.pk)
 
@@ -193,22 +286,8 @@ class CheckoutView(LoginRequiredMixin, StaffRequiredMixin, DetailView):
             messages.error(request, "This request must be approved before checkout.")
             return redirect('request-detail', pk=req.pk)
         try:
-            with transaction.atomic():
-                logs_to_create = []
-                for item in req.items.all():
-                    for _ in range(item.quantity):
-                        logs_to_create.append(
-                            CheckoutLog(
-                                request=req,
-                                item=item.item,
-                                checked_out_by=request.user,
-                                checked_out_at=timezone.now()
-                            )
-                        )
-                CheckoutLog.objects.bulk_create(logs_to_create)
-                req.status = 'CHECKED_OUT'
-                req.save()
-            messages.success(request, f"Successfully checked out {len(logs_to_create)} items.")
+            checked_out = workflow.checkout(req, request.user)
+            messages.success(request, f"Successfully checked out {checked_out} items.")
             return redirect('request-detail', pk=req.pk)
         except Exception as e:
             messages.error(request, f"An error occurred: {e}")
@@ -225,7 +304,7 @@ class CheckInView(LoginRequiredMixin, StaffRequiredMixin, FormView):
         return CheckoutLog.objects.filter(
             request=self.request_object,
             checked_in_at__isnull=True
-        ).order_by('item__name')
+        ).select_related('item__category').order_by('item__name')
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
         kwargs['queryset'] = self.get_queryset()
@@ -237,33 +316,66 @@ class CheckInView(LoginRequiredMixin, StaffRequiredMixin, FormView):
     def form_valid(self, formset):
         request_obj = self.request_object
         try:
-            with transaction.atomic():
-                instances = formset.save(commit=False)
-                for log in instances:
-                    log.checked_in_by = self.request.user
-                    log.checked_in_at = timezone.now()
-                    log.save()
-                
-                still_out_count = CheckoutLog.objects.filter(
-                    request=request_obj,
-                    checked_in_at__isnull=True
-                ).count()
-                
-                if still_out_count == 0:
-                    request_obj.status = 'RETURNED'
-                else:
-                    request_obj.status = 'PARTIAL_RETURN'
-                request_obj.save()
-            messages.success(self.request, f"Successfully checked in {len(instances)} items.")
+            returns = {form.instance.pk: form.get_returns() for form in formset}
+            checked_in = workflow.checkin(request_obj, self.request.user, logs=returns)
+            messages.success(self.request, f"Successfully checked in {checked_in} items.")
             return redirect('request-detail', pk=request_obj.pk)
         except Exception as e:
             print(f"Error during check-in: {e}")
             messages.error(self.request, f"An error occurred during check-in: {e}")
             return self.form_invalid(formset)
     def form_invalid(self, formset):
-        messages.error(self.request, "Please correct the errors below and set a status for all items.")
+        messages.error(self.request, "Please correct the errors below.")
         return super().form_invalid(formset)
 
+class ScanView(LoginRequiredMixin, StaffRequiredMixin, FormView):
+    """
+    The equipment desk: check tagged units out and in by scanning them.
+    """
+    template_name = 'equipment/scan_form.html'
+    form_class = ScanForm
+
+    def dispatch(self, request, *args, **kwargs):
+        self.request_object = get_object_or_404(EquipmentRequest, pk=self.kwargs.get('pk'))
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_initial(self):
+        initial = super().get_initial()
+        if self.request_object.status in ['CHECKED_OUT', 'PARTIAL_RETURN']:
+            initial['mode'] = 'in'
+        return initial
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['request'] = self.request_object
+        context['results'] = getattr(self, 'results', None)
+        return context
+
+    def form_valid(self, form):
+        req = self.request_object
+        tags = form.get_tags()
+        try:
+            if form.cleaned_data['mode'] == 'out':
+                self.results = scanning.scan_out(req, self.request.user, tags)
+            else:
+                status = form.cleaned_data['return_status']
+                self.results = scanning.scan_in(req, self.request.user, [(tag, status) for tag in tags])
+        except workflow.WorkflowError as e:
+            messages.error(self.request, str(e))
+            return self.form_invalid(form)
+
+        applied = sum(result['ok'] for result in self.results)
+        if applied:
+            messages.success(self.request, f"{applied} scan(s) applied.")
+        if applied < len(self.results):
+            messages.warning(self.request, f"{len(self.results) - applied} scan(s) could not be applied, see below.")
+        # Fresh form, same mode, so the desk can keep scanning.
+        self.request_object.refresh_from_db(fields=['status'])
+        return self.render_to_response(self.get_context_data(form=self.form_class(initial={
+            'mode': form.cleaned_data['mode'],
+            'return_status': form.cleaned_data['return_status'],
+        })))
+
 class RepairListView(LoginRequiredMixin, StaffRequiredMixin, ListView):
     """
     Displays a list of all equipment currently marked as 'Damaged' or 'Lost'.
@@ -274,30 +386,32 @@ class RepairListView(LoginRequiredMixin, StaffRequiredMixin, ListView):
     paginate_by = 20
     
     def get_queryset(self):
-        # Find all CheckoutLog entries that are marked as Damaged or Lost
-        # and have NOT been deleted (which is our "repaired" state).
-        return CheckoutLog.objects.filter(
-            return_status__in=['DAMAGED', 'LOST']
+        # Damaged or Lost entries that haven't been repaired yet
+        # (served by a partial index, see CheckoutLog.Meta).
+        return CheckoutLog.objects.needs_repair().select_related(
+            'item__category', 'request'
         ).order_by('checked_in_at')
 
 class MarkAsRepairedView(LoginRequiredMixin, StaffRequiredMixin, View):
     """
     Handles the 'POST' request to mark an item as repaired.
-    Our repair logic is simple: we just delete the CheckoutLog entry
-    that marked the item as damaged.
+    See workflow.repair() for what "repaired" means.
     """
     
     def post(self, request, *args, **kwargs):
         # Get the specific log entry for the damaged item
         log_pk = self.kwargs.get('pk')
-        log = get_object_or_404(CheckoutLog, pk=log_pk)
-        
-        item_name = log.item.name
-        
-        # Deleting the log removes it from the 'get_damaged_quantity' count
-        log.delete()
+        log = get_object_or_404(CheckoutLog.objects.select_related('item'), pk=log_pk)
         
-        messages.success(request, f"'{item_name}' has been marked as repaired and returned to the inventory.")
+        try:
+            quantity = int(request.POST.get('quantity', log.quantity))
+        except ValueError:
+            quantity = 0
+        try:
+            workflow.repair(log, quantity, user=request.user)
+            messages.success(request, f"{quantity} x '{log.item.name}' marked as repaired and returned to the inventory.")
+        except workflow.WorkflowError as e:
+            messages.warning(request, str(e))
         return redirect('repair-list')
     
 class DownloadCheckoutSheetView(LoginRequiredMixin, StaffRequiredMixin, View):
@@ -307,13 +421,10 @@ class DownloadCheckoutSheetView(LoginRequiredMixin, StaffRequiredMixin, View):
     def get(self, request, *args, **kwargs):
         req = get_object_or_404(EquipmentRequest, pk=self.kwargs.get('pk'))
         
-        # 1. Render the HTML template
-        html_string = render_to_string('equipment/checkout_sheet.html', {'request': req})
+        # 1. Render the PDF (or reuse the cached one if the sheet hasn't changed)
+        pdf_file = render_checkout_sheet(req)
         
-        # 2. Use WeasyPrint to create the PDF in memory
-        pdf_file = HTML(string=html_string).write_pdf()
-        
-        # 3. Create an HTTP response with the PDF
+        # 2. Create an HTTP response with the PDF
         response = HttpResponse(pdf_file, content_type='application/pdf')
         response['Content-Disposition'] = f'attachment; filename="checkout_request_{req.pk}.pdf"'
         return response
@@ -344,36 +455,26 @@ class EmailCheckoutSheetView(LoginRequiredMixin, StaffRequiredMixin, FormView):
         req = get_object_or_404(EquipmentRequest, pk=self.kwargs.get('pk'))
         
         try:
-            # 1. Generate the PDF in memory
-            html_string = render_to_string('equipment/checkout_sheet.html', {'request': req})
-            pdf_file = HTML(string=html_string).write_pdf()
-            pdf_filename = f'checkout_request_{req.pk}.pdf'
-
-            # 2. Render the email body
+            # 1. Render the email body
             email_body = render_to_string('equipment/email/checkout_sheet_email.txt', {
                 'request': req,
                 'user': user_to_email
             })
 
-            # 3. Create the email
-            email = EmailMessage(
+            # 2. Queue the email; the PDF is rendered and attached when the
+            #    outbox worker sends it, so this request returns right away.
+            delivery = queue_email(
                 subject=f"FikiriERP: Equipment Checkout Sheet for Request #{req.pk}",
                 body=email_body,
-                from_email=settings.DEFAULT_FROM_EMAIL,
                 to=[
                     user_to_email.email,        # The selected user
                     '73f38dyq@hpeprint.com'     # The HP ePrint email
                 ],
-                # cc=[self.request.user.email]  # Optionally CC the admin
+                attachments=[queued_checkout_sheet(req)],
+                user=self.request.user,
             )
 
-            # 4. Attach the PDF
-            email.attach(pdf_filename, pdf_file, 'application/pdf')
-
-            # 5. Send the email
-            email.send()
-
-            messages.success(self.request, f"Checkout sheet has been emailed to {user_to_email.email} and HP ePrint.")
+            messages.success(self.request, f"Checkout sheet queued for {user_to_email.email} and HP ePrint (delivery #{delivery.pk}).")
             return redirect('request-detail', pk=req.pk)
 
         except Exception as e:
@@ -389,31 +490,53 @@ class PrintToHpeprintView(LoginRequiredMixin, StaffRequiredMixin, View):
         req = get_object_or_404(EquipmentRequest, pk=self.kwargs.get('pk'))
         
         try:
-            # 1. Generate the PDF in memory
-            html_string = render_to_string('equipment/checkout_sheet.html', {'request': req})
-            pdf_file = HTML(string=html_string).write_pdf()
-            pdf_filename = f'checkout_request_{req.pk}.pdf'
-
-            # 2. Render a simple email body
-            email_body = f"Please print the attached checkout sheet for Request #{req.pk}."
-
-            # 3. Create the email
-            email = EmailMessage(
+            # Queue the email for the outbox worker (see core/outbox.py)
+            delivery = queue_email(
                 subject=f"PRINT: Equipment Checkout Sheet #{req.pk}",
-                # body=email_body,
-                from_email=settings.DEFAULT_FROM_EMAIL,
+                body='',
                 to=[settings.PRINTER_EMAIL], # Send *only* to the printer
+                attachments=[queued_checkout_sheet(req)],
+                user=request.user,
             )
-
-            # 4. Attach the PDF
-            email.attach(pdf_filename, pdf_file, 'application/pdf')
-
-            # 5. Send the email
-            email.send()
-
-            messages.success(request, "The checkout sheet has been sent to the printer.")
+            messages.success(request, f"The checkout sheet has been queued for the printer (delivery #{delivery.pk}).")
         
         except Exception as e:
             messages.error(request, f"An error occurred while sending to printer: {e}")
             
-        return redirect('request-detail', pk=req.pk)
\ No newline at end of file
+        return redirect('request-detail', pk=req.pk)
+
+
+class BatchPrintView(LoginRequiredMixin, StaffRequiredMixin, View):
+    """
+    Sends the checkout sheets ticked on the request list to the printer
+    as one merged PDF, and reports how long each sheet took to render.
+    """
+    def post(self, request, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            delivery, pages, timings = queue_batch_print(
+                request.POST.getlist('request_ids'), user=request.user
+            )
+        except ValueError as e:
+            messages.error(request, str(e))
+        except Exception as e:
+            messages.error(request, f"An error occurred while preparing the batch: {e}")
+        else:
+            total = (time.perf_counter() - started) * 1000
+            if pages is None:
+                messages.success(
+                    request,
+                    f"The checkout sheets are queued for the printer as one PDF (delivery #{delivery.pk}); "
+                    "it is rendered when it is sent, and its per-sheet timings are shown on the delivery."
+                )
+                return redirect('request-list')
+            messages.success(
+                request,
+                f"{len(timings)} checkout sheet(s), {pages} page(s), queued for the printer "
+                f"as one PDF (delivery #{delivery.pk}) in {total:.0f} ms."
+            )
+            messages.info(request, "Per sheet: " + ", ".join(
+                f"#{t['request']} cached" if t['cached'] else f"#{t['request']} {t['ms']:.0f} ms"
+                for t in timings
+            ))
+        return redirect('request-list')
@@ -0,0 +1,482 @@
+# equipment/workflow.py
+#
+# The stock-changing transitions of an EquipmentRequest.
+# Both the template views and the API viewsets go through these functions,
+# so the EquipmentStock counters always move in the same transaction
+# as the status change that caused them.
+
+from django.db import transaction
+from django.db.models import F, Case, When, Value, IntegerField
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import EquipmentRequest, RequestedItem, EquipmentItem, EquipmentStock, CheckoutLog, StockChange
+
+RETURN_STATUSES = [value for value, _ in CheckoutLog.RETURN_STATUS_CHOICES]
+
+
+class WorkflowError(Exception):
+    """
+    Raised when a request (or log) is not in a state that allows the transition.
+    """
+
+
+class InsufficientStock(WorkflowError):
+    """
+    Raised when requested quantities don't fit the available stock.
+    `errors` maps item_id -> message for every line that doesn't fit.
+    """
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(' '.join(errors.values()))
+
+
+def adjust_stock(deltas):
+    """
+    Applies counter changes for several items in a single UPDATE.
+    `deltas` maps item_id -> {counter_name: change}, e.g.
+    {12: {'out': 2, 'available': -2}}.
+    Every item whose counters moved is added to the StockChange feed.
+    """
+    deltas = {
+        item_id: changes for item_id, changes in deltas.items()
+        if any(changes.values())
+    }
+    if not deltas:
+        return
+
+    updates = {'updated_at': timezone.now()}
+    counters = {name for changes in deltas.values() for name in changes}
+    for name in counters:
+        whens = [
+            When(item_id=item_id, then=Value(changes[name]))
+            for item_id, changes in deltas.items() if changes.get(name)
+        ]
+        updates[name] = F(name) + Case(*whens, default=Value(0), output_field=IntegerField())
+    EquipmentStock.objects.filter(item_id__in=deltas.keys()).update(**updates)
+    record_stock_changes(list(deltas))
+
+
+def record_stock_changes(item_ids):
+    """
+    Appends the current `available` of each item to the StockChange feed,
+    which also moves the availability snapshot's version (see live.py).
+    Call it in the transaction that changed the counters.
+    """
+    if not item_ids:
+        return
+    StockChange.objects.bulk_create([
+        StockChange(item_id=item_id, available=available)
+        for item_id, available in EquipmentStock.objects.filter(item_id__in=item_ids).values_list('item_id', 'available')
+    ])
+
+
+def load_availability(project, item_ids):
+    """
+    Loads the given items in one query, each annotated with `free_quantity`:
+    the units free within the project's dates. A request without a project
+    has no window, so it must fit beside every reservation and every unit
+    that is out, read from the global counters. Returns {item_id: item}.
+    """
+    items = EquipmentItem.objects.filter(pk__in=item_ids)
+    if project is None:
+        items = items.annotate(
+            free_quantity=F('total_quantity') - Coalesce(
+                F('stock__reserved') + F('stock__out') + F('stock__damaged'), 0
+            )
+        )
+    else:
+        items = items.with_window_availability(project.date_from, project.date_to).annotate(
+            free_quantity=F('window_available')
+        )
+    return {item.pk: item for item in items}
+
+
+def check_stock(project, lines):
+    """
+    Validates every line of a request against the stock in one go.
+    `lines` is an iterable of (item_id, quantity); an item that appears
+    more than once is checked against the sum of its quantities.
+    Returns {item_id: total quantity}, or raises InsufficientStock
+    listing every line that doesn't fit.
+    """
+    quantities = {}
+    for item_id, quantity in lines:
+        quantities[item_id] = quantities.get(item_id, 0) + quantity
+
+    items = load_availability(project, quantities.keys())
+    errors = {}
+    for item_id, quantity in quantities.items():
+        item = items.get(item_id)
+        if item is None:
+            errors[item_id] = f"Item #{item_id} does not exist."
+        elif quantity > item.free_quantity:
+            errors[item_id] = (
+                f"Not enough stock for {item.name}. "
+                f"Only {item.free_quantity} available, but {quantity} requested."
+            )
+    if errors:
+        raise InsufficientStock(errors)
+    return quantities
+
+
+def lock_request(req, allowed_statuses):
+    """
+    Re-reads the request with a row lock, so two admins acting on the
+    same request can't both apply the transition.
+    """
+    locked = EquipmentRequest.objects.select_for_update().get(pk=req.pk)
+    if locked.status not in allowed_statuses:
+        raise WorkflowError(
+            f"Request #{locked.pk} is {locked.get_status_display()}, "
+            f"expected one of: {', '.join(allowed_statuses)}."
+        )
+    return locked
+
+
+def _line_deltas(req, **signs):
+    """
+    Builds adjust_stock() deltas from the request's line items,
+    e.g. _line_deltas(req, reserved=-1, out=1, available=-1).
+    """
+    return {
+        item_id: {name: sign * quantity for name, sign in signs.items()}
+        for item_id, quantity in req.items.values_list('item_id', 'quantity')
+    }
+
+
+def lock_items(item_ids):
+    """
+    Row-locks the given EquipmentItems until the end of the transaction.
+    Only approvals that share an item wait for each other; locking in
+    primary-key order keeps two approvals from deadlocking.
+    """
+    return list(
+        EquipmentItem.objects.select_for_update()
+        .filter(pk__in=item_ids).order_by('pk').values_list('pk', flat=True)
+    )
+
+
+def approve(req):
+    """
+    PENDING -> APPROVED. Locks the requested items, checks every line
+    against the stock for the project's dates, then adds the quantities
+    to reserved. Nothing leaves the shelf until checkout.
+    """
+    with transaction.atomic():
+        req = lock_request(req, ['PENDING'])
+        lines = list(req.items.values_list('item_id', 'quantity'))
+        # Hold the item rows while checking, so a parallel approval of the
+        # same gear waits and then sees this reservation.
+        lock_items([item_id for item_id, _ in lines])
+        check_stock(req.project, lines)
+        adjust_stock(_line_deltas(req, reserved=1))
+        req.status = 'APPROVED'
+        req.save(update_fields=['status'])
+    return req
+
+
+def _windows_overlap(a, b):
+    """
+    Whether two (date_from, date_to) windows share a day. None (a request
+    without a project) overlaps everything, as it does in check_stock().
+    """
+    if a is None or b is None:
+        return True
+    return a[0] <= b[1] and b[0] <= a[1]
+
+
+def approve_pending():
+    """
+    Approves as many PENDING requests as the stock allows, in one
+    transaction. Requests are considered in a fixed order (project start
+    date, then created_at), so the outcome doesn't depend on who clicks
+    first: each one is approved only if every line fits what is left after
+    the requests before it.
+
+    Availability is read once per distinct project window and the batch's
+    own reservations are tracked in memory, so the cost doesn't grow with
+    the number of approvals. Returns
+    {'approved': [request ids], 'unfilled': [{'request': id, 'errors': {item_id: message}}]}.
+    """
+    with transaction.atomic():
+        pending = list(
+            EquipmentRequest.objects.select_for_update(of=('self',))
+            .filter(status='PENDING').select_related('project')
+            .order_by(F('project__date_from').asc(nulls_last=True), 'created_at', 'pk')
+        )
+        lines = {}
+        for request_id, item_id, quantity in RequestedItem.objects.filter(
+            request__in=pending
+        ).values_list('request_id', 'item_id', 'quantity'):
+            request_lines = lines.setdefault(request_id, {})
+            request_lines[item_id] = request_lines.get(item_id, 0) + quantity
+        item_ids = {item_id for request_lines in lines.values() for item_id in request_lines}
+        lock_items(item_ids)
+
+        def window(req):
+            return (req.project.date_from, req.project.date_to) if req.project else None
+
+        # Free units per item for each distinct window, before this batch.
+        free = {}
+        for req in pending:
+            if window(req) not in free:
+                free[window(req)] = load_availability(req.project, item_ids)
+
+        granted = {}  # item_id -> [(window, quantity)] approved in this batch
+        approved, unfilled, deltas = [], [], {}
+        for req in pending:
+            errors = {}
+            for item_id, quantity in lines.get(req.pk, {}).items():
+                item = free[window(req)][item_id]
+                left = item.free_quantity - sum(
+                    units for other, units in granted.get(item_id, [])
+                    if _windows_overlap(window(req), other)
+                )
+                if quantity > left:
+                    errors[item_id] = (
+                        f"Not enough stock for {item.name}. "
+                        f"Only {max(left, 0)} available, but {quantity} requested."
+                    )
+            if errors:
+                unfilled.append({'request': req.pk, 'errors': errors})
+                continue
+
+            for item_id, quantity in lines.get(req.pk, {}).items():
+                granted.setdefault(item_id, []).append((window(req), quantity))
+                changes = deltas.setdefault(item_id, {'reserved': 0})
+                changes['reserved'] += quantity
+            req.status = 'APPROVED'
+            req.save(update_fields=['status'])
+            approved.append(req.pk)
+
+        adjust_stock(deltas)
+    return {'approved': approved, 'unfilled': unfilled}
+
+
+def reject(req, admin_notes=None):
+    """
+    PENDING/APPROVED -> REJECTED. An approved request gives its reservation back.
+    """
+    with transaction.atomic():
+        req = lock_request(req, ['PENDING', 'APPROVED'])
+        if req.status == 'APPROVED':
+            adjust_stock(_line_deltas(req, reserved=-1))
+        req.status = 'REJECTED'
+        update_fields = ['status']
+        if admin_notes is not None:
+            req.admin_notes = admin_notes
+            update_fields.append('admin_notes')
+        req.save(update_fields=update_fields)
+    return req
+
+
+def checkout(req, user):
+    """
+    APPROVED -> CHECKED_OUT. Writes one CheckoutLog per requested item
+    (one per unit for serialized items) and moves the quantities from
+    reserved to out, off the shelf. Returns the number of units checked out.
+    """
+    with transaction.atomic():
+        req = lock_request(req, ['APPROVED'])
+        now = timezone.now()
+        logs_to_create = []
+        lines = req.items.values_list('item_id', 'quantity', 'item__is_serialized')
+        for item_id, quantity, is_serialized in lines:
+            for units in ([1] * quantity if is_serialized else [quantity]):
+                logs_to_create.append(
+                    CheckoutLog(
+                        request=req,
+                        item_id=item_id,
+                        quantity=units,
+                        checked_out_by=user,
+                        checked_out_at=now
+                    )
+                )
+        CheckoutLog.objects.bulk_create(logs_to_create)
+        adjust_stock(_line_deltas(req, reserved=-1, out=1, available=-1))
+        req.status = 'CHECKED_OUT'
+        req.save(update_fields=['status'])
+    return sum(log.quantity for log in logs_to_create)
+
+
+def _resolve_counts(counts, out, name):
+    """
+    Validates one {condition: units} mapping against the `out` units it
+    can draw from. A count of None means "all the rest".
+    """
+    if set(counts) - set(RETURN_STATUSES):
+        raise WorkflowError(f"Invalid return condition for {name}: {', '.join(map(str, counts))}.")
+    resolved = {status: n for status, n in counts.items() if n is not None}
+    if any(n < 0 for n in resolved.values()):
+        raise WorkflowError(f"Returned quantities for {name} can't be negative.")
+    rest = [status for status, n in counts.items() if n is None]
+    if len(rest) > 1:
+        raise WorkflowError(f"Only one condition can take the rest of {name}.")
+    if rest:
+        resolved[rest[0]] = max(out - sum(resolved.values()), 0)
+    total = sum(resolved.values())
+    if total > out:
+        raise WorkflowError(f"Only {out} of {name} are out, but {total} were checked in.")
+    return resolved
+
+
+def _spread_item_returns(open_logs, item_returns):
+    """
+    Turns per-item counts into per-log counts, taking each item's units
+    from its open lines oldest first.
+    """
+    lines_by_item = {}
+    for log in open_logs:
+        lines_by_item.setdefault(log.item_id, []).append(log)
+
+    returns = {}
+    for item_id, counts in item_returns.items():
+        lines = lines_by_item.get(item_id)
+        if not lines:
+            raise WorkflowError(f"Item #{item_id} is not checked out on this request.")
+        remaining = _resolve_counts(counts, sum(log.quantity for log in lines), lines[0].item.name)
+        for log in lines:
+            room = log.quantity
+            for status in RETURN_STATUSES:
+                take = min(room, remaining.get(status, 0))
+                if take:
+                    returns.setdefault(log.pk, {})[status] = take
+                    remaining[status] -= take
+                    room -= take
+    return returns
+
+
+def checkin(req, user, logs=None, items=None):
+    """
+    Checks units back in, by line or by item:
+    - `logs` maps the id of an open CheckoutLog on this request to the
+      units that came back, by condition, e.g. {41: {'GOOD': 8, 'DAMAGED': 1}}.
+    - `items` maps an item id to the same kind of counts; the units are
+      taken from that item's open lines, oldest first.
+    A count of None stands for every unit of the line (or item) not
+    otherwise accounted for. Units that are not mentioned stay out.
+
+    All open lines are read in one query, which also proves they belong to
+    this request. A line whose units all came back in one condition is
+    closed in place; otherwise the returned units are split off into closed
+    lines, one per condition. Everything is written with one bulk update and
+    one bulk insert. Each unit moves from out to available, or to damaged if
+    it came back DAMAGED or LOST. The request becomes RETURNED once nothing
+    is left out, otherwise PARTIAL_RETURN. Returns the number of units checked in.
+    """
+    with transaction.atomic():
+        req = lock_request(req, ['CHECKED_OUT', 'PARTIAL_RETURN'])
+
+        open_logs = list(
+            req.logs.filter(checked_in_at__isnull=True)
+            .select_related('item').order_by('checked_out_at', 'pk')
+        )
+        logs_by_id = {log.pk: log for log in open_logs}
+        if set(logs or {}) - logs_by_id.keys():
+            raise WorkflowError("Some items are not checked out on this request.")
+
+        returns = {
+            log_id: _resolve_counts(counts, logs_by_id[log_id].quantity, logs_by_id[log_id].item.name)
+            for log_id, counts in (logs or {}).items()
+        }
+        for log_id, counts in _spread_item_returns(open_logs, items or {}).items():
+            merged = returns.setdefault(log_id, {})
+            for status, n in counts.items():
+                merged[status] = merged.get(status, 0) + n
+
+        still_out = sum(log.quantity for log in open_logs)
+        now = timezone.now()
+        to_update, to_create, deltas = [], [], {}
+        for log_id, counts in returns.items():
+            log = logs_by_id[log_id]
+            returned = [(status, counts[status]) for status in RETURN_STATUSES if counts.get(status)]
+            total = sum(n for _, n in returned)
+            if total > log.quantity:
+                raise WorkflowError(
+                    f"Only {log.quantity} of {log.item.name} are out on this line, "
+                    f"but {total} were checked in."
+                )
+            if not total:
+                continue
+
+            if total == log.quantity:
+                # Everything on this line is back: close it with one of the
+                # conditions and split off the others.
+                log.return_status, log.quantity = returned.pop()
+                log.checked_in_by = user
+                log.checked_in_at = now
+            else:
+                log.quantity -= total
+            to_update.append(log)
+            for status, quantity in returned:
+                to_create.append(
+                    CheckoutLog(
+                        request=req,
+                        item_id=log.item_id,
+                        quantity=quantity,
+                        checked_out_by_id=log.checked_out_by_id,
+                        checked_out_at=log.checked_out_at,
+                        checked_in_by=user,
+                        checked_in_at=now,
+                        return_status=status
+                    )
+                )
+
+            changes = deltas.setdefault(log.item_id, {'out': 0, 'available': 0, 'damaged': 0})
+            changes['out'] -= total
+            changes['available'] += counts.get('GOOD', 0)
+            changes['damaged'] += counts.get('DAMAGED', 0) + counts.get('LOST', 0)
+            still_out -= total
+
+        units = sum(-changes['out'] for changes in deltas.values())
+        if not units:
+            raise WorkflowError("Nothing to check in.")
+        CheckoutLog.objects.bulk_update(
+            to_update, ['quantity', 'return_status', 'checked_in_by', 'checked_in_at']
+        )
+        CheckoutLog.objects.bulk_create(to_create)
+        adjust_stock(deltas)
+
+        req.status = 'PARTIAL_RETURN' if still_out else 'RETURNED'
+        req.save(update_fields=['status'])
+    return units
+
+
+def repair(log, quantity=None, user=None):
+    """
+    Returns `quantity` DAMAGED or LOST units of a log (default: all of
+    them) to circulation. The log is kept as history: it is stamped
+    repaired_at / repaired_by, or, when only some units are repaired,
+    those units are split off into a new, repaired row.
+    """
+    with transaction.atomic():
+        log = CheckoutLog.objects.select_for_update().needs_repair().filter(pk=log.pk).first()
+        if log is None:
+            raise WorkflowError("This item is not waiting for repair.")
+        if quantity is None:
+            quantity = log.quantity
+        if not 0 < quantity <= log.quantity:
+            raise WorkflowError(f"Can repair between 1 and {log.quantity} units of this entry.")
+
+        adjust_stock({log.item_id: {'damaged': -quantity, 'available': quantity}})
+        now = timezone.now()
+        if quantity == log.quantity:
+            log.repaired_by = user
+            log.repaired_at = now
+            log.save(update_fields=['repaired_by', 'repaired_at'])
+        else:
+            log.quantity -= quantity
+            log.save(update_fields=['quantity'])
+            CheckoutLog.objects.create(
+                request_id=log.request_id,
+                item_id=log.item_id,
+                quantity=quantity,
+                checked_out_by_id=log.checked_out_by_id,
+                checked_out_at=log.checked_out_at,
+                checked_in_by_id=log.checked_in_by_id,
+                checked_in_at=log.checked_in_at,
+                return_status=log.return_status,
+                repaired_by=user,
+                repaired_at=now,
+            )
+    return log
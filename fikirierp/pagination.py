@@ -0,0 +1,201 @@
+# fikirierp/pagination.py
+#
+# Default pagination for every API list endpoint (see REST_FRAMEWORK in
+# settings.py). Cursor pagination keeps each page a bounded index range
+# scan however far a client pages, where page numbers would make the
+# database count and skip every row before the page.
+
+import json
+from functools import reduce
+from operator import and_, or_
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import FloatField, Q
+from django.db.models.functions import Cast
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class OrderedCursorPagination(CursorPagination):
+    """
+    Cursor pagination that follows each endpoint's own ordering (the
+    queryset's order_by(), else the model's Meta.ordering, e.g.
+    -timestamp or -date_from) with the primary key as a tie-breaker, so
+    rows sharing a date still come back in a stable order.
+    Clients pick the page size with ?page_size=, up to max_page_size.
+
+    DRF's cursor only stores the first ordering field and counts tied rows
+    with an offset, which breaks down once many rows share a value. Here
+    the cursor stores every ordering field, pk included, and the next page
+    starts strictly after that (field, ..., pk) key, so ties never need an
+    offset.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def get_ordering(self, request, queryset, view):
+        query = queryset.query
+        if query.order_by:
+            requested = query.order_by
+        elif query.default_ordering:
+            requested = queryset.model._meta.ordering
+        else:
+            requested = ()
+
+        # The cursor stores the ordering fields' values, so only plain
+        # columns and annotations can take part; stop at anything else (a
+        # relation, a lookup across one, an expression).
+        ordering = []
+        for field in requested:
+            if not isinstance(field, str) or not self._is_cursor_field(queryset, field.lstrip('-')):
+                break
+            ordering.append(field)
+
+        descending = bool(ordering) and ordering[0].startswith('-')
+        if not any(field.lstrip('-') in ('pk', 'id') for field in ordering):
+            ordering.append('-pk' if descending else 'pk')
+        return tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        queryset, self.ordering = self._exact_floats(queryset, self.get_ordering(request, queryset, view))
+        self.nullable = {field.lstrip('-') for field in self.ordering if self._is_nullable(queryset, field.lstrip('-'))}
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            offset, reverse, current_position = 0, False, None
+        else:
+            offset, reverse, current_position = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if current_position is not None:
+            queryset = queryset.filter(self._after(json.loads(current_position), reverse))
+
+        # One extra row tells whether there is a page after this one.
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            following_position = None
+
+        started = current_position is not None or offset > 0
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = started, following_position is not None
+            self.next_position, self.previous_position = current_position, following_position
+        else:
+            self.has_next, self.has_previous = following_position is not None, started
+            self.next_position, self.previous_position = following_position, current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is not None and cursor.position is not None:
+            try:
+                values = json.loads(cursor.position)
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering:
+            name = field.lstrip('-')
+            value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            values.append(None if value is None else str(value))
+        return json.dumps(values)
+
+    def _after(self, values, reverse):
+        """
+        Rows that come after the row with these ordering values (before it,
+        if `reverse`): the first field past its value, or equal on it and
+        past on the second, and so on down to the pk.
+        """
+        after = reduce(or_, self._branches(values, reverse))
+        first, value = self.ordering[0], values[0]
+        name = first.lstrip('-')
+        if value is None or name in self.nullable:
+            return after
+        # The same rows, plus a plain range on the first field that the
+        # database can use as an index bound; the OR alone it can only
+        # filter row by row from the start of the index.
+        bound = 'lte' if first.startswith('-') != reverse else 'gte'
+        return Q(**{f'{name}__{bound}': value}) & after
+
+    def _branches(self, values, reverse):
+        branches = []
+        tied = []
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            if field.startswith('-') != reverse:
+                branches.append(reduce(and_, tied, self._below(name, value)))
+            else:
+                branches.append(reduce(and_, tied, self._above(name, value)))
+            tied.append(Q(**{f'{name}__isnull': True}) if value is None else Q(**{name: value}))
+        return branches
+
+    @staticmethod
+    def _exact_floats(queryset, ordering):
+        """
+        Float annotations can be float4 in SQL (pg_trgm's similarity is a
+        `real`), and the text psycopg reads back for those doesn't compare
+        equal to the stored number, so the next page would repeat the
+        cursor's row and its ties. Such fields are ordered and keyed on a
+        float8 copy instead, whose value round-trips through the cursor.
+        """
+        exact = []
+        for field in ordering:
+            name = field.lstrip('-')
+            annotation = queryset.query.annotations.get(name)
+            if annotation is not None and isinstance(annotation.output_field, FloatField):
+                alias = f'{name}_cursor'
+                queryset = queryset.annotate(**{alias: Cast(name, FloatField())})
+                field = field[:len(field) - len(name)] + alias
+            exact.append(field)
+        return queryset, tuple(exact)
+
+    # PostgreSQL sorts NULL above every value: last going up, first going down.
+
+    def _above(self, name, value):
+        if value is None:
+            return Q(pk__in=[])
+        above = Q(**{f'{name}__gt': value})
+        return above | Q(**{f'{name}__isnull': True}) if name in self.nullable else above
+
+    def _below(self, name, value):
+        if value is None:
+            return Q(**{f'{name}__isnull': False})
+        return Q(**{f'{name}__lt': value})
+
+    @staticmethod
+    def _is_cursor_field(queryset, name):
+        if name in ('pk', 'id') or name in queryset.query.annotations:
+            return True
+        try:
+            field = queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        return field.concrete and not field.is_relation
+
+    @staticmethod
+    def _is_nullable(queryset, name):
+        if name in ('pk', 'id'):
+            return False
+        if name in queryset.query.annotations:
+            return True
+        return queryset.model._meta.get_field(name).null
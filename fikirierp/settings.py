@@ -334,6 +334,7 @@ Django settings for fikirierp project.
 
 from pathlib import Path
 import os
+import tempfile
 from urllib.parse import urlparse, parse_qsl
 import dj_database_url
 from dotenv import load_dotenv
@@ -374,6 +375,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'whitenoise.runserver_nostatic',  # Must be before staticfiles
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Third-party apps
     'django.contrib.sites',
@@ -508,6 +510,26 @@ else:
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# --- CACHES ---
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered checkout-sheet PDFs, keyed by a hash of the sheet's content
+    # (see equipment/pdf.py), so entries never go stale and only need evicting.
+    'checkout_sheets': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CHECKOUT_SHEET_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'fikirierp-checkout-sheets')),
+        'TIMEOUT': 60 * 60 * 24 * 30,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CHECKOUT_SHEET_CACHE_ENTRIES', 1000)),
+            'CULL_FREQUENCY': 4,  # Drop a quarter of the files when full
+        },
+    },
+}
+
+
 # --- AUTHENTICATION CONFIG ---
 
 AUTHENTICATION_BACKENDS = [
@@ -533,6 +555,9 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # Every list endpoint is cursor-paged on its own ordering: ?cursor=, ?page_size= (max 200).
+    'DEFAULT_PAGINATION_CLASS': 'fikirierp.pagination.OrderedCursorPagination',
+    'PAGE_SIZE': 50,
 }
 
 REST_AUTH = {
@@ -40,11 +40,12 @@ from rest_framework.routers import DefaultRouter
 from users.api_views import UserViewSet
 from projects.api_views import ProjectViewSet, ServiceViewSet
 from equipment.api_views import (
-    EquipmentItemViewSet, EquipmentRequestViewSet, RepairLogViewSet
+    EquipmentItemViewSet, EquipmentRequestViewSet, RepairLogViewSet, EquipmentUnitViewSet
 )
 from finance.api_views import (
     AccountViewSet, ExpenseViewSet, TransactionViewSet
 )
+from core.api_views import OutboundEmailViewSet
 
 # Create Router
 router = DefaultRouter()
@@ -54,9 +55,11 @@ router.register(r'services', ServiceViewSet)
 router.register(r'equipment/items', EquipmentItemViewSet)
 router.register(r'equipment/requests', EquipmentRequestViewSet)
 router.register(r'equipment/repair-log', RepairLogViewSet, basename='repair-log')
+router.register(r'equipment/units', EquipmentUnitViewSet)
 router.register(r'finance/accounts', AccountViewSet)
 router.register(r'finance/expenses', ExpenseViewSet)
 router.register(r'finance/transactions', TransactionViewSet)
+router.register(r'outbox', OutboundEmailViewSet)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -2,14 +2,21 @@
 # (Edit this file)
 
 from django.contrib import admin
-from .models import Account, Expense, Transaction, Asset
+from .models import Account, Expense, Transaction, Asset, Posting
 
 @admin.register(Account)
 class AccountAdmin(admin.ModelAdmin):
     # --- MODIFIED ---
-    list_display = ('name', 'get_balance') # Use the property
+    list_display = ('name', 'balance')
     search_fields = ('name',)
-    readonly_fields = ('get_balance',) # Make the property readonly
+    readonly_fields = ('balance',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_balance()
+
+    @admin.display(description='Balance', ordering='balance')
+    def balance(self, obj):
+        return obj.get_balance if obj.pk else None
 
 @admin.register(Expense)
 class ExpenseAdmin(admin.ModelAdmin):
@@ -31,9 +38,24 @@ class ExpenseAdmin(admin.ModelAdmin):
     )
     autocomplete_fields = ['project', 'staff_member', 'added_by', 'account'] # <-- ADDED account
 
+class PostingInline(admin.TabularInline):
+    """
+    The account legs written from the transaction; read-only, since
+    saving the transaction rewrites them.
+    """
+    model = Posting
+    fields = ('account', 'amount', 'timestamp')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 # --- NEW REGISTRATION ---
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
+    inlines = [PostingInline]
     list_display = (
         'timestamp', 
         'description', 
@@ -1,20 +1,86 @@
-from rest_framework import viewsets, status, filters
+from rest_framework import viewsets, status, filters, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.utils.urls import replace_query_param
+from datetime import datetime, time, timedelta
 from decimal import Decimal
 from .models import Account, Transaction, Expense
-from .serializers import AccountSerializer, TransactionSerializer, ExpenseSerializer
+from . import statements
+from .serializers import AccountSerializer, TransactionSerializer, ExpenseSerializer, StatementEntrySerializer
 from projects.models import Project
 
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+def _optional_date(value):
+    """
+    A YYYY-MM-DD query parameter as a date, None if it is missing.
+    Raises ValueError if it is there but isn't a date.
+    """
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return day
+
 # Accounts are generally read-only for the frontend, but if you want 
 # to create them via API later, you can change this to ModelViewSet too.
 class AccountViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Account.objects.all()
+    queryset = Account.objects.with_balance()
     serializer_class = AccountSerializer
     permission_classes = [IsAdminUser]
 
+    @action(detail=True, methods=['get'])
+    def statement(self, request, pk=None):
+        """
+        The account's transactions, oldest first, with the running balance
+        after each one. Paged by cursor: follow `next` for the following page.
+        URL: /api/v1/finance/accounts/<id>/statement/?from=2025-01-01&to=2025-03-31
+        Optional: &limit=<1-500> (default 50).
+        """
+        account = self.get_object()
+        try:
+            start = _optional_date(request.query_params.get('from'))
+            end = _optional_date(request.query_params.get('to'))
+        except ValueError:
+            return Response({'error': "'from' and 'to' must be dates (YYYY-MM-DD)."}, status=status.HTTP_400_BAD_REQUEST)
+        if start and end and start > end:
+            return Response({'error': "'from' must not be after 'to'."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', statements.PAGE_SIZE))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= statements.MAX_PAGE_SIZE:
+            return Response({'error': f"'limit' must be between 1 and {statements.MAX_PAGE_SIZE}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            page = statements.statement_page(
+                account,
+                start=_day_start(start) if start else None,
+                end=_day_start(end + timedelta(days=1)) if end else None,
+                after=request.query_params.get('cursor'),
+                limit=limit,
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        next_url = None
+        if page['next']:
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', page['next'])
+        return Response({
+            'account': {'id': account.pk, 'name': account.name},
+            'from': start,
+            'to': end,
+            'opening_balance': serializers.DecimalField(max_digits=14, decimal_places=2).to_representation(page['opening_balance']),
+            'next': next_url,
+            'transactions': StatementEntrySerializer(page['entries'], many=True).data,
+        })
+
 class ExpenseViewSet(viewsets.ModelViewSet):
     queryset = Expense.objects.all().order_by('-expense_date')
     serializer_class = ExpenseSerializer
@@ -0,0 +1,46 @@
+# finance/management/commands/backfill_postings.py
+#
+# Writes the Postings for transactions recorded before the postings table
+# existed. Works through the ledger in primary-key batches, each in its
+# own transaction, and only touches transactions that have no postings,
+# so it can be stopped and re-run at any point. A run with nothing left
+# to do costs one query; build.sh runs it after every migrate.
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from finance.models import Transaction, Posting
+
+
+class Command(BaseCommand):
+    help = "Creates the missing Postings for existing transactions, in resumable batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help="Transactions per batch.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        missing = Transaction.objects.filter(postings__isnull=True).exclude(
+            from_account__isnull=True, to_account__isnull=True
+        )
+        last_pk = 0
+        done = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    missing.filter(pk__gt=last_pk).order_by('pk').select_for_update(of=('self',))
+                    .only('pk', 'amount', 'timestamp', 'from_account', 'to_account')[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                Posting.objects.bulk_create([
+                    Posting(transaction=tx, account_id=account_id, amount=amount, timestamp=tx.timestamp)
+                    for tx in batch
+                    for account_id, amount in tx.posting_legs()
+                ])
+            last_pk = batch[-1].pk
+            done += len(batch)
+            self.stdout.write(f"Backfilled {done} transaction(s), up to #{last_pk}.")
+
+        self.stdout.write(self.style.SUCCESS(f"Postings are complete ({done} transaction(s) backfilled)."))
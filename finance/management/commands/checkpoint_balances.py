@@ -0,0 +1,36 @@
+# finance/management/commands/checkpoint_balances.py
+#
+# Writes an AccountCheckpoint for every account, so balance reads only sum
+# the transactions after it. Each checkpoint is built from the previous one
+# plus the transactions since, so a run costs one query whatever the size
+# of the ledger. Run it nightly (or at period close) from cron.
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from finance.models import Account, AccountCheckpoint
+
+# Checkpoints stop this far in the past, so a transaction that was stamped
+# but not yet committed when the command runs still lands after them.
+CHECKPOINT_LAG = timedelta(minutes=10)
+
+
+class Command(BaseCommand):
+    help = "Checkpoints every account's balance, so balance reads skip older transactions."
+
+    def handle(self, *args, **options):
+        as_of = timezone.now() - CHECKPOINT_LAG
+
+        with transaction.atomic():
+            accounts = Account.objects.with_balance(as_of=as_of).filter(checkpoint_as_of__lt=as_of)
+            checkpoints = [
+                AccountCheckpoint(account=account, as_of=as_of, balance=account.balance)
+                for account in accounts
+            ]
+            AccountCheckpoint.objects.bulk_create(checkpoints)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Checkpointed {len(checkpoints)} account(s) as of {timezone.localtime(as_of):%Y-%m-%d %H:%M}."
+        ))
@@ -0,0 +1,61 @@
+# finance/management/commands/verify_balances.py
+#
+# Recomputes every account's balance from the whole ledger, reading the
+# transactions in primary-key chunks so memory stays flat, and compares it
+# with the checkpointed balance. Exits with an error if any account differs.
+
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from finance.models import Account, Transaction
+
+
+class Command(BaseCommand):
+    help = "Checks each account's checkpointed balance against a full recount of the ledger."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Transactions read per query.")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        # Compare both sides as of one moment, so new transactions don't count as mismatches.
+        as_of = timezone.now()
+
+        totals = {}
+        last_pk = 0
+        counted = 0
+        while True:
+            chunk = list(
+                Transaction.objects.filter(pk__gt=last_pk, timestamp__lte=as_of).order_by('pk')
+                .values_list('pk', 'from_account_id', 'to_account_id', 'amount')[:options['chunk_size']]
+            )
+            if not chunk:
+                break
+            for pk, from_account_id, to_account_id, amount in chunk:
+                if to_account_id is not None:
+                    totals[to_account_id] = totals.get(to_account_id, Decimal('0.00')) + amount
+                if from_account_id is not None:
+                    totals[from_account_id] = totals.get(from_account_id, Decimal('0.00')) - amount
+            last_pk = chunk[-1][0]
+            counted += len(chunk)
+
+        mismatches = 0
+        accounts = Account.objects.with_balance(as_of=as_of)
+        for account in accounts:
+            expected = totals.get(account.pk, Decimal('0.00'))
+            if account.balance != expected:
+                mismatches += 1
+                self.stdout.write(self.style.ERROR(
+                    f"{account.name}: balance {account.balance}, ledger {expected} "
+                    f"(checkpoint as of {timezone.localtime(account.checkpoint_as_of):%Y-%m-%d %H:%M})"
+                ))
+
+        summary = f"Checked {len(accounts)} account(s) against {counted} transaction(s)"
+        if mismatches:
+            raise CommandError(
+                f"{summary}: {mismatches} mismatch(es). Delete the affected accounts' "
+                "checkpoints and run checkpoint_balances again."
+            )
+        self.stdout.write(self.style.SUCCESS(f"{summary}: all balances match."))
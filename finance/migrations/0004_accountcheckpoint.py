@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0003_expense_category'),
+        ('projects', '0004_project_description_service_department_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateTimeField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['account', '-as_of'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['from_account', 'timestamp'], name='fin_tx_from_account_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['to_account', 'timestamp'], name='fin_tx_to_account_ts_idx'),
+        ),
+        migrations.AddField(
+            model_name='accountcheckpoint',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='finance.account'),
+        ),
+        migrations.AddConstraint(
+            model_name='accountcheckpoint',
+            constraint=models.UniqueConstraint(fields=('account', 'as_of'), name='fin_checkpoint_account_as_of_uniq'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0004_accountcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Posting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('timestamp', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='fin_tx_from_account_ts_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='fin_tx_to_account_ts_idx',
+        ),
+        migrations.AddField(
+            model_name='posting',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='postings', to='finance.account'),
+        ),
+        migrations.AddField(
+            model_name='posting',
+            name='transaction',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='finance.transaction'),
+        ),
+        migrations.AddIndex(
+            model_name='posting',
+            index=models.Index(fields=['account', 'timestamp', 'amount'], name='fin_posting_account_ts_amt_idx'),
+        ),
+    ]
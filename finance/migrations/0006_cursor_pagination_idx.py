@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0005_posting'),
+        ('projects', '0005_cursor_pagination_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['expense_date', 'id'], name='fin_expense_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['timestamp', 'id'], name='fin_tx_timestamp_id_idx'),
+        ),
+    ]
@@ -1,18 +1,65 @@
 # finance/models.py
 # (This is the complete, corrected file)
 
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from projects.models import Project
-from django.db.models import Sum, Q
+from django.db.models import Sum, Q, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from datetime import datetime, timezone as dt_timezone
 from decimal import Decimal # <-- 1. ADD THIS IMPORT
 
+# Stands in for "no checkpoint yet": every transaction is newer than this.
+LEDGER_START = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+def _money(expression):
+    return Coalesce(
+        expression, Value(Decimal('0.00')),
+        output_field=models.DecimalField(max_digits=14, decimal_places=2)
+    )
+
+def _postings_total(as_of=None):
+    """
+    The sum of the outer account's postings newer than its checkpoint (and
+    no newer than `as_of`), as a scalar subquery answered from the
+    (account, timestamp, amount) index alone.
+    """
+    postings = Posting.objects.filter(account=OuterRef('pk'), timestamp__gt=OuterRef('checkpoint_as_of'))
+    if as_of is not None:
+        postings = postings.filter(timestamp__lte=as_of)
+    totals = postings.order_by().values('account').annotate(total=Sum('amount')).values('total')
+    return _money(Subquery(totals))
+
+class AccountQuerySet(models.QuerySet):
+    def with_balance(self, as_of=None):
+        """
+        Annotates every account with `balance` (credits minus debits), in the
+        same query that loads the accounts: the latest AccountCheckpoint plus
+        the postings since. With `as_of`, the balance at that moment.
+        Also annotates `checkpoint_as_of` (LEDGER_START without a checkpoint).
+        """
+        checkpoints = AccountCheckpoint.objects.filter(account=OuterRef('pk'))
+        if as_of is not None:
+            checkpoints = checkpoints.filter(as_of__lte=as_of)
+        checkpoints = checkpoints.order_by('-as_of')
+        return self.annotate(
+            checkpoint_as_of=Coalesce(
+                Subquery(checkpoints.values('as_of')[:1]), Value(LEDGER_START),
+                output_field=models.DateTimeField()
+            ),
+            checkpoint_balance=_money(Subquery(checkpoints.values('balance')[:1])),
+        ).annotate(
+            balance=F('checkpoint_balance') + _postings_total(as_of),
+        )
+
 class Account(models.Model):
     """
     Represents a financial account, e.g., "Main", "Admin Petty Cash", "Sound Dept"
     """
     name = models.CharField(max_length=100, unique=True)
 
+    objects = AccountQuerySet.as_manager()
+
     class Meta:
         ordering = ['name']
 
@@ -22,16 +69,14 @@ class Account(models.Model):
     @property
     def get_balance(self):
         """
-        Calculates the balance by summing all transactions related to this account.
+        The latest checkpoint plus the transactions related to this account since.
         Credits (money in) are positive. Debits (money out) are negative.
+        Lists should load accounts with Account.objects.with_balance() and
+        read `balance` instead; this is for a single account.
         """
-        
-        # --- 2. THIS IS THE FIX ---
-        # We use Decimal('0.00') instead of the float 0.00
-        credits = Transaction.objects.filter(to_account=self).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        debits = Transaction.objects.filter(from_account=self).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        
-        return credits - debits
+        if hasattr(self, 'balance'):
+            return self.balance
+        return Account.objects.with_balance().get(pk=self.pk).balance
 
 class Transaction(models.Model):
     """
@@ -71,10 +116,87 @@ class Transaction(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # The API's cursor pages: -timestamp, ties broken on id.
+            models.Index(fields=['timestamp', 'id'], name='fin_tx_timestamp_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.description} - {self.amount}"
 
+    def save(self, *args, **kwargs):
+        # The postings are rewritten with the row, in the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.write_postings()
+
+    def posting_legs(self):
+        """
+        The (account_id, signed amount) legs of this transaction: the credit
+        to to_account and the debit from from_account, whichever are set.
+        """
+        legs = []
+        if self.to_account_id is not None:
+            legs.append((self.to_account_id, self.amount))
+        if self.from_account_id is not None:
+            legs.append((self.from_account_id, -self.amount))
+        return legs
+
+    def write_postings(self):
+        """
+        Replaces this transaction's postings with its current legs.
+        """
+        self.postings.all().delete()
+        Posting.objects.bulk_create([
+            Posting(transaction=self, account_id=account_id, amount=amount, timestamp=self.timestamp)
+            for account_id, amount in self.posting_legs()
+        ])
+
+class Posting(models.Model):
+    """
+    One account's side of a Transaction: + for money in, - for money out.
+    Written (and rewritten) by Transaction.save(), so per-account reads hit
+    one column instead of OR-ing from_account and to_account. The ledger
+    from before this table is filled in by the backfill_postings command.
+    """
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='postings')
+    account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='postings')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    # The transaction's timestamp, copied so account reads never join back.
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            # Balances and statements are index-only scans of one account's range.
+            models.Index(fields=['account', 'timestamp', 'amount'], name='fin_posting_account_ts_amt_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.account.name}: {self.amount}"
+
+class AccountCheckpoint(models.Model):
+    """
+    An account's balance at a moment (`as_of`): every transaction up to and
+    including as_of, summed. Balances start from the latest checkpoint and
+    only add the transactions after it. Written by the checkpoint_balances
+    command; changing an older transaction drops the checkpoints it affects
+    (see finance/signals.py).
+    """
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='checkpoints')
+    as_of = models.DateTimeField()
+    balance = models.DecimalField(max_digits=14, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['account', '-as_of']
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'as_of'], name='fin_checkpoint_account_as_of_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.account.name} @ {self.as_of:%Y-%m-%d %H:%M}: {self.balance}"
+
 class Expense(models.Model):
     """
     Represents a single expense, now linked to an Account.
@@ -114,6 +236,10 @@ class Expense(models.Model):
 
     class Meta:
         ordering = ['-expense_date']
+        indexes = [
+            # The API's cursor pages: -expense_date, ties broken on id.
+            models.Index(fields=['expense_date', 'id'], name='fin_expense_date_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.description} - {self.amount}"
@@ -2,12 +2,25 @@ from rest_framework import serializers
 from .models import Account, Transaction, Expense
 
 class AccountSerializer(serializers.ModelSerializer):
-    balance = serializers.DecimalField(source='get_balance', max_digits=12, decimal_places=2, read_only=True)
+    # Read from Account.objects.with_balance(); see AccountViewSet.
+    balance = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
     
     class Meta:
         model = Account
         fields = ['id', 'name', 'balance']
 
+class StatementEntrySerializer(serializers.Serializer):
+    """
+    One line of an account statement (see finance/statements.py).
+    """
+    id = serializers.IntegerField()
+    transaction = serializers.IntegerField()
+    timestamp = serializers.DateTimeField()
+    description = serializers.CharField()
+    project = serializers.IntegerField(allow_null=True)
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    balance = serializers.DecimalField(max_digits=14, decimal_places=2)
+
 class TransactionSerializer(serializers.ModelSerializer):
     from_account_name = serializers.CharField(source='from_account.name', read_only=True)
     to_account_name = serializers.CharField(source='to_account.name', read_only=True)
@@ -0,0 +1,42 @@
+# finance/signals.py
+#
+# Keeps AccountCheckpoints honest: a checkpoint sums every transaction up
+# to its as_of, so editing or deleting one of those transactions drops the
+# checkpoints it falls under. Balances then fall back to the previous
+# checkpoint (or the whole ledger) until checkpoint_balances runs again.
+# QuerySet.update() and .delete() bypass this; run verify_balances after those.
+
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from .models import Transaction, AccountCheckpoint
+
+def _ledger_entry(instance):
+    return (instance.from_account_id, instance.to_account_id, instance.amount)
+
+def _drop_checkpoints(account_ids, since):
+    account_ids = {pk for pk in account_ids if pk is not None}
+    if account_ids and since is not None:
+        AccountCheckpoint.objects.filter(account__in=account_ids, as_of__gte=since).delete()
+
+@receiver(post_init, sender=Transaction)
+def remember_ledger_entry(sender, instance, **kwargs):
+    """
+    The accounts and amount as loaded, so an edit can tell what it changed.
+    """
+    loaded = instance.pk and not instance.get_deferred_fields()
+    instance._saved_entry = _ledger_entry(instance) if loaded else None
+
+@receiver(post_save, sender=Transaction)
+def drop_checkpoints_on_edit(sender, instance, created, **kwargs):
+    """
+    A new transaction is newer than every checkpoint; an edited one may not be.
+    """
+    saved = instance._saved_entry
+    if not created and saved != _ledger_entry(instance):
+        # Without the loaded values (deferred fields), assume it changed.
+        _drop_checkpoints((saved or (None, None))[:2] + _ledger_entry(instance)[:2], instance.timestamp)
+    instance._saved_entry = _ledger_entry(instance)
+
+@receiver(post_delete, sender=Transaction)
+def drop_checkpoints_on_delete(sender, instance, **kwargs):
+    _drop_checkpoints(_ledger_entry(instance)[:2], instance.timestamp)
@@ -0,0 +1,116 @@
+# finance/statements.py
+#
+# Account statements: an account's postings between two dates, oldest
+# first, each with the running balance after it. The running balance is a
+# SUM() window over the page, offset by the balance just before the page,
+# and pages are keyed on (timestamp, id) rather than numbered, so every
+# page costs the same two index range scans however deep it is.
+
+import base64
+import binascii
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import F, Q, Sum, Window
+from django.db.models.expressions import RowRange
+from django.utils.dateparse import parse_datetime
+
+from .models import Account, Posting
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(posting):
+    raw = f"{posting.timestamp.isoformat()}|{posting.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    (timestamp, posting id) from a cursor made by encode_cursor().
+    Raises ValueError if it isn't one.
+    """
+    try:
+        timestamp, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        timestamp = parse_datetime(timestamp)
+        pk = int(pk)
+    except (binascii.Error, UnicodeError, ValueError) as e:
+        raise ValueError("Invalid cursor.") from e
+    if timestamp is None:
+        raise ValueError("Invalid cursor.")
+    return timestamp, pk
+
+
+def balance_before(account, timestamp):
+    """
+    The account's balance just before `timestamp`.
+    """
+    return Account.objects.with_balance(as_of=timestamp - timedelta(microseconds=1)).get(pk=account.pk).balance
+
+
+def balance_through(account, timestamp, posting_id):
+    """
+    The account's balance right after the posting (timestamp, posting_id):
+    everything up to `timestamp`, less the postings that share the
+    timestamp but come later in (timestamp, id) order.
+    """
+    through = Account.objects.with_balance(as_of=timestamp).get(pk=account.pk).balance
+    later = Posting.objects.filter(
+        account=account, timestamp=timestamp, pk__gt=posting_id
+    ).aggregate(total=Sum('amount'))['total']
+    return through - (later or 0)
+
+
+def statement_page(account, start=None, end=None, after=None, limit=PAGE_SIZE):
+    """
+    One page of the account's statement for [start, end) (aware datetimes,
+    either may be None), continuing after the cursor `after`. Returns
+    {'opening_balance', 'entries', 'next'}: the balance before the first
+    entry, up to `limit` entries with their running balance, and the cursor
+    for the next page (None on the last one).
+    """
+    postings = Posting.objects.filter(account=account)
+    if start is not None:
+        postings = postings.filter(timestamp__gte=start)
+    if end is not None:
+        postings = postings.filter(timestamp__lt=end)
+
+    if after is not None:
+        timestamp, posting_id = decode_cursor(after)
+        postings = postings.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, pk__gt=posting_id))
+        opening = balance_through(account, timestamp, posting_id)
+    elif start is not None:
+        opening = balance_before(account, start)
+    else:
+        opening = Decimal('0.00')
+
+    page = list(
+        postings.select_related('transaction').annotate(
+            running=Window(
+                Sum('amount'),
+                order_by=[F('timestamp').asc(), F('pk').asc()],
+                frame=RowRange(start=None, end=0),
+            )
+        ).order_by('timestamp', 'pk')[:limit + 1]
+    )
+    more = len(page) > limit
+    page = page[:limit]
+
+    entries = [
+        {
+            'id': posting.pk,
+            'transaction': posting.transaction_id,
+            'timestamp': posting.timestamp,
+            'description': posting.transaction.description,
+            'project': posting.transaction.project_id,
+            'amount': posting.amount,
+            'balance': opening + posting.running,
+        }
+        for posting in page
+    ]
+    return {
+        'opening_balance': opening,
+        'entries': entries,
+        'next': encode_cursor(page[-1]) if more else None,
+    }
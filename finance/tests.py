@@ -1,3 +1,193 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIClient
+from fikirierp.pagination import OrderedCursorPagination
+from .models import Account, AccountCheckpoint, Transaction
+
+
+def record(amount, at, to_account=None, from_account=None, description="Transfer"):
+    """
+    A transaction stamped `at` (timestamp is auto_now_add, so it is moved after the insert).
+    """
+    entry = Transaction.objects.create(
+        amount=Decimal(amount), description=description, to_account=to_account, from_account=from_account,
+    )
+    entry.timestamp = at
+    entry.save()
+    return entry
+
+
+def balance(account, as_of=None):
+    return Account.objects.with_balance(as_of=as_of).get(pk=account.pk).balance
+
+
+class CheckpointBalanceTests(TestCase):
+    def setUp(self):
+        self.main = Account.objects.create(name='Main')
+        self.petty = Account.objects.create(name='Petty Cash')
+        self.now = timezone.now()
+        self.old = record('1000.00', self.now - timedelta(days=3), to_account=self.main)
+        record('150.00', self.now - timedelta(days=2), to_account=self.petty, from_account=self.main)
+
+    def test_balances_start_from_the_checkpoint(self):
+        call_command('checkpoint_balances', stdout=StringIO())
+        self.assertEqual(
+            dict(AccountCheckpoint.objects.values_list('account__name', 'balance')),
+            {'Main': Decimal('850.00'), 'Petty Cash': Decimal('150.00')},
+        )
+        record('25.50', self.now, from_account=self.petty)
+
+        self.assertEqual(balance(self.main), Decimal('850.00'))
+        self.assertEqual(balance(self.petty), Decimal('124.50'))
+        # Before the checkpoint, the older ledger is summed instead.
+        self.assertEqual(balance(self.main, as_of=self.now - timedelta(days=2, hours=1)), Decimal('1000.00'))
+        call_command('verify_balances', stdout=StringIO())
+
+    def test_a_new_checkpoint_builds_on_the_previous_one(self):
+        AccountCheckpoint.objects.create(account=self.main, as_of=self.now - timedelta(days=1), balance=Decimal('850.00'))
+        record('10.00', self.now - timedelta(hours=1), to_account=self.main)
+        call_command('checkpoint_balances', stdout=StringIO())
+
+        self.assertEqual(
+            list(self.main.checkpoints.values_list('balance', flat=True)),
+            [Decimal('860.00'), Decimal('850.00')],
+        )
+
+    def test_editing_an_old_transaction_drops_the_checkpoints_after_it(self):
+        call_command('checkpoint_balances', stdout=StringIO())
+        self.old.amount = Decimal('900.00')
+        self.old.save()
+
+        self.assertFalse(self.main.checkpoints.exists())
+        self.assertTrue(self.petty.checkpoints.exists())
+        self.assertEqual(balance(self.main), Decimal('750.00'))
+
+        self.old.delete()
+        self.assertEqual(balance(self.main), Decimal('-150.00'))
+        call_command('verify_balances', stdout=StringIO())
+
+    def test_verify_balances_reports_a_wrong_checkpoint(self):
+        call_command('checkpoint_balances', stdout=StringIO())
+        AccountCheckpoint.objects.filter(account=self.petty).update(balance=Decimal('151.00'))
+
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, "1 mismatch(es)"):
+            call_command('verify_balances', stdout=out)
+        self.assertIn("Petty Cash: balance 151.00, ledger 150.00", out.getvalue())
+
+
+class StatementTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(User.objects.create_user('accounts', password='secret', is_staff=True))
+        self.main = Account.objects.create(name='Main')
+        other = Account.objects.create(name='Sound Dept')
+        self.day = timezone.localdate() - timedelta(days=5)
+        noon = timezone.make_aware(datetime.combine(self.day, time(12)))
+        record('100.00', noon - timedelta(days=1), to_account=self.main)
+        record('50.00', noon, to_account=self.main)
+        # Three postings at one moment, split across pages below.
+        record('20.00', noon + timedelta(hours=1), from_account=self.main, to_account=other)
+        record('5.00', noon + timedelta(hours=1), to_account=self.main)
+        record('10.00', noon + timedelta(hours=1), from_account=self.main)
+        record('40.00', noon + timedelta(days=2), to_account=self.main)
+        AccountCheckpoint.objects.create(account=self.main, as_of=noon + timedelta(hours=1), balance=Decimal('125.00'))
+        self.url = f'/api/v1/finance/accounts/{self.main.pk}/statement/'
+
+    def test_running_balance_carries_across_cursor_pages(self):
+        body = self.api.get(self.url, {'from': self.day, 'limit': 2}).json()
+        self.assertEqual(body['opening_balance'], '100.00')
+
+        pages = []
+        while True:
+            pages.append([(entry['amount'], entry['balance']) for entry in body['transactions']])
+            if not body['next']:
+                break
+            body = self.api.get(body['next']).json()
+
+        self.assertEqual(pages, [
+            [('50.00', '150.00'), ('-20.00', '130.00')],
+            [('5.00', '135.00'), ('-10.00', '125.00')],
+            [('40.00', '165.00')],
+        ])
+
+    def test_to_limits_the_statement_and_no_from_starts_at_zero(self):
+        body = self.api.get(self.url, {'to': self.day}).json()
+
+        self.assertEqual(body['opening_balance'], '0.00')
+        self.assertEqual([entry['balance'] for entry in body['transactions']], ['100.00', '150.00', '130.00', '135.00', '125.00'])
+        self.assertIsNone(body['next'])
+
+    def test_rejects_bad_parameters(self):
+        for params in [{'from': '2025-13-01'}, {'from': '2025-03-02', 'to': '2025-03-01'}, {'limit': 0}, {'cursor': 'nope'}]:
+            with self.subTest(params=params):
+                response = self.api.get(self.url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+
+class TransactionPaginationTests(TestCase):
+    URL = 'http://testserver/api/v1/finance/transactions/'
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(User.objects.create_user('accounts', password='secret', is_staff=True))
+
+    def seed(self, count):
+        """
+        `count` transactions a minute apart, two to a minute so pages end inside ties.
+        """
+        Transaction.objects.all().delete()
+        entries = Transaction.objects.bulk_create(
+            Transaction(amount=Decimal('1.00'), description=f"Entry {n}") for n in range(count)
+        )
+        start = timezone.now() - timedelta(days=30)
+        for n, entry in enumerate(entries):
+            entry.timestamp = start + timedelta(minutes=n // 2)
+        Transaction.objects.bulk_update(entries, ['timestamp'], batch_size=1000)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE finance_transaction')
+
+    def deep_page(self):
+        """
+        The page after the row nine tenths of the way down the list.
+        Returns (rows on the page, queries it ran, the page query's SQL, its plan).
+        """
+        ordering = ('-timestamp', '-pk')
+        rows = Transaction.objects.order_by(*ordering)
+        marker = rows[rows.count() * 9 // 10]
+        paginator = OrderedCursorPagination()
+        paginator.base_url = f'{self.URL}?page_size=50'
+        url = paginator.encode_cursor(
+            Cursor(offset=0, reverse=False, position=paginator._get_position_from_instance(marker, ordering))
+        )
+        with CaptureQueriesContext(connection) as queries:
+            body = self.api.get(url).json()
+        page_sql = next(query['sql'] for query in queries if 'LIMIT' in query['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {page_sql}')
+            plan = '\n'.join(line for line, in cursor.fetchall())
+        return body['results'], len(queries), page_sql, plan
 
-# Create your tests here.
+    def test_deep_pages_cost_the_same_at_ten_times_the_rows(self):
+        costs = []
+        for count in [1000, 10000]:
+            self.seed(count)
+            rows, queries, sql, plan = self.deep_page()
+            self.assertEqual(len(rows), 50)
+            self.assertNotIn('OFFSET', sql)
+            # A bounded walk of the (timestamp, id) index, not a scan and sort of the table.
+            self.assertIn('fin_tx_timestamp_id_idx', plan)
+            self.assertIn('Index Cond: ("timestamp" <=', plan)
+            self.assertNotIn('Seq Scan', plan)
+            costs.append(queries)
+        self.assertEqual(costs[0], costs[1])
@@ -18,7 +18,7 @@ class AccountListView(LoginRequiredMixin, ListView):
     Main dashboard for the finance module.
     Shows a list of all accounts and their balances.
     """
-    model = Account
+    queryset = Account.objects.with_balance()
     template_name = 'finance/account_list.html'
     context_object_name = 'accounts'
 
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0004_project_description_service_department_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['date_from', 'id'], name='project_date_from_id_idx'),
+        ),
+    ]
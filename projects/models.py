@@ -58,6 +58,10 @@ class Project(models.Model):
 
     class Meta:
         ordering = ['-date_from']
+        indexes = [
+            # The API's cursor pages: -date_from, ties broken on id.
+            models.Index(fields=['date_from', 'id'], name='project_date_from_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.company_name} ({self.date_from.strftime('%d-%b-%Y')})"
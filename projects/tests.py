@@ -1,3 +1,66 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
 from django.test import TestCase
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from fikirierp.pagination import OrderedCursorPagination
+from .models import Project
+
+
+class ProjectPaginationTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(User.objects.create_user('producer', password='secret'))
+        # Ten projects over three start dates, so most pages end inside a tie.
+        for n, day in enumerate([3, 1, 2, 3, 1, 3, 2, 1, 3, 2]):
+            Project.objects.create(
+                company_name=f"Client {n}", date_from=date(2026, 5, day), date_to=date(2026, 5, 9),
+                location="Nairobi", contact_person="Producer", charges=1000,
+            )
+        self.expected = list(Project.objects.order_by('-date_from', '-pk').values_list('pk', flat=True))
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            body = self.api.get(url).json()
+            pages.append([project['id'] for project in body['results']])
+            url = body[link]
+        return pages
+
+    def test_pages_through_tied_dates_without_skipping_or_repeating(self):
+        pages = self.walk('/api/v1/projects/?page_size=3', 'next')
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 1])
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_pages_back_through_tied_dates(self):
+        body = self.api.get('/api/v1/projects/?page_size=3').json()
+        while body['next']:
+            body = self.api.get(body['next']).json()
+        last = [project['id'] for project in body['results']]
+
+        pages = self.walk(body['previous'], 'previous')
+        self.assertEqual(sum(reversed(pages), []) + last, self.expected)
+
+    def test_rejects_a_malformed_cursor(self):
+        response = self.api.get('/api/v1/projects/', {'cursor': 'cD1ub3Rqc29u'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_pages_exactly_on_tied_float4_scores(self):
+        # A `real` like pg_trgm's similarity: three scores, each shared by several rows.
+        scored = Project.objects.annotate(
+            score=RawSQL('(1 / (2.6 + "projects_project"."id" %% 3))::real', [], output_field=FloatField())
+        ).order_by('-score', 'company_name')
+        expected = [project.pk for project in sorted(scored, key=lambda p: (-p.score, p.company_name))]
 
-# Create your tests here.
+        seen = []
+        url = '/api/v1/projects/?page_size=2'
+        for _ in range(len(expected)):
+            paginator = OrderedCursorPagination()
+            seen += [project.pk for project in paginator.paginate_queryset(scored, Request(APIRequestFactory().get(url)))]
+            url = paginator.get_next_link()
+            if not url:
+                break
+        self.assertEqual(seen, expected)